@@ -0,0 +1,126 @@
+"""
+	Benchmark of the json loaders : eager (`load_data_from_json` + preprocessing) vs streaming (`load_data_from_json_stream`)
+	vs binary snapshot (`load_data_from_snapshot`, cold i.e. streaming & saving, then warm) vs chunked csv (`load_data_from_csv`).
+	Every loader runs in a fresh process, so the reported peak memory (max RSS) is its own.
+
+	Usage : python benchmarks/bench_data_loading.py --customers 2000000 --loans-per-customer 5 --gzip
+	        (~1.5GB of json for 2M customers & 5 loans each)
+"""
+import os
+import sys
+import gzip
+import time
+import json
+import argparse
+import resource
+import tempfile
+import numpy           as np
+import multiprocessing as mp
+
+sys.path.insert(0, os.getcwd())
+
+from src.markI        import MkI
+from src.config       import Config
+from src.data_loading import DataLoader
+
+
+def write_synthetic_json(fn_path : str, num_customers : int, loans_per_customer : int, compress : bool, seed : int = 0) -> None :
+	"""Same layout as `data/data.json` (strings everywhere), written customer by customer"""
+	rng    = np.random.default_rng(seed)
+	opener = gzip.open if compress else open
+
+	with opener(fn_path, "wt", encoding = "utf-8") as fn :
+		fn.write('{"data": \n[')
+		for customer_id in range(num_customers) :
+			annual_income = str(int(rng.integers(20000, 100000)))
+			loans         = [{
+				"customer_ID"   : str(customer_id),
+				"loan_date"     : "{:02d}/{:02d}/{}".format(int(rng.integers(1, 29)), int(rng.integers(1, 13)), int(rng.integers(2019, 2023))),
+				"amount"        : str(int(rng.integers(100, 3000))),
+				"fee"           : str(int(rng.integers(10, 200))),
+				"loan_status"   : str(int(rng.integers(0, 2))),
+				"term"          : "long" if rng.random() < 0.5 else "short",
+				"annual_income" : annual_income,
+			} for _ in range(loans_per_customer)]
+			fn.write(("," if customer_id else "") + json.dumps({"customer_ID" : str(customer_id), "loans" : loans}, separators = (",", ":")) + "\n")
+		fn.write("]}")
+
+
+def write_synthetic_csv(fn_path : str, num_customers : int, loans_per_customer : int, seed : int = 0) -> None :
+	"""Same rows as `write_synthetic_json`, flat like `data/data.csv`"""
+	rng = np.random.default_rng(seed)
+
+	with open(fn_path, "w") as fn :
+		fn.write("customer_ID,loan_date,amount,fee,loan_status,term,annual_income\n")
+		for customer_id in range(num_customers) :
+			annual_income = int(rng.integers(20000, 100000))
+			for _ in range(loans_per_customer) :
+				loan_date = "{:02d}/{:02d}/{}".format(int(rng.integers(1, 29)), int(rng.integers(1, 13)), int(rng.integers(2019, 2023)))
+				fn.write("{},{},{},{},{},{},{}\n".format(
+					customer_id, loan_date, int(rng.integers(100, 3000)), int(rng.integers(10, 200)),
+					int(rng.integers(0, 2)), "long" if rng.random() < 0.5 else "short", annual_income))
+
+
+def run_loader(loader : str, fn_path : str, queue : mp.Queue) -> None :
+	mk1         = MkI.get_instance(_logging = True)
+	data_loader = DataLoader(mk1, Config().parser)
+	data_loader.data_json_path    = fn_path
+	data_loader.data_snapshot_dir = os.path.join(os.path.dirname(fn_path), "snapshot")
+
+	start = time.perf_counter()
+	if loader == "eager" :
+		customers_df, loans_df = data_loader.split_dataframes(data_loader.load_data_from_json())
+		customers_df           = data_loader.preprocess_customers_dataframe(customers_df)
+		loans_df               = data_loader.postprocess_loans_dataframe(data_loader.preprocess_loans_dataframe(loans_df))
+	elif loader == "streaming" :
+		customers_df, loans_df = data_loader.load_data_from_json_stream()
+	elif loader == "csv" :
+		customers_df, loans_df = data_loader.load_data_from_csv(fn_path)
+	else :
+		customers_df, loans_df = data_loader.load_data_from_snapshot()
+	seconds = time.perf_counter() - start
+
+	queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, len(customers_df), len(loans_df)))
+
+
+def measure(loader : str, fn_path : str) :
+	context = mp.get_context("spawn")
+	queue   = context.Queue()
+	process = context.Process(target = run_loader, args = (loader, fn_path, queue))
+	process.start()
+	result  = queue.get()
+	process.join()
+
+	return result
+
+
+def main() :
+	args = argparse.ArgumentParser()
+	args.add_argument("--customers", type = int, default = 200000)
+	args.add_argument("--loans-per-customer", type = int, default = 5)
+	args.add_argument("--gzip", action = "store_true", help = "also benchmark the streaming loader on a gzip-compressed copy")
+	args = args.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp_dir :
+		fn_path = os.path.join(tmp_dir, "data.json")
+		write_synthetic_json(fn_path, args.customers, args.loans_per_customer, compress = False)
+		print("json : {:.1f}MB".format(os.path.getsize(fn_path) / 2 ** 20))
+
+		runs = [("eager", fn_path, ""), ("streaming", fn_path, ""), ("snapshot", fn_path, "(cold)"), ("snapshot", fn_path, "(warm)")]
+		if args.gzip :
+			gzip_path = fn_path + ".gz"
+			write_synthetic_json(gzip_path, args.customers, args.loans_per_customer, compress = True)
+			runs.append(("streaming", gzip_path, "(gzip)"))
+
+		csv_path = os.path.join(tmp_dir, "data.csv")
+		write_synthetic_csv(csv_path, args.customers, args.loans_per_customer)
+		runs.append(("csv", csv_path, ""))
+
+		for loader, path, label in runs :
+			seconds, max_rss_mb, num_customers, num_loans = measure(loader, path)
+			print("{:<10} {:<9} : {:8.2f}s   peak RSS : {:8.1f}MB   ({} customers, {} loans)".format(
+				loader, label, seconds, max_rss_mb, num_customers, num_loans))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,85 @@
+"""
+	Benchmark of the feature engines : featuretools DFS (`run_dfs`) vs the native groupby engine (`run_native`)
+
+	Usage : python benchmarks/bench_feature_engineering.py --customers 10000 --loans-per-customer 5
+"""
+import os
+import sys
+import time
+import argparse
+import numpy  as np
+import pandas as pd
+
+sys.path.insert(0, os.getcwd())
+
+from src.markI               import MkI
+from src.config              import Config
+from src.feature_engineering import FeatureEngineer
+
+
+def synthetic_frames(num_customers : int, loans_per_customer : int, seed : int = 0) :
+	rng       = np.random.default_rng(seed)
+	num_loans = num_customers * loans_per_customer
+
+	customers_df = pd.DataFrame({
+		"customer_id"   : np.arange(num_customers).astype(str),
+		"annual_income" : rng.integers(20000, 100000, num_customers).astype(float),
+	})
+	loans_df = pd.DataFrame({
+		"loan_id"     : np.arange(num_loans).astype(str),
+		"customer_id" : rng.integers(0, num_customers, num_loans).astype(str),
+		"loan_date"   : pd.Timestamp("2019-01-01") + pd.to_timedelta(rng.integers(0, 1200, num_loans), unit = "D"),
+		"amount"      : rng.integers(100, 3000, num_loans),
+		"fee"         : rng.integers(10, 200, num_loans),
+		"loan_status" : rng.integers(0, 2, num_loans).astype(str),
+		"term"        : rng.choice(["long", "short"], num_loans),
+	})
+
+	return (customers_df, loans_df)
+
+
+def timed(fn, repeat : int) :
+	timings = []
+	for _ in range(repeat) :
+		start = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - start)
+
+	return min(timings)
+
+
+def main() :
+	args = argparse.ArgumentParser()
+	args.add_argument("--customers", type = int, default = 10000)
+	args.add_argument("--loans-per-customer", type = int, default = 5)
+	args.add_argument("--repeat", type = int, default = 3)
+	args = args.parse_args()
+
+	mk1    = MkI.get_instance(_logging = True)
+	config = Config().parser
+
+	customers_df, loans_df = synthetic_frames(args.customers, args.loans_per_customer)
+	feature_engineer       = FeatureEngineer(mk1, config)
+	loans_df               = feature_engineer.extract_features_loans(loans_df)
+	customers_df           = feature_engineer.extract_features_customers(customers_df)
+
+	def build(engine : str, target_name : str) :
+		feature_engineer        = FeatureEngineer(mk1, config)
+		feature_engineer.engine = engine
+		feature_engineer.add_dataframe("customers", customers_df.copy(), "customer_id")
+		feature_engineer.add_dataframe("loans", loans_df.copy(), "loan_id")
+		feature_engineer.add_relationship("customers", "customer_id", "loans", "customer_id")
+		return feature_engineer.build_feature_matrix(target_name)[0]
+
+	print("customers = {}, loans = {}".format(len(customers_df), len(loans_df)))
+	for target_name in ["customers", "loans"] :
+		pd.testing.assert_frame_equal(build("native", target_name), build("featuretools", target_name))
+
+		dfs_seconds    = timed(lambda : build("featuretools", target_name), args.repeat)
+		native_seconds = timed(lambda : build("native", target_name), args.repeat)
+		print("{:<10} featuretools : {:8.3f}s   native : {:8.3f}s   speedup : {:6.1f}x".format(
+			target_name, dfs_seconds, native_seconds, dfs_seconds / native_seconds))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+"""
+	Benchmark of the JSON encoding of a feature matrix : the former path (`df.to_json(orient = "records", indent = 2)`,
+	returned as a `str` & encoded once more by FastAPI's `JSONResponse`) vs `dataframe_to_json` (orjson, compact
+	UTF-8 bytes returned as is), & the cost of compressing it once (`Compressor`, then cached with the matrix).
+	Reports the encode time & the payload size.
+
+	Usage : python benchmarks/bench_json.py --rows 200000 --columns 40
+"""
+import os
+import sys
+import time
+import argparse
+import numpy  as np
+import pandas as pd
+
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.getcwd())
+
+from src.markI       import MkI
+from src.config      import Config
+from src.compression import Compressor
+from src.responses   import dataframe_to_json
+
+
+def synthetic_features(num_rows : int, num_columns : int, seed : int = 0) -> pd.DataFrame :
+	"""Float features (with missing values), counts, a categorical & a datetime column, indexed by `customer_id`"""
+	rng = np.random.default_rng(seed)
+	df  = pd.DataFrame({"customer_id" : np.arange(num_rows)})
+
+	for i in range(num_columns) :
+		values = rng.normal(1000, 300, num_rows)
+		values[rng.random(num_rows) < 0.05] = np.nan
+		df["feature_{}".format(i)] = values
+	df["COUNT(loans)"]     = rng.integers(0, 20, num_rows)
+	df["MODE(loans.term)"] = pd.Categorical(rng.choice(["long", "short"], num_rows))
+	df["last_loan_date"]   = pd.Timestamp("2019-01-01") + pd.to_timedelta(rng.integers(0, 1500, num_rows), unit = "D")
+
+	return df.set_index("customer_id")
+
+
+def measure(encode, repeat : int) :
+	seconds = []
+	for _ in range(repeat) :
+		start   = time.perf_counter()
+		payload = encode()
+		seconds.append(time.perf_counter() - start)
+
+	return (min(seconds), len(payload))
+
+
+def main() :
+	args = argparse.ArgumentParser()
+	args.add_argument("--rows", type = int, default = 200000)
+	args.add_argument("--columns", type = int, default = 40)
+	args.add_argument("--repeat", type = int, default = 3)
+	args = args.parse_args()
+
+	df         = synthetic_features(args.rows, args.columns)
+	compressor = Compressor(MkI.get_instance(_logging = True, _dataset = True), Config().parser)
+	body       = dataframe_to_json(df)
+
+	encoders = {
+		"to_json + JSONResponse" : lambda : JSONResponse(df.to_json(orient = "records", indent = 2)).body,
+		"orjson bytes"           : lambda : dataframe_to_json(df),
+		**{"+ {} (once)".format(encoding) : (lambda encoding = encoding : compressor.compress(body, encoding)) for encoding in compressor.available},
+	}
+
+	for name, encode in encoders.items() :
+		seconds, num_bytes = measure(encode, args.repeat)
+		print("{:<24} : {:7.2f}s   {:9.1f}MB   ({} rows x {} columns)".format(name, seconds, num_bytes / 2 ** 20, *df.shape))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,73 @@
+"""
+	Benchmark of the per-request latency of the lookups behind `fetch_customer` / `fetch_loan` : SQL built with
+	f-strings (`db_query`, parsed again for every new id) vs named, parameterized statements (`db_execute`, built
+	once & reused). The lookups run on an indexed table of synthetic loans, created in the local db & dropped afterwards.
+
+	Usage : python benchmarks/bench_statements.py --rows 200000 --requests 20000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+
+from src.markI import MkI
+
+
+TABLE_NAME = "bench_statements_loans"
+
+
+def populate(mk1 : MkI, num_rows : int) -> None :
+	rng = np.random.default_rng(0)
+	mk1.dataset.db_delete_table(table_name = TABLE_NAME)
+	mk1.dataset.indexes[TABLE_NAME] = [("loan_id",)]
+	mk1.dataset.db_bulk_insert(table_name = TABLE_NAME, rows = ({
+		"loan_id"     : loan_id,
+		"customer_id" : str(int(rng.integers(0, num_rows // 5))),
+		"amount"      : float(rng.integers(100, 3000)),
+		"term"        : "long" if rng.random() < 0.5 else "short",
+	} for loan_id in range(num_rows)))
+
+
+def measure(lookup, ids) :
+	latencies = np.empty(len(ids))
+	for i, loan_id in enumerate(ids) :
+		start        = time.perf_counter()
+		df           = lookup(int(loan_id))
+		latencies[i] = time.perf_counter() - start
+		assert len(df) == 1
+
+	return latencies * 1e6
+
+
+def main() :
+	args = argparse.ArgumentParser()
+	args.add_argument("--rows", type = int, default = 200000)
+	args.add_argument("--requests", type = int, default = 20000)
+	args = args.parse_args()
+
+	mk1 = MkI.get_instance(_logging = True, _dataset = True)
+	populate(mk1, args.rows)
+	mk1.dataset.db_prepare(name = "bench_fetch_loan", query_str = f"SELECT * FROM {TABLE_NAME} WHERE loan_id = :loan_id")
+
+	lookups = {
+		"f-string"  : lambda loan_id : mk1.dataset.db_query(query_str = f"SELECT * FROM {TABLE_NAME} WHERE loan_id == {loan_id}", read_only = True),
+		"statement" : lambda loan_id : mk1.dataset.db_execute(name = "bench_fetch_loan", params = {"loan_id" : loan_id}, read_only = True),
+	}
+
+	try :
+		ids = np.random.default_rng(1).integers(0, args.rows, args.requests)
+		for name, lookup in lookups.items() :
+			measure(lookup, ids[:1000])    # warm-up (connections, page cache)
+			latencies = measure(lookup, ids)
+			print("{:<10} : mean {:7.1f}µs   p50 {:7.1f}µs   p99 {:7.1f}µs   ({} requests)".format(
+				name, latencies.mean(), np.percentile(latencies, 50), np.percentile(latencies, 99), len(latencies)))
+
+	finally :
+		mk1.dataset.db_delete_table(table_name = TABLE_NAME)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,792 @@
+import math
+import threading
+import numpy    as np
+import pandas   as pd
+import datetime as dt
+from collections        import defaultdict
+from typing             import Any, Dict, Iterable, List, Optional, Tuple
+from pandas.tseries.api import guess_datetime_format
+
+
+# Project modules
+from src.markI               import MkI
+from src.config              import Config
+from src.models              import Ontology
+from src.statements          import Statements
+from src.feature_engineering import FeatureEngineer
+from src.feature_pipeline    import FeaturePipeline
+from src.executors           import Executors
+
+
+
+#*-*-*-*-*-*-*-*-*-*-*-*#
+#     Running State     #
+#*-*-*-*-*-*-*-*-*-*-*-*#
+
+class RunningMoments(object) :
+	"""
+		Count, sum, sum of squares & sum of cubes of a column (shifted by its first value, so that the central
+		moments do not cancel out), with its min & max. Values are added & removed in O(1) : removing the min
+		or the max only marks them stale, until they are repaired from the remaining values.
+	"""
+	def __init__(self, shift : float):
+		self.shift = shift if math.isfinite(shift) else 0.0
+		self.n     = 0
+		self.s1    = 0.0
+		self.s2    = 0.0
+		self.s3    = 0.0
+		self.min   = math.nan
+		self.max   = math.nan
+		self.stale = False
+
+
+	def add(self, value : float) -> None :
+		if math.isnan(value) :
+			return
+
+		d        = value - self.shift
+		self.n  += 1
+		self.s1 += d
+		self.s2 += d * d
+		self.s3 += d * d * d
+
+		if not self.stale :
+			self.min = value if math.isnan(self.min) else min(self.min, value)
+			self.max = value if math.isnan(self.max) else max(self.max, value)
+
+
+	def remove(self, value : float) -> None :
+		if math.isnan(value) or self.n == 0 :
+			return
+
+		d        = value - self.shift
+		self.n  -= 1
+		self.s1 -= d
+		self.s2 -= d * d
+		self.s3 -= d * d * d
+
+		if self.n == 0 :
+			self.s1, self.s2, self.s3 = 0.0, 0.0, 0.0
+			self.min, self.max        = math.nan, math.nan
+			self.stale                = False
+
+		elif value <= self.min or value >= self.max :
+			self.stale = True
+
+
+	def repair(self, values : Iterable[float]) -> None :
+		"""Min & max of the remaining values"""
+		values     = [value for value in values if not math.isnan(value)]
+		self.min   = min(values) if values else math.nan
+		self.max   = max(values) if values else math.nan
+		self.stale = False
+
+
+	def statistics(self) -> Dict[str, float] :
+		return {name : float(value) for name, value in power_sums_statistics(self.n, self.shift, self.s1, self.s2, self.s3).items()}
+
+
+	def sum(self) -> float :
+		return self.statistics()["SUM"]
+
+
+	def mean(self) -> float :
+		return self.statistics()["MEAN"]
+
+
+	def std(self) -> float :
+		"""Sample standard deviation (ddof = 1)"""
+		return self.statistics()["STD"]
+
+
+	def skew(self) -> float :
+		"""Bias-corrected skewness (as `Series.skew`), 0 for constant values"""
+		return self.statistics()["SKEW"]
+
+
+
+def power_sums_statistics(n : Any, shift : Any, s1 : Any, s2 : Any, s3 : Any) -> Dict[str, np.ndarray] :
+	"""
+		SUM, MEAN, STD (ddof = 1) & SKEW (bias-corrected, as `Series.skew`) from the count & the power sums of the
+		values shifted by `shift` (scalars, or arrays of customers). The floating point noise of the central moments
+		of constant values is zeroed, like pandas does
+	"""
+	n, shift, s1, s2, s3 = [np.asarray(values, dtype = "float64") for values in (n, shift, s1, s2, s3)]
+
+	with np.errstate(divide = "ignore", invalid = "ignore") :
+		m2    = s2 - s1 * s1 / n
+		m3    = s3 - 3 * s1 * s2 / n + 2 * s1 ** 3 / n ** 2
+		noise = 1e-14 * np.maximum(1.0, np.abs(s2))
+		m2    = np.where(m2 > noise, m2, 0.0)
+		m3    = np.where(np.abs(m3) > noise * np.maximum(1.0, np.sqrt(np.abs(s2))), m3, 0.0)
+		skew  = np.where(m2 == 0, 0.0, n * np.sqrt(n - 1) / (n - 2) * m3 / m2 ** 1.5)
+
+		return {
+			"SUM"  : np.where(n > 0, s1 + n * shift, 0.0),
+			"MEAN" : np.where(n > 0, shift + s1 / n, np.nan),
+			"STD"  : np.where(n >= 2, np.sqrt(m2 / (n - 1)), np.nan),
+			"SKEW" : np.where(n >= 3, skew, np.nan),
+		}
+
+
+
+class CustomerAggregates(object) :
+	"""Running state of the loans of one customer : count, moments of the numeric columns & value counts of the categorical ones"""
+	def __init__(self):
+		self.count   = 0
+		self.moments = {}
+		self.counts  = {}
+
+
+	def add(self, numeric : Dict[str, float], categorical : Dict[str, Any]) -> None :
+		self.count += 1
+		for col, value in numeric.items() :
+			if col not in self.moments :
+				self.moments[col] = RunningMoments(shift = value)
+			self.moments[col].add(value)
+
+		for name, value in categorical.items() :
+			if value is not None :
+				counts        = self.counts.setdefault(name, {})
+				counts[value] = counts.get(value, 0) + 1
+
+
+	def remove(self, numeric : Dict[str, float], categorical : Dict[str, Any]) -> None :
+		self.count -= 1
+		for col, value in numeric.items() :
+			if col in self.moments :
+				self.moments[col].remove(value)
+
+		for name, value in categorical.items() :
+			counts = self.counts.get(name, {})
+			if value in counts :
+				counts[value] -= 1
+				if counts[value] == 0 :
+					del counts[value]
+
+
+	def stale_columns(self) -> List[str] :
+		return [col for col, moments in self.moments.items() if moments.stale]
+
+
+	def mode_num_unique(self, name : str) -> Tuple[Any, Optional[int]] :
+		"""Most frequent value (the smallest one on ties) & number of distinct values of a categorical column"""
+		counts = self.counts.get(name)
+		if not counts :
+			return (None, None)
+
+		most = max(counts.values())
+		return (min(value for value, count in counts.items() if count == most), len(counts))
+
+
+
+#*-*-*-*-*-*-*-*-*-*-*-*#
+#     Aggregate Store   #
+#*-*-*-*-*-*-*-*-*-*-*-*#
+
+class AggregateStore(object) :
+	"""
+		Materialized customers feature matrix : the per-customer aggregates of the loans (depth 1 & 2 features
+		of the DFS) are kept as running state, updated in O(1) on every row written through the `DataSet`
+		(write hooks), instead of a DFS over all the loans after every write. The store mirrors the local db :
+		it is rebuilt from it on first use & after any write it cannot apply row by row (bulk inserts, updates,
+		truncations), and it is not used while the local db is empty (the pipeline reads the data file then).
+	"""
+	# relationship of `FeaturePipeline.run_dfs`
+	parent_name, parent_pk           = "customers", "customer_id"
+	child_name, child_pk, child_fk   = "loans", "loan_id", "customer_id"
+	date_column                      = "loan_date"
+
+	# days since the loan date change every day : the ordinal of the date is aggregated instead
+	days_column = "days"
+
+	# rebuild attempts when writes keep racing with the rebuild
+	max_rebuilds = 3
+
+	# up to this many customers (entity lookups), their state is read row by row instead of reindexing every column
+	max_lookup_rows = 64
+
+	# tolerance of the consistency check
+	rtol = 1e-7
+	atol = 1e-9
+
+
+	def __init__(self, mk1 : MkI, config : Config, executors : Optional[Executors] = None, hooked : bool = True):
+		"""
+			:param: `executors` - optional shared pools : the full rebuilds & the consistency checks (CPU-bound) run in
+			its process pool, instead of the calling thread
+			:param: `hooked` - whether the store follows the writes of the process (write hook), False for the loads of the workers
+		"""
+		# system design
+		self.mk1       = mk1
+		self.config    = config
+		self.executors = executors
+
+		self.enabled          = str(config.get("aggregates","aggregates_enabled")).lower() == "true"
+		self.feature_engineer = FeatureEngineer(mk1, config)
+		self.statements       = Statements(mk1, config)
+
+		# store : own columns of the customers (in table order) & running state of their loans, as the columns of
+		# the last rebuild (see `load`) & the objects of the customers written since (see `materialize`)
+		self.customers           = {}
+		self.base                = None
+		self.aggregates          = {}
+		self.own_columns         = {}
+		self.numeric_columns     = {}
+		self.categorical_columns = {}
+		self.date_format         = None
+		self.income_range        = None
+		self.stale_customers     = set()
+
+		# file version of the local db the store is up to date with : writes of other processes (other API
+		# workers, the process pool) never reach the write hooks, but change it
+		self.file_version = None
+
+		self.stale      = True
+		self.generation = 0
+		self.lock       = threading.RLock()
+
+		# counters
+		self.rebuilds = 0
+		self.updates  = 0
+		self.repairs  = 0
+
+		if self.enabled and hooked :
+			self.mk1.dataset.db_add_write_hook(self.on_write)
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#         Rows          #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def to_float(self, value : Any) -> float :
+		try :
+			return float(value) if value is not None else math.nan
+		except (TypeError, ValueError) :
+			return math.nan
+
+
+	def parse_date(self, value : Any) -> Optional[pd.Timestamp] :
+		"""Like `pd.to_datetime(column, dayfirst = True)` : the format is inferred from the first date of the table"""
+		if value is None :
+			return None
+
+		if isinstance(value, str) :
+			if self.date_format is None :
+				self.date_format = guess_datetime_format(value, dayfirst = True)
+			return dt.datetime.strptime(value, self.date_format) if self.date_format else pd.to_datetime(value, dayfirst = True)
+
+		return pd.Timestamp(value)
+
+
+	def typed_loan(self, row : Dict[str, Any]) -> Tuple[int, Dict[str, float], Dict[str, Any]] :
+		"""
+			Customer id, numeric & categorical values of a loan row, typed like the Feature Pipeline types the
+			loans dataframe (with the columns of `FeatureEngineer.extract_features_loans`)
+		"""
+		date    = self.parse_date(row.get(self.date_column))
+		numeric = {
+			col : self.to_float(value) for col, value in row.items()
+			if col not in (self.child_pk, self.child_fk, self.date_column) and col not in self.feature_engineer.categorical_columns
+		}
+
+		amount, fee = numeric.get("amount", math.nan), numeric.get("fee", math.nan)
+		with np.errstate(divide = "ignore", invalid = "ignore") :
+			numeric["fee_pct"] = float(np.float64(fee) / np.float64(amount))
+		numeric["total_amount"]   = amount + fee
+		numeric[self.days_column] = float(date.toordinal()) if date is not None else math.nan
+
+		categorical = {col : row.get(col) for col in self.feature_engineer.categorical_columns}
+		for trans_name, (accessor, _) in self.feature_engineer.native_trans_primitives.items() :
+			value = getattr(date, accessor) if date is not None else None
+			categorical["{}({})".format(trans_name, self.date_column)] = value() if callable(value) else value
+
+		return (int(float(row[self.child_fk])), numeric, categorical)
+
+
+	def apply(self, table_name : str, operation : str, row : Dict[str, Any]) -> None :
+		"""Applies one inserted / deleted row to the running state"""
+		if table_name == self.parent_name :
+			customer_id       = int(float(row[self.parent_pk]))
+			self.income_range = None
+			if operation == "insert" :
+				self.own_columns.update(dict.fromkeys(row))
+				self.customers[customer_id] = row
+			else :
+				self.customers.pop(customer_id, None)
+			return
+
+		customer_id, numeric, categorical = self.typed_loan(row)
+		if operation == "insert" :
+			self.numeric_columns.update(dict.fromkeys(numeric))
+			self.categorical_columns.update(dict.fromkeys(categorical))
+			self.materialize(customer_id).add(numeric, categorical)
+		elif customer_id in self.aggregates or (self.base is not None and customer_id in self.base["count"].index) :
+			self.materialize(customer_id).remove(numeric, categorical)
+			self.stale_customers.add(customer_id)
+
+
+	def on_write(self, table_name : str, operation : str, rows : Optional[List[Dict[str, Any]]]) -> None :
+		"""`DataSet` write hook : inserted & deleted rows are applied in O(1) each, any other write marks the store stale"""
+		if table_name not in (self.parent_name, self.child_name) :
+			return
+
+		with self.lock :
+			self.generation += 1
+
+			if operation == "reset" :
+				self.stale = True
+				return
+
+			if not self.stale :
+				try :
+					for row in rows or [] :
+						self.apply(table_name, operation, row)
+					self.updates += len(rows or [])
+
+					# the write is committed : the store is up to date with the file (up to a write of another
+					# process in between, which only delays its detection to the next one)
+					self.file_version = self.mk1.dataset.file_version()
+				except Exception as error :
+					# the running state may be partially updated : rebuilt on the next read
+					self.stale = True
+					self.mk1.logging.logger.error("(AggregateStore.on_write) Applying the {} of {} rows failed, the store is stale : {}".format(operation, table_name, error))
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#   Rebuild & Repair    #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def sync(self) -> None :
+		"""Marks the store stale if the local db file changed since the store was last up to date (writes of other processes)"""
+		with self.lock :
+			if not self.stale and self.file_version != self.mk1.dataset.file_version() :
+				self.stale = True
+
+				#logger
+				self.mk1.logging.logger.info("(AggregateStore.sync) The local db was written by another process, the store is stale")
+
+
+	def read_rows(self, table_name : str, name : str) -> pd.DataFrame :
+		"""All the rows of a table (statement `name`), with its columns even if it is empty"""
+		if table_name not in self.mk1.dataset.get_tables() :
+			return pd.DataFrame()
+
+		return self.mk1.dataset.db_fetch_df(name = name)
+
+
+	def typed_loans(self, loans_df : pd.DataFrame, date_format : Optional[str]) -> Tuple[pd.Series, pd.DataFrame, pd.DataFrame] :
+		"""`typed_loan` of every loan at once : customer ids, numeric & categorical columns"""
+		dates = pd.to_datetime(loans_df[self.date_column], format = date_format, errors = "coerce") if date_format else \
+				pd.to_datetime(loans_df[self.date_column], dayfirst = True, errors = "coerce")
+
+		skipped = [self.child_pk, self.child_fk, self.date_column, *self.feature_engineer.categorical_columns]
+		numeric = loans_df.drop(columns = [col for col in skipped if col in loans_df.columns])
+		numeric = numeric.apply(pd.to_numeric, errors = "coerce").astype("float64")
+
+		amount, fee = [numeric[col] if col in numeric.columns else pd.Series(np.nan, index = numeric.index) for col in ["amount", "fee"]]
+		numeric["fee_pct"]        = fee / amount
+		numeric["total_amount"]   = amount + fee
+		numeric[self.days_column] = (dates - pd.Timestamp("1970-01-01")).dt.days + dt.date(1970, 1, 1).toordinal()
+
+		categorical = loans_df[[col for col in self.feature_engineer.categorical_columns if col in loans_df.columns]].copy()
+		for trans_name, (accessor, _) in self.feature_engineer.native_trans_primitives.items() :
+			categorical["{}({})".format(trans_name, self.date_column)] = getattr(dates.dt, accessor).astype("Int64")
+
+		customer_ids = pd.to_numeric(loans_df[self.child_fk]).astype("int64")
+		return (customer_ids, numeric, categorical)
+
+
+	def grouped_state(self, customer_ids : pd.Series, numeric : pd.DataFrame, categorical : pd.DataFrame) -> Dict[str, Any] :
+		"""
+			Running state of every customer as columns indexed by customer, from one groupby per statistic : count,
+			power sums shifted by the first value of each customer, min & max (columns `(statistic, column)`) & value
+			counts, with the mode (the smallest value on ties) & the number of distinct values of each categorical column
+		"""
+		keys       = customer_ids.values
+		shifts     = numeric.groupby(keys).first().fillna(0.0)
+		deviations = numeric - shifts.reindex(keys).values
+		moments    = pd.concat({
+			"shift" : shifts,
+			"n"     : deviations.groupby(keys).count().astype("float64"),
+			"s1"    : deviations.groupby(keys).sum(),
+			"s2"    : (deviations ** 2).groupby(keys).sum(),
+			"s3"    : (deviations ** 3).groupby(keys).sum(),
+			"min"   : numeric.groupby(keys).min(),
+			"max"   : numeric.groupby(keys).max(),
+		}, axis = 1)
+
+		counts, modes = {}, {}
+		for name in categorical.columns :
+			value_counts = pd.DataFrame({"customer_id" : keys, "value" : categorical[name].values}).dropna().value_counts().sort_index()
+			ranked       = value_counts.rename("count").reset_index().sort_values(["customer_id", "count", "value"], ascending = [True, False, True])
+			counts[name] = value_counts
+			modes[name]  = (
+				ranked.drop_duplicates("customer_id").set_index("customer_id")["value"],
+				ranked.groupby("customer_id").size(),
+			)
+
+		return {"count" : customer_ids.value_counts(), "moments" : moments, "counts" : counts, "modes" : modes}
+
+
+	def load(self) -> Dict[str, Any] :
+		"""
+			Running state of the whole local db, vectorized over the loans (like the native engine), without
+			touching the store : run by the process pool workers, then installed by `rebuild`
+		"""
+		file_version = self.mk1.dataset.file_version()
+		customers_df = self.read_rows(self.parent_name, "fetch_customers")
+		loans_df     = self.read_rows(self.child_name, "fetch_loans")
+
+		customers = {}
+		if self.parent_pk in customers_df.columns :
+			customer_ids = pd.to_numeric(customers_df[self.parent_pk]).astype("int64").tolist()
+			customers    = dict(zip(customer_ids, customers_df.to_dict("records")))
+
+		# the loans columns are known once the loans table exists, even without rows
+		base, numeric_columns, categorical_columns, date_format = None, {}, {}, None
+		if self.child_fk in loans_df.columns :
+			dates       = loans_df[self.date_column].dropna()
+			date_format = guess_datetime_format(dates.iloc[0], dayfirst = True) if len(dates) and isinstance(dates.iloc[0], str) else None
+
+			customer_ids, numeric, categorical = self.typed_loans(loans_df, date_format)
+			base                = self.grouped_state(customer_ids, numeric, categorical)
+			numeric_columns     = dict.fromkeys(numeric.columns)
+			categorical_columns = dict.fromkeys(categorical.columns)
+
+		return {
+			"customers"           : customers,
+			"own_columns"         : dict.fromkeys(customers_df.columns),
+			"base"                : base,
+			"numeric_columns"     : numeric_columns,
+			"categorical_columns" : categorical_columns,
+			"date_format"         : date_format,
+			"file_version"        : file_version,
+		}
+
+
+	def rebuild(self) -> bool :
+		"""
+			Full rebuild from the local db (`load`, in the process pool if any). Discarded (the store stays stale)
+			if a write happened meanwhile, as its rows may or may not have been read
+		"""
+		with self.lock :
+			generation = self.generation
+
+		state = self.executors.process_pool.submit(load_aggregates).result() if self.executors is not None else self.load()
+
+		with self.lock :
+			if self.generation != generation :
+				return False
+
+			self.customers, self.base, self.aggregates = state["customers"], state["base"], {}
+			self.own_columns, self.numeric_columns     = state["own_columns"], state["numeric_columns"]
+			self.categorical_columns, self.date_format = state["categorical_columns"], state["date_format"]
+			self.stale_customers = set()
+			self.income_range    = None
+			self.file_version    = state["file_version"]
+			self.stale           = False
+			self.rebuilds       += 1
+
+		#logger
+		self.mk1.logging.logger.info("(AggregateStore.rebuild) Aggregates of {} customers were rebuilt from the local db ✅".format(len(self.customers)))
+		return True
+
+
+	def materialize(self, customer_id : int) -> CustomerAggregates :
+		"""Running state of a customer as an object, updated in O(1) by the writes : created from the columns of the last rebuild on first write"""
+		aggregates = self.aggregates.get(customer_id)
+		if aggregates is None :
+			aggregates = self.aggregates[customer_id] = self.base_aggregates(customer_id)
+		return aggregates
+
+
+	def base_aggregates(self, customer_id : int) -> CustomerAggregates :
+		"""Running state of a customer in the columns of the last rebuild, as a new object (lock must be held)"""
+		aggregates = CustomerAggregates()
+		if self.base is None or customer_id not in self.base["count"].index :
+			return aggregates
+
+		aggregates.count = int(self.base["count"][customer_id])
+
+		moments = self.base["moments"]
+		state   = dict(zip(moments.columns, moments.loc[customer_id].tolist()))
+		for col in moments["n"].columns :
+			running                            = RunningMoments(shift = float(state[("shift", col)]))
+			running.n                          = int(state[("n", col)])
+			running.s1, running.s2, running.s3 = float(state[("s1", col)]), float(state[("s2", col)]), float(state[("s3", col)])
+			running.min, running.max           = float(state[("min", col)]), float(state[("max", col)])
+			aggregates.moments[col]            = running
+
+		for name, value_counts in self.base["counts"].items() :
+			if customer_id in value_counts.index.levels[0] :
+				counts                  = value_counts.loc[customer_id]
+				aggregates.counts[name] = dict(zip(counts.index.tolist(), counts.tolist()))
+
+		return aggregates
+
+
+	def repair(self) -> None :
+		"""Min & max of the columns whose extreme value was deleted, from the remaining loans of these customers only"""
+		stale = {customer_id : self.aggregates[customer_id].stale_columns() for customer_id in self.stale_customers if customer_id in self.aggregates}
+		stale = {customer_id : columns for customer_id, columns in stale.items() if columns}
+		self.stale_customers = set()
+		if not stale :
+			return
+
+		values = defaultdict(lambda : defaultdict(list))
+		for batch in self.mk1.dataset.db_iterate(name = "entity_loans", params = {"customer_ids" : list(stale)}) :
+			for row in batch :
+				customer_id, numeric, _ = self.typed_loan(row)
+				for col in stale.get(customer_id, []) :
+					values[customer_id][col].append(numeric.get(col, math.nan))
+
+		for customer_id, columns in stale.items() :
+			for col in columns :
+				self.aggregates[customer_id].moments[col].repair(values[customer_id][col])
+			self.repairs += 1
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#     Feature Matrix    #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def base_values(self, values : Optional[pd.Series], customer_ids : pd.Index, default : Any) -> np.ndarray :
+		"""Values of the last rebuild for the customers, `default` for the customers without loans then (writable copy)"""
+		dtype = object if default is None else "float64"
+		if values is None :
+			return np.full(len(customer_ids), default, dtype = dtype)
+
+		return values.reindex(customer_ids).to_numpy(dtype = dtype, na_value = default)
+
+
+	def aggregate_features(self, customer_ids : List[int], today : int) -> Dict[str, Any] :
+		"""
+			Depth 1 & 2 features of the customers, computed over the columns of the last rebuild, with the customers
+			written since taken from their objects (lock must be held). A few customers are all taken from objects,
+			the others built from the columns for this call. `days` comes from the ordinal of the loan dates :
+			days = today - ordinal
+		"""
+		empty_base = {"count" : None, "moments" : {}, "counts" : {}, "modes" : {}}
+		index      = pd.Index(customer_ids)
+		if len(customer_ids) <= self.max_lookup_rows :
+			base    = empty_base
+			written = [(position, self.aggregates.get(customer_id) or self.base_aggregates(customer_id)) for position, customer_id in enumerate(customer_ids)]
+		else :
+			base    = self.base or empty_base
+			written = [(position, self.aggregates[customer_id]) for position, customer_id in enumerate(customer_ids) if customer_id in self.aggregates]
+
+		counts = self.base_values(base["count"], index, 0.0)
+		for position, aggregates in written :
+			counts[position] = aggregates.count
+		features = {"COUNT({})".format(self.child_name) : counts}
+
+		empty = RunningMoments(shift = 0.0)
+		for col in self.numeric_columns :
+			state = {
+				name : self.base_values(base["moments"].get((name, col)), index, default)
+				for name, default in [("n", 0.0), ("shift", 0.0), ("s1", 0.0), ("s2", 0.0), ("s3", 0.0), ("min", np.nan), ("max", np.nan)]
+			}
+			for position, aggregates in written :
+				moments = aggregates.moments.get(col, empty)
+				for name, values in state.items() :
+					values[position] = getattr(moments, name)
+
+			values = {
+				"MAX" : state["max"],
+				"MIN" : state["min"],
+				**power_sums_statistics(state["n"], state["shift"], state["s1"], state["s2"], state["s3"]),
+			}
+			if col == self.days_column :
+				values.update({
+					"MAX"  : today - state["min"],
+					"MEAN" : today - values["MEAN"],
+					"MIN"  : today - state["max"],
+					"SKEW" : -values["SKEW"],
+					"SUM"  : state["n"] * today - values["SUM"],
+				})
+			for primitive, value in values.items() :
+				features["{}({}.{})".format(primitive, self.child_name, col)] = value
+
+		for name in self.categorical_columns :
+			mode, num_unique = base["modes"].get(name, (None, None))
+			modes, num_uniques = self.base_values(mode, index, None), self.base_values(num_unique, index, None)
+			for position, aggregates in written :
+				modes[position], num_uniques[position] = aggregates.mode_num_unique(name)
+
+			features["MODE({}.{})".format(self.child_name, name)]       = modes
+			features["NUM_UNIQUE({}.{})".format(self.child_name, name)] = num_uniques
+
+		return features
+
+
+	def feature_matrix(self) -> Optional[pd.DataFrame] :
+		"""
+			The customers feature matrix (same columns as the DFS output), None while the store is disabled, the
+			local db has no customers, or the store could not be rebuilt
+		"""
+		return self.customers_features()
+
+
+	def entity_features(self, customer_ids : List[int]) -> Optional[pd.DataFrame] :
+		"""
+			Rows of the customers feature matrix of the requested customers only (in the requested order, unknown ids
+			are skipped), like `FeaturePipeline.run_entities` : O(1) per customer, instead of a DFS over their loans
+		"""
+		return self.customers_features(customer_ids)
+
+
+	def get_income_range(self) -> Tuple[float, float] :
+		"""(min, max) of `annual_income` over all the customers (the bins of a subset of them), until a customer is written (lock must be held)"""
+		if self.income_range is None :
+			incomes           = pd.to_numeric(pd.Series([row.get("annual_income") for row in self.customers.values()], dtype = object), errors = "coerce")
+			self.income_range = (float(incomes.min()), float(incomes.max()))
+
+		return self.income_range
+
+
+	def typed_feature(self, name : str, values : np.ndarray) -> Any :
+		"""Values of an aggregate feature with its dtype in the DFS output, as an array (no per-column Series)"""
+		if name.startswith("COUNT(") or name.startswith("NUM_UNIQUE(") :
+			return pd.array(values, dtype = "Int64")
+		if name.startswith("MODE(") :
+			trans_name = name[len("MODE({}.".format(self.child_name)) :].split("(")[0]
+			if trans_name in self.feature_engineer.native_trans_primitives :
+				_, categories = self.feature_engineer.native_trans_primitives[trans_name]
+				return pd.Categorical(values, dtype = pd.CategoricalDtype(pd.Index(categories, dtype = "int64"), ordered = True))
+			return pd.Categorical(values)
+		return np.asarray(values, dtype = "float64")
+
+
+	def customers_features(self, customer_ids : Optional[List[int]] = None) -> Optional[pd.DataFrame] :
+		"""Feature matrix of some customers (all of them by default), see `feature_matrix`"""
+		if not self.enabled :
+			return None
+
+		self.sync()
+		for _ in range(self.max_rebuilds) :
+			if not self.stale or self.rebuild() :
+				break
+
+		with self.lock :
+			if self.stale or not self.customers :
+				return None
+
+			self.repair()
+			income_range = self.get_income_range() if customer_ids is not None else None
+			customer_ids = list(self.customers) if customer_ids is None else [customer_id for customer_id in dict.fromkeys(customer_ids) if customer_id in self.customers]
+			own_df       = pd.DataFrame([self.customers[customer_id] for customer_id in customer_ids], columns = list(self.own_columns))
+			features     = self.aggregate_features(customer_ids, dt.date.today().toordinal())
+
+		if not customer_ids :
+			return pd.DataFrame()
+
+		# Own columns, typed like the pipeline does (with the `annual_income` bins)
+		own_df = self.feature_engineer.extract_features_customers(own_df, income_range = income_range)
+		own_df = self.feature_engineer.native_typed_dataframe(own_df, self.parent_pk)
+
+		# Aggregates, in the column order & with the dtypes of the DFS output
+		depth_2     = sorted(name for name in features if any(".{}(".format(trans_name) in name for trans_name in self.feature_engineer.native_trans_primitives))
+		depth_1     = sorted(name for name in features if name not in depth_2)
+		features_df = pd.DataFrame({name : self.typed_feature(name, features[name]) for name in depth_1 + depth_2}, index = own_df.index)
+
+		return pd.concat([own_df, features_df], axis = 1)
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#      Consistency      #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def reference_features(self) -> pd.DataFrame :
+		"""Customers feature matrix of the Feature Pipeline (configured engine, not stored), to compare the store with"""
+		pipeline = FeaturePipeline(self.mk1, self.config)
+
+		customers_df, loans_df = pipeline.preprocess_data(*pipeline.load_data())
+		customers_df, loans_df = pipeline.extract_features(customers_df, loans_df)
+		return pipeline.run_dfs(Ontology.customers, customers_df, loans_df)
+
+
+	def check(self) -> Dict[str, Any] :
+		"""
+			Compares the store with a full rebuild of the customers features (Feature Pipeline over the same data,
+			configured engine, in the process pool if any). Writes during the check can show up as mismatches :
+			`data_version_changed` tells
+		"""
+		version     = self.mk1.dataset.data_version()
+		expected_df = self.executors.process_pool.submit(reference_features).result() if self.executors is not None else self.reference_features()
+		actual_df   = self.feature_matrix()
+
+		report = compare_feature_matrices(actual_df if actual_df is not None else pd.DataFrame(), expected_df, rtol = self.rtol, atol = self.atol)
+		report["data_version_changed"] = self.mk1.dataset.data_version() != version
+
+		if not report["consistent"] :
+			self.mk1.logging.logger.warning("(AggregateStore.check) The aggregate store differs from a full rebuild : {}".format(report))
+		else :
+			self.mk1.logging.logger.info("(AggregateStore.check) The aggregate store matches a full rebuild ✅")
+		return report
+
+
+	def stats(self) -> Dict[str, Any] :
+
+		with self.lock :
+			return {
+				"enabled"   : self.enabled,
+				"stale"     : self.stale,
+				"customers" : len(self.customers),
+				"rebuilds"  : self.rebuilds,
+				"updates"   : self.updates,
+				"repairs"   : self.repairs,
+			}
+
+
+
+def load_aggregates() -> Dict[str, Any] :
+	"""Entry point of the process pool workers : running state of the whole local db (see `AggregateStore.load`)"""
+	mk1    = MkI.get_instance(_logging = True, _dataset = True)
+	config = Config().parser
+
+	return AggregateStore(mk1, config, hooked = False).load()
+
+
+def reference_features() -> pd.DataFrame :
+	"""Entry point of the process pool workers : reference matrix of the consistency check (see `AggregateStore.reference_features`)"""
+	mk1    = MkI.get_instance(_logging = True, _dataset = True)
+	config = Config().parser
+
+	return AggregateStore(mk1, config, hooked = False).reference_features()
+
+
+
+def compare_feature_matrices(actual_df : pd.DataFrame, expected_df : pd.DataFrame, rtol : float = 1e-7, atol : float = 1e-9) -> Dict[str, Any] :
+	"""Rows, columns & values (numbers within a tolerance, NaN equal to NaN) of two feature matrices"""
+	rows    = actual_df.index.intersection(expected_df.index)
+	columns = [col for col in expected_df.columns if col in actual_df.columns]
+
+	mismatches = {}
+	for col in columns :
+		left, right = actual_df.loc[rows, col], expected_df.loc[rows, col]
+		try :
+			left, right = left.astype("float64").values, right.astype("float64").values
+			equal       = np.isclose(left, right, rtol = rtol, atol = atol, equal_nan = True)
+		except (TypeError, ValueError) :
+			left, right = left.astype(object), right.astype(object)
+			equal       = ((left == right) | (left.isna() & right.isna())).values
+
+		if not equal.all() :
+			mismatches[col] = int((~equal).sum())
+
+	report = {
+		"rows"            : len(expected_df),
+		"columns"         : len(expected_df.columns),
+		"missing_rows"    : [int(row) for row in expected_df.index.difference(actual_df.index)],
+		"extra_rows"      : [int(row) for row in actual_df.index.difference(expected_df.index)],
+		"missing_columns" : [col for col in expected_df.columns if col not in actual_df.columns],
+		"extra_columns"   : [col for col in actual_df.columns if col not in expected_df.columns],
+		"mismatches"      : mismatches,
+	}
+	report["consistent"] = not any(report[key] for key in ["missing_rows", "extra_rows", "missing_columns", "extra_columns", "mismatches"])
+	return report
@@ -0,0 +1,113 @@
+import gzip
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+# zstd responses (optional dependency)
+try :
+	import zstandard
+except ImportError :
+	zstandard = None
+
+
+# Project modules
+from src.markI  import MkI
+from src.config import Config
+
+
+
+class Compressor(object) :
+	"""
+		Response compression negotiated from `Accept-Encoding` : zstd (if `zstandard` is installed) or gzip.
+		Bodies below `compression_min_size` bytes are sent as is, streamed bodies are compressed on the fly.
+	"""
+	# by order of preference, for equal q-values
+	encodings = ["zstd", "gzip"]
+
+
+	def __init__(self, mk1 : MkI, config : Config):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		# compression
+		self.min_size = int(config.get("compression","compression_min_size"))
+		self.levels   = {
+			"gzip" : int(config.get("compression","compression_gzip_level")),
+			"zstd" : int(config.get("compression","compression_zstd_level")),
+		}
+		self.available = [encoding for encoding in self.encodings if encoding != "zstd" or zstandard is not None]
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#      Negotiation      #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def negotiate(self, accept_encoding : Optional[str]) -> Optional[str] :
+		"""Accepted encoding of highest quality (`*` stands for any encoding not listed), None for identity"""
+		if not accept_encoding :
+			return None
+
+		qualities = {}
+		for item in accept_encoding.split(",") :
+			coding, *params = [part.strip() for part in item.split(";")]
+			quality = 1.0
+			for param in params :
+				name, _, value = param.partition("=")
+				if name.strip() == "q" :
+					try :
+						quality = float(value)
+					except ValueError :
+						quality = 0.0
+			if coding :
+				qualities[coding.lower()] = quality
+
+		wildcard = qualities.get("*", 0.0)
+		ranked   = [(qualities.get(encoding, wildcard), -i, encoding) for i, encoding in enumerate(self.available)]
+		quality, _, encoding = max(ranked)
+
+		return encoding if quality > 0 else None
+
+
+	def applicable(self, encoding : Optional[str], size : int) -> Optional[str] :
+		"""The negotiated encoding, unless the body is too small to be worth it"""
+		return encoding if size >= self.min_size else None
+
+
+	def headers(self, encoding : Optional[str]) -> Dict[str, str] :
+		headers = {"Vary" : "Accept-Encoding"}
+		if encoding is not None :
+			headers["Content-Encoding"] = encoding
+		return headers
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#      Compression      #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def compress(self, body : bytes, encoding : Optional[str]) -> bytes :
+		"""A whole body (gzip without a timestamp : the same body always gives the same bytes)"""
+		if encoding == "gzip" :
+			return gzip.compress(body, compresslevel = self.levels["gzip"], mtime = 0)
+		if encoding == "zstd" :
+			return zstandard.ZstdCompressor(level = self.levels["zstd"]).compress(body)
+		return body
+
+
+	def compress_stream(self, chunks : Iterable[bytes], encoding : Optional[str]) -> Iterator[bytes] :
+		"""A streamed body, chunk by chunk (empty outputs are held back until there is something to send)"""
+		if encoding is None :
+			yield from chunks
+			return
+
+		if encoding == "gzip" :
+			compressobj = zlib.compressobj(self.levels["gzip"], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+		else :
+			compressobj = zstandard.ZstdCompressor(level = self.levels["zstd"]).compressobj()
+
+		for chunk in chunks :
+			compressed = compressobj.compress(chunk)
+			if compressed :
+				yield compressed
+		yield compressobj.flush()
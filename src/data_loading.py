@@ -1,5 +1,9 @@
 import os
+import re
+import gzip
 import json
+import shutil
+import hashlib
 import ujson
 import numpy    as np
 import pandas   as pd
@@ -9,9 +13,10 @@ from collections     import defaultdict
 from typing 		 import Callable, Dict, Generic, Optional, Set, Tuple, TypeVar, Deque, List, Any
 
 
-from src.models import Customer, LoanStatus, Term, Customer, Loan, CustomerUpdateRequest
-from src.config import Config
-from src.markI  import MkI
+from src.models     import Customer, LoanStatus, Term, Customer, Loan, CustomerUpdateRequest
+from src.config     import Config
+from src.markI      import MkI
+from src.statements import Statements
 
 
 class DataLoader(object) : 
@@ -29,6 +34,18 @@ class DataLoader(object) :
 		self.data_json_path = str(config.get("data","data_json_path"))
 		self.data_csv_path  = str(config.get("data","data_csv_path"))
 
+		self.data_source      = str(config.get("data","data_source"))
+		self.data_date_format = str(config.get("data","data_date_format"))
+		self.data_chunk_size  = int(config.get("data","data_chunk_size"))
+		self.data_read_size   = int(config.get("data","data_read_size"))
+
+		# binary snapshot of the typed frames (one .npy file per column & a manifest)
+		self.data_snapshot_dir     = str(config.get("data","data_snapshot_dir"))
+		self.data_snapshot_format  = 1
+
+		# named statements of the local db
+		self.statements = Statements(mk1, config)
+
 
 		self.customers_df = None
 		self.customers    = []
@@ -87,10 +104,12 @@ class DataLoader(object) :
 
 	def postprocess_loans_dataframe(self, loans_df : pd.DataFrame) -> pd.DataFrame : 
 		try : 
-			# Fix Datatypes
-			loans_df["loan_date"] = pd.to_datetime(loans_df["loan_date"], dayfirst = True)
-			loans_df["amount"]    = loans_df["amount"].apply(pd.to_numeric)
-			loans_df["fee"]       = loans_df["fee"].apply(pd.to_numeric)
+			# Fix Datatypes (of string columns only)
+			if not pd.api.types.is_datetime64_any_dtype(loans_df["loan_date"]) :
+				loans_df["loan_date"] = pd.to_datetime(loans_df["loan_date"], dayfirst = True)
+			for col in ["amount", "fee"] :
+				if loans_df[col].dtype == object :
+					loans_df[col] = loans_df[col].apply(pd.to_numeric)
 
 			# logger
 			self.mk1.logging.logger.info("(DataLoader.postprocess_loans_dataframe) Loans Data are postprocessed sucessfully ✅")
@@ -223,6 +242,368 @@ class DataLoader(object) :
 			raise e
 
 
+	def iter_json_entries(self, fn_path : str, key : str = "data") :
+		"""
+			Yields the entries of the `key` array of a json file (plain or gzip-compressed) one at a time,
+			reading `data_read_size` characters at a time : only the current block is kept in memory
+		"""
+		decoder = json.JSONDecoder()
+
+		with open(fn_path, "rb") as fn :
+			is_gzip = fn.read(2) == b"\x1f\x8b"
+
+		with (gzip.open if is_gzip else open)(fn_path, "rt", encoding = "utf-8") as fn :
+
+			# 1. Start of the array
+			buffer, pos, eof = "", None, False
+			while pos is None :
+				block = fn.read(self.data_read_size)
+				if not block :
+					raise ValueError("No '{}' array found in {}".format(key, fn_path))
+				buffer += block
+				match   = re.search(r'"{}"\s*:\s*\['.format(re.escape(key)), buffer)
+				pos     = match.end() if match else None
+
+			# 2. Entries, decoded as soon as they are complete
+			while True :
+				while pos < len(buffer) and buffer[pos] in " \t\r\n," :
+					pos += 1
+
+				if pos < len(buffer) and buffer[pos] == "]" :
+					return
+
+				try :
+					if pos >= len(buffer) :
+						raise json.JSONDecodeError("Incomplete entry", buffer, pos)
+					entry, pos = decoder.raw_decode(buffer, pos)
+					yield entry
+
+				except json.JSONDecodeError :
+					if eof :
+						raise ValueError("Unterminated '{}' array in {}".format(key, fn_path))
+					block  = fn.read(self.data_read_size)
+					eof    = not block
+					buffer = buffer[pos:] + block
+					pos    = 0
+
+
+	def load_data_from_json_stream(self, fn_path : Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame] :
+		"""
+			Streaming & typed alternative of `load_data_from_json` + preprocessing : the customers are read
+			incrementally and every `data_chunk_size` of them are turned into typed columns, so the nested
+			dicts of at most one chunk are in memory. The output needs no preprocessing/postprocessing.
+		"""
+		try :
+			customers_chunks, loans_chunks = [], []
+			customers, loans               = defaultdict(list), defaultdict(list)
+			num_loans                      = 0
+
+			for entry in self.iter_json_entries(fn_path or self.data_json_path) :
+				entry_loans = entry.get("loans") or []
+				customers["customer_id"].append(entry["customer_ID"])
+				customers["annual_income"].append(entry_loans[0]["annual_income"] if entry_loans else np.nan)
+
+				for loan in entry_loans :
+					loans["customer_id"].append(loan.get("customer_ID", entry["customer_ID"]))
+					for col in ["loan_date", "amount", "fee", "loan_status", "term"] :
+						loans[col].append(loan[col])
+
+				if len(customers["customer_id"]) >= self.data_chunk_size :
+					customers_chunks.append(self.typed_customers_chunk(customers))
+					loans_chunks.append(self.typed_loans_chunk(loans, num_loans))
+					num_loans += len(loans["customer_id"])
+					customers, loans = defaultdict(list), defaultdict(list)
+
+			if customers or not customers_chunks :
+				customers_chunks.append(self.typed_customers_chunk(customers))
+				loans_chunks.append(self.typed_loans_chunk(loans, num_loans))
+
+			customers_df = pd.concat(customers_chunks, ignore_index = True)
+			loans_df     = pd.concat(loans_chunks, ignore_index = True)
+			# logger
+			self.mk1.logging.logger.info("(DataLoader.load_data_from_json_stream) Data ({} customers, {} loans) loaded sucessfully ✅".format(len(customers_df), len(loans_df)))
+			return (customers_df, loans_df)
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(DataLoader.load_data_from_json_stream) Streaming data loading failed : {}".format(e))
+			raise e
+
+
+	def typed_customers_chunk(self, customers : Dict[str, List]) -> pd.DataFrame :
+
+		return pd.DataFrame({
+			"customer_id"   : np.asarray(customers["customer_id"], dtype = np.int64),
+			"annual_income" : np.asarray(customers["annual_income"], dtype = np.float64),
+		})
+
+
+	def typed_loans_chunk(self, loans : Dict[str, List], loan_id_start : int) -> pd.DataFrame :
+		"""Loans columns in the order of `preprocess_loans_dataframe`, loan ids continue from the previous chunk"""
+		num_loans = len(loans["customer_id"])
+
+		return pd.DataFrame({
+			"loan_id"     : np.arange(loan_id_start, loan_id_start + num_loans, dtype = np.int64),
+			"customer_id" : np.asarray(loans["customer_id"], dtype = np.int64),
+			"loan_date"   : self.parse_dates(loans["loan_date"]),
+			"amount"      : self.numeric_array(loans["amount"]),
+			"fee"         : self.numeric_array(loans["fee"]),
+			"loan_status" : self.numeric_array(loans["loan_status"]),
+			"term"        : np.asarray(loans["term"], dtype = object),
+		})
+
+
+	def parse_dates(self, values : List[str]) -> pd.DatetimeIndex :
+		"""Dates in `data_date_format` (day first), any other day-first format otherwise"""
+		try :
+			return pd.to_datetime(values, format = self.data_date_format)
+		except (ValueError, TypeError) :
+			return pd.to_datetime(values, dayfirst = True)
+
+
+	def numeric_array(self, values : List[Any]) -> np.ndarray :
+		"""Integers when all the values are integers, floats otherwise (like `pd.to_numeric`)"""
+		array = np.asarray(values)
+		if array.dtype.kind in "iuf" :
+			return array
+
+		try :
+			return array.astype(np.int64)
+		except (ValueError, OverflowError) :
+			return array.astype(np.float64)
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#          csv          #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def load_data_from_csv(self, fn_path : Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame] :
+		"""
+			Flat loan rows (`customer_ID,loan_date,amount,fee,loan_status,term,annual_income`) read in chunks
+			of `data_chunk_size` rows with declared dtypes. The customers are the first row of every
+			`customer_ID` (like the first loan in the json file), de-duplicated chunk by chunk.
+		"""
+		try :
+			dtypes = {
+				"customer_ID"   : np.int64,
+				"loan_date"     : str,
+				"amount"        : np.int64,
+				"fee"           : np.int64,
+				"loan_status"   : pd.CategoricalDtype([status.value for status in LoanStatus]),
+				"term"          : pd.CategoricalDtype([term.value for term in Term]),
+				"annual_income" : np.float64,
+			}
+			customers_chunks, loans_chunks = [], []
+			seen_customers                 = set()
+			num_loans                      = 0
+
+			for chunk in pd.read_csv(fn_path or self.data_csv_path, dtype = dtypes, chunksize = self.data_chunk_size) :
+				customer_ids = chunk["customer_ID"].to_numpy()
+
+				# loans : numeric status (like the json loaders), ids continue from the previous chunk
+				loans_chunks.append(pd.DataFrame({
+					"loan_id"     : np.arange(num_loans, num_loans + len(chunk), dtype = np.int64),
+					"customer_id" : customer_ids,
+					"loan_date"   : self.parse_dates(chunk["loan_date"].to_numpy()),
+					"amount"      : chunk["amount"].to_numpy(),
+					"fee"         : chunk["fee"].to_numpy(),
+					"loan_status" : chunk["loan_status"].astype(np.int64).to_numpy(),
+					"term"        : chunk["term"].values,
+				}))
+				num_loans += len(chunk)
+
+				# customers : first row of the customers not seen in the previous chunks
+				first = chunk.drop_duplicates("customer_ID")
+				new   = np.fromiter((customer_id not in seen_customers for customer_id in first["customer_ID"]), dtype = bool, count = len(first))
+				seen_customers.update(first["customer_ID"])
+				customers_chunks.append(pd.DataFrame({
+					"customer_id"   : first["customer_ID"].to_numpy()[new],
+					"annual_income" : first["annual_income"].to_numpy()[new],
+				}))
+
+			customers_df = pd.concat(customers_chunks, ignore_index = True)
+			loans_df     = pd.concat(loans_chunks, ignore_index = True)
+			# logger
+			self.mk1.logging.logger.info("(DataLoader.load_data_from_csv) Data ({} customers, {} loans) loaded sucessfully ✅".format(len(customers_df), len(loans_df)))
+			return (customers_df, loans_df)
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(DataLoader.load_data_from_csv) CSV data loading failed : {}".format(e))
+			raise e
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#        Snapshot       #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def load_data_from_snapshot(self,
+								fn_path : Optional[str] = None,
+								load_fn : Optional[Callable[[str], Tuple[pd.DataFrame, pd.DataFrame]]] = None
+								) -> Tuple[pd.DataFrame, pd.DataFrame] :
+		"""
+			Typed frames of the data file, from its binary snapshot when it is still valid (the data file
+			is not parsed at all), otherwise loaded by `load_fn` (default : the streaming json loader) &
+			snapshotted for the next time
+		"""
+		fn_path = fn_path or self.data_json_path
+		load_fn = load_fn or self.load_data_from_json_stream
+		source  = self.snapshot_source_facts(fn_path)
+		frames  = self.load_snapshot(fn_path, source)
+
+		if frames is not None :
+			return frames
+
+		customers_df, loans_df = load_fn(fn_path)
+
+		# the file must not have changed while it was read
+		if self.snapshot_source_facts(fn_path) == source :
+			try :
+				self.save_snapshot(customers_df, loans_df, dict(source, sha256 = self.file_sha256(fn_path)))
+			except Exception :
+				pass
+
+		return (customers_df, loans_df)
+
+
+	def snapshot_source_facts(self, fn_path : str) -> Dict[str, Any] :
+		stat = os.stat(fn_path)
+		return {"path" : os.path.abspath(fn_path), "size" : stat.st_size, "mtime_ns" : stat.st_mtime_ns}
+
+
+	def file_sha256(self, fn_path : str) -> str :
+		sha256 = hashlib.sha256()
+		with open(fn_path, "rb") as fn :
+			for block in iter(lambda : fn.read(self.data_read_size), b"") :
+				sha256.update(block)
+
+		return sha256.hexdigest()
+
+
+	def read_snapshot_manifest(self) -> Optional[Dict[str, Any]] :
+
+		try :
+			with open(os.path.join(self.data_snapshot_dir, "manifest.json"), "r") as fn :
+				return json.load(fn)
+		except (OSError, ValueError) :
+			return None
+
+
+	def write_snapshot_manifest(self, manifest : Dict[str, Any]) -> None :
+		"""The manifest is replaced atomically : readers see either the previous or the new snapshot"""
+		tmp_path = os.path.join(self.data_snapshot_dir, "manifest.json.{}.tmp".format(os.getpid()))
+		with open(tmp_path, "w") as fn :
+			json.dump(manifest, fn, indent = 2)
+
+		os.replace(tmp_path, os.path.join(self.data_snapshot_dir, "manifest.json"))
+
+
+	def load_snapshot(self, fn_path : str, source : Dict[str, Any]) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]] :
+		"""
+			Memory-mapped frames of a valid snapshot, None otherwise. A snapshot is valid if it was built
+			from the same path, size & mtime (or, if only the mtime changed, from the same content hash)
+			with the current loader settings.
+		"""
+		manifest = self.read_snapshot_manifest()
+
+		if manifest is None or manifest.get("format") != self.data_snapshot_format or manifest.get("date_format") != self.data_date_format :
+			return None
+
+		snapshot_source = manifest["source"]
+		if snapshot_source["path"] != source["path"] or snapshot_source["size"] != source["size"] :
+			return None
+
+		if snapshot_source["mtime_ns"] != source["mtime_ns"] :
+			if snapshot_source["sha256"] != self.file_sha256(fn_path) :
+				return None
+			manifest["source"] = dict(snapshot_source, mtime_ns = source["mtime_ns"])
+			self.write_snapshot_manifest(manifest)
+
+		try :
+			snapshot_dir = os.path.join(self.data_snapshot_dir, manifest["dir"])
+			frames       = tuple(self.load_snapshot_frame(snapshot_dir, manifest["frames"][frame_name]) for frame_name in ["customers", "loans"])
+			# logger
+			self.mk1.logging.logger.info("(DataLoader.load_snapshot) Data loaded from the snapshot '{}' sucessfully ✅".format(snapshot_dir))
+			return frames
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(DataLoader.load_snapshot) Snapshot loading failed, falling back to the json file : {}".format(e))
+			return None
+
+
+	def load_snapshot_frame(self, snapshot_dir : str, frame : Dict[str, Any]) -> pd.DataFrame :
+
+		columns = {}
+		for column in frame["columns"] :
+			values = np.load(os.path.join(snapshot_dir, column["file"]), mmap_mode = "r")
+
+			# categorical columns are stored as their codes, object columns as codes of their unique
+			# values (-1, i.e. the last one, for nulls)
+			if column.get("categorical") :
+				values = pd.Categorical.from_codes(values, categories = column["categories"], ordered = column["ordered"])
+			elif "categories" in column :
+				categories = np.asarray(column["categories"] + [None], dtype = object)
+				values     = categories[values]
+
+			columns[column["name"]] = values
+
+		return pd.DataFrame(columns, copy = False)
+
+
+	def save_snapshot(self, customers_df : pd.DataFrame, loans_df : pd.DataFrame, source : Dict[str, Any]) -> None :
+
+		try :
+			snapshot_name = "{}-{}".format(source["sha256"][:16], os.getpid())
+			snapshot_dir  = os.path.join(self.data_snapshot_dir, snapshot_name)
+			os.makedirs(snapshot_dir, exist_ok = True)
+
+			frames = {}
+			for frame_name, df in [("customers", customers_df), ("loans", loans_df)] :
+				frames[frame_name] = {"rows" : len(df), "columns" : []}
+
+				for col in df.columns :
+					column = {"name" : col, "file" : "{}.{}.npy".format(frame_name, col)}
+					values = df[col].to_numpy()
+
+					if isinstance(df[col].dtype, pd.CategoricalDtype) :
+						values                = df[col].cat.codes.to_numpy()
+						column["categorical"] = True
+						column["ordered"]     = bool(df[col].cat.ordered)
+						column["categories"]  = df[col].cat.categories.tolist()
+
+					elif values.dtype == object :
+						codes, categories    = pd.factorize(values)
+						values               = codes.astype(np.int32)
+						column["categories"] = [category for category in categories]
+
+					column["dtype"] = str(values.dtype)
+					np.save(os.path.join(snapshot_dir, column["file"]), values, allow_pickle = False)
+					frames[frame_name]["columns"].append(column)
+
+			self.write_snapshot_manifest({
+				"format"      : self.data_snapshot_format,
+				"date_format" : self.data_date_format,
+				"source"      : source,
+				"dir"         : snapshot_name,
+				"frames"      : frames,
+			})
+
+			# previous snapshots (a reader may still map their files, which is fine on POSIX), except the
+			# current one if a concurrent writer replaced the manifest in the meantime
+			current = (self.read_snapshot_manifest() or {}).get("dir")
+			for name in os.listdir(self.data_snapshot_dir) :
+				path = os.path.join(self.data_snapshot_dir, name)
+				if name not in (snapshot_name, current) and os.path.isdir(path) :
+					shutil.rmtree(path, ignore_errors = True)
+
+			# logger
+			self.mk1.logging.logger.info("(DataLoader.save_snapshot) Snapshot '{}' saved sucessfully ✅".format(snapshot_dir))
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(DataLoader.save_snapshot) Saving snapshot failed : {}".format(e))
+			raise e
+
+
 	#*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
 	#       Dataset : Local DB      #
 	#*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
@@ -268,36 +649,64 @@ class DataLoader(object) :
 		return loan_dict
 
 
-	def clear_local_db(self, db_name : str, pk : str ) : 
-
-		ids = self.mk1.dataset.db_query(query_str = f"SELECT {pk} FROM {db_name}")[pk].values
-
-		for id in ids : 
+	def clear_local_db(self, db_name : str, pk : str, vacuum : bool = False) : 
+		"""Deletes all the rows of the local db with a single statement"""
+		num_rows = self.mk1.dataset.db_truncate(table_name = db_name, vacuum = vacuum)
 
-			try : 
-				self.mk1.dataset.db_delete(table_name = f"{db_name}", filters_dict = {f"{pk}": id})
-				self.mk1.logging.logger.info("(test_api.clear_local_db) Object (id = {}) deleted from db named '{}' sucessfully ✅".format(id, db_name))
+		if num_rows is None :
+			self.mk1.logging.logger.error("(DataLoader.clear_local_db) Clearing local db named '{}' failed".format(db_name))
+			raise RuntimeError("Clearing local db named '{}' failed".format(db_name))
 
-			except Exception as e:
-				self.mk1.logging.logger.error("(test_api.clear_local_db) Object (id = {}) deletion from local db named '{}' failed {}".format(id, db_name, e))
-				raise e
+		self.mk1.logging.logger.info("(DataLoader.clear_local_db) {} objects deleted from db named '{}' sucessfully ✅".format(num_rows, db_name))
 
 
 	def push_data_to_local_db(self, db_name : str, data :  List[Dict[str, Any]]) : 
+		"""Bulk insert of all the rows in a single transaction (rolled back as a whole on failure)"""
+		stats = self.mk1.dataset.db_bulk_insert(table_name = db_name, rows = data)
 
-		for d_dict in data : 
-			self.mk1.dataset.db_append_row(table_name = db_name, input_dict = d_dict)
+		if stats is None :
+			self.mk1.logging.logger.error("(DataLoader.push_data_to_local_db) Bulk insert into local db named '{}' failed, the batch was rolled back".format(db_name))
+			raise RuntimeError("Bulk insert into local db named '{}' failed".format(db_name))
+
+		#logger
+		self.mk1.logging.logger.info("(DataLoader.push_data_to_local_db) {} rows inserted into local db named '{}' in {:.3f}s ({:.0f} rows/sec) ✅".format(stats["rows"], db_name, stats["seconds"], stats["rows_per_sec"]))
+		return stats
 		
 
 	def load_data_from_local_db(self, db_name : str ) -> pd.DataFrame:
-		return self.mk1.dataset.db_query(query_str = f"SELECT * FROM {db_name}")
+		return self.mk1.dataset.db_query(query_str = f"SELECT * FROM {db_name}", read_only = True)
+
+
+	def load_entities_from_local_db(self,
+									customer_ids : Optional[List[int]] = None,
+									loan_ids     : Optional[List[int]] = None
+									) -> Tuple[pd.DataFrame, pd.DataFrame] :
+		"""Only the requested customers (or the customers of the requested loans) & all their loans"""
+		if loan_ids is not None :
+			loan_ids     = [int(loan_id) for loan_id in loan_ids]
+			customers_df = self.statements.execute("loans_customers", loan_ids = loan_ids)
+			loans_df     = self.statements.execute("loans_customers_loans", loan_ids = loan_ids)
+		else :
+			customer_ids = [int(customer_id) for customer_id in customer_ids]
+			customers_df = self.statements.execute("entity_customers", customer_ids = customer_ids)
+			loans_df     = self.statements.execute("entity_loans", customer_ids = customer_ids)
+
+		return (customers_df, loans_df)
+
+
+	def load_income_range_from_local_db(self) -> Tuple[float, float] :
+		"""Global `annual_income` range, so that the income bins of a subset match the full dataset"""
+		query_response = self.statements.execute("income_range")
+		min_value, max_value = query_response.iloc[0].values
+
+		return (float(min_value), float(max_value))
 
 
 	def check_if_local_db_empty(self, db_name : str) -> bool: 
 
 		if db_name in self.mk1.dataset.get_tables() : 
 
-			query_response = self.mk1.dataset.db_query(query_str = f"SELECT count(*) FROM {db_name}")
+			query_response = self.mk1.dataset.db_query(query_str = f"SELECT count(*) FROM {db_name}", read_only = True)
 			num_rows       = query_response.iloc[0].values[0]
 			
 			if num_rows > 0 :
@@ -323,16 +732,19 @@ class DataLoader(object) :
 			customers_df = self.load_data_from_local_db(db_name = "customers") 
 			loans_df     = self.load_data_from_local_db(db_name = "loans") 
 
+		elif self.data_source == "csv" :
+			customers_df, loans_df = self.load_data_from_snapshot(self.data_csv_path, self.load_data_from_csv)
+
 		else :
-			data_df                = self.load_data_from_json()
-			customers_df, loans_df = self.split_dataframes(data_df)
+			customers_df, loans_df = self.load_data_from_snapshot(self.data_json_path, self.load_data_from_json_stream)
 
 		return (customers_df, loans_df)
 
 
 	def preprocess_data(self, customers_df : pd.DataFrame, loans_df : pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame] : 
 
-		if self.check_if_local_db_empty("customers") : 
+		# only the nested dataframes of `load_data_from_json` (the streaming loader outputs typed columns)
+		if "loans" in customers_df.columns : 
 			customers_df = self.preprocess_customers_dataframe(customers_df)
 			loans_df     = self.preprocess_loans_dataframe(loans_df)
 			
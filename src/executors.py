@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing             import Any, Callable, Optional
+
+
+# Project modules
+from src.markI  import MkI
+from src.config import Config
+
+
+
+class Executors(object) :
+	"""
+		Keeps blocking work off the event loop : CPU-heavy pandas/featuretools stages are sent to a
+		process pool, blocking SQLite calls to a thread pool. Both pools are created lazily and
+		are shut down together on app shutdown.
+	"""
+	def __init__(self, mk1 : MkI, config : Config, initializer : Optional[Callable[[], None]] = None):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		# pools
+		self.process_pool_workers = int(config.get("executors","process_pool_workers"))
+		self.thread_pool_workers  = int(config.get("executors","thread_pool_workers"))
+		self.process_start_method = str(config.get("executors","process_start_method"))
+		self.initializer          = initializer
+
+		self._process_pool = None
+		self._thread_pool  = None
+		self.lock          = threading.Lock()
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#         Pools         #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	@property
+	def process_pool(self) -> ProcessPoolExecutor :
+
+		with self.lock :
+			if self._process_pool is None :
+				self._process_pool = ProcessPoolExecutor(
+						max_workers = self.process_pool_workers,
+						mp_context  = multiprocessing.get_context(self.process_start_method),
+						initializer = self.initializer
+				)
+				self.mk1.logging.logger.info("(Executors.process_pool) Process pool with {} workers was started ✅".format(self.process_pool_workers))
+
+			return self._process_pool
+
+
+	@property
+	def thread_pool(self) -> ThreadPoolExecutor :
+
+		with self.lock :
+			if self._thread_pool is None :
+				# the connections of each worker are closed when it exits
+				self._thread_pool = ThreadPoolExecutor(
+						max_workers        = self.thread_pool_workers,
+						thread_name_prefix = "db",
+						initializer        = self.mk1.dataset.db_release_on_exit
+				)
+				self.mk1.logging.logger.info("(Executors.thread_pool) Thread pool with {} workers was started ✅".format(self.thread_pool_workers))
+
+			return self._thread_pool
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#          Run          #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	async def run_cpu(self, fn : Callable, *args, **kwargs) -> Any :
+		"""Runs a picklable, module-level function in the process pool"""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self.process_pool, functools.partial(fn, *args, **kwargs))
+
+
+	async def run_io(self, fn : Callable, *args, **kwargs) -> Any :
+		"""Runs a blocking (e.g. SQLite) call in the thread pool"""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self.thread_pool, functools.partial(fn, *args, **kwargs))
+
+
+	def shutdown(self, wait : bool = True) -> None :
+
+		with self.lock :
+			if self._process_pool is not None :
+				self._process_pool.shutdown(wait = wait, cancel_futures = True)
+				self._process_pool = None
+
+			if self._thread_pool is not None :
+				self._thread_pool.shutdown(wait = wait, cancel_futures = True)
+				self._thread_pool = None
+
+		self.mk1.logging.logger.info("(Executors.shutdown) Process & thread pools were shut down ✅")
+
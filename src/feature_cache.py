@@ -0,0 +1,156 @@
+import os
+import threading
+from collections import OrderedDict
+from typing      import Any, Dict, Hashable, Optional, Tuple
+
+
+# Project modules
+from src.markI  import MkI
+from src.config import Config
+
+
+
+class FeatureCache(object) :
+	"""
+		In-process LRU cache of feature matrices. Entries are keyed by (ontology, data version),
+		where the data version combines the local DB version (write counter, stat of the db file &
+		its WAL) with the mtime of the json data file, so any write, from this process or another
+		one, makes the cached matrices unreachable. Every entry also keeps the
+		encoded bodies of its matrix (e.g. JSON), counted in its size.
+	"""
+	def __init__(self, mk1 : MkI, config : Config):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		# data
+		self.data_path = str(config.get("data","data_{}_path".format(config.get("data","data_source"))))
+
+		# cache
+		self.max_entries = int(config.get("cache","cache_max_entries"))
+		self.max_bytes   = int(config.get("cache","cache_max_bytes"))
+		self.entries     = OrderedDict()
+		self.num_bytes   = 0
+		self.lock        = threading.Lock()
+
+		# counters
+		self.hits      = 0
+		self.misses    = 0
+		self.evictions = 0
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#      Data Version     #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def data_version(self) -> Tuple :
+		"""The current data version : (local db version, see `DataSet.data_version`, mtime of the data file : json or csv)"""
+		try :
+			data_mtime = os.path.getmtime(self.data_path)
+		except OSError :
+			data_mtime = None
+
+		return (self.mk1.dataset.data_version(), data_mtime)
+
+
+	def shared_data_version(self) -> Tuple :
+		"""The part of the data version every process (e.g. every API worker) agrees on : without the in-process write counter"""
+		version = self.data_version()
+		return (version[0][1:], version[1])
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#         Cache         #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def get(self, ontology : str, version : Tuple) -> Optional[Any] :
+
+		with self.lock :
+			key = (ontology, version)
+
+			if key not in self.entries :
+				self.misses += 1
+				return None
+
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return self.entries[key][0]
+
+
+	def get_body(self, ontology : str, version : Tuple, body_key : Hashable) -> Optional[bytes] :
+		"""Encoded body of a cached matrix (e.g. `"json"`), None if the entry or the body does not exist"""
+		with self.lock :
+			entry = self.entries.get((ontology, version))
+			return entry[2].get(body_key) if entry is not None else None
+
+
+	def put_body(self, ontology : str, version : Tuple, body_key : Hashable, body : bytes) -> None :
+		"""Keeps an encoded body alongside its (still cached) matrix"""
+		with self.lock :
+			key   = (ontology, version)
+			entry = self.entries.get(key)
+			if entry is None or body_key in entry[2] :
+				return
+
+			value, size, bodies = entry
+			bodies[body_key]    = body
+			self.entries[key]   = (value, size + len(body), bodies)
+			self.num_bytes     += len(body)
+
+			while len(self.entries) > 1 and self.num_bytes > self.max_bytes :
+				self._evict(next(iter(self.entries)))
+
+
+	def put(self, ontology : str, version : Tuple, value : Any, size : int = 0) -> None :
+
+		with self.lock :
+			key = (ontology, version)
+
+			# 1. Drop entries of older data versions for the same ontology (they can never be hit again)
+			for stale_key in [k for k in self.entries if k[0] == ontology and k != key] :
+				self._evict(stale_key)
+
+			if key in self.entries :
+				self._evict(key)
+
+			# 2. Insert as the most recently used entry
+			self.entries[key] = (value, size, {})
+			self.num_bytes   += size
+
+			# 3. Enforce the size cap (least recently used first)
+			while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.num_bytes > self.max_bytes) :
+				self._evict(next(iter(self.entries)))
+
+		self.mk1.logging.logger.info("(FeatureCache.put) Features of '{}' were cached for data version {} ✅".format(ontology, version))
+
+
+	def clear(self) -> None :
+
+		with self.lock :
+			self.entries.clear()
+			self.num_bytes = 0
+
+
+	def stats(self) -> Dict[str, Any] :
+
+		with self.lock :
+			lookups = self.hits + self.misses
+			return {
+				"entries"     : len(self.entries),
+				"max_entries" : self.max_entries,
+				"bytes"       : self.num_bytes,
+				"max_bytes"   : self.max_bytes,
+				"hits"        : self.hits,
+				"misses"      : self.misses,
+				"evictions"   : self.evictions,
+				"hit_ratio"   : self.hits / lookups if lookups else 0.0,
+			}
+
+
+	def _evict(self, key : Tuple) -> None :
+		_, size, _ = self.entries.pop(key)
+		self.num_bytes -= size
+		self.evictions += 1
+
@@ -1,9 +1,11 @@
 import os
 import json
+import hashlib
 import numpy        as np
 import pandas       as pd
 import featuretools as ft
 import datetime     as dt
+from featuretools.feature_base import DirectFeature
 from typing           import Callable, Dict, Generic, Optional, Set, Tuple, TypeVar, Deque, List
 from IPython.display  import display
 from collections      import defaultdict
@@ -19,6 +21,10 @@ from src.data_reporting import DataReporter
 
 
 class FeatureEngineer(object) : 
+
+	# Saved feature definitions, loaded once per process : path -> (schema signature, features defs)
+	saved_features_defs = {}
+
 	def __init__(self, mk1 : MkI, config : Config):
 		# system design
 		self.mk1    = mk1
@@ -30,12 +36,38 @@ class FeatureEngineer(object) :
 			"features_customers"  : str(config.get("features","features_customers_path")),
 			"features_loans"      : str(config.get("features","features_loans_path")),
 		}	
+		self.features_defs_paths = {
+			"customers" : str(config.get("features","features_defs_customers_path")),
+			"loans"     : str(config.get("features","features_defs_loans_path")),
+		}
 
 		self.dataframes     = defaultdict(set)
 		self.relationships  = []
 		self.feature_matrix = None
 		self.features_defs  = None
 
+		# featuretools : EntitySet, parent-level (customers) feature definitions & aggregates, built once
+		self.entityset       = None
+		self.schema          = None
+		self.parent_defs     = None
+		self.parent_features = None
+
+		# engine : "featuretools" (DFS) or "native" (pandas/NumPy groupby kernels)
+		self.engine = str(config.get("features","engine"))
+
+		# declared categorical columns of the child (loans) dataframe : woodwork would infer them as
+		# "Unknown" on a few rows (e.g. per-entity features), the native engine treats every other
+		# non-key column as numeric, mirroring the logical types featuretools infers for them
+		self.categorical_columns     = ["term"]
+		self.native_agg_primitives   = ["MAX", "MEAN", "MIN", "SKEW", "STD", "SUM"]
+		self.native_trans_primitives    = {
+			# name    : (datetime accessor, ordinal categories)
+			"DAY"     : ("day",     range(1, 32)),
+			"MONTH"   : ("month",   range(1, 13)),
+			"WEEKDAY" : ("weekday", range(0, 7)),
+			"YEAR"    : ("year",    range(1, 3000)),
+		}
+
 
 
 	#*-*-*-*-*-*-*-*-*-*-*-*-*-*#
@@ -87,6 +119,7 @@ class FeatureEngineer(object) :
 		try : 
 
 			self.dataframes[df_name] = (df, pk)
+			self.reset_entityset()
 			#logger
 			self.mk1.logging.logger.info("(FeatureEngineer.add_dataframe) Dataframe was sucessfully added to the dictionary of dataframes ✅")
 
@@ -105,6 +138,7 @@ class FeatureEngineer(object) :
 
 			rel = (parent_dataframe, parent_column, child_dataframe, child_column) 
 			self.relationships.append(rel)
+			self.reset_entityset()
 			#logger
 			self.mk1.logging.logger.info("(FeatureEngineer.add_relationship) The tuple indicating the relationship between 2 dataframes was sucessfully added to the list of relationshipss ✅")
 
@@ -118,21 +152,178 @@ class FeatureEngineer(object) :
 	# 	return feature_matrix
 
 
+	def reset_entityset(self) -> None :
+		"""The EntitySet & the parent aggregates are stale once dataframes/relationships change"""
+		self.entityset       = None
+		self.schema          = None
+		self.parent_defs     = None
+		self.parent_features = None
+
+
+	def build_entityset(self) -> ft.EntitySet :
+		"""Builds the EntitySet from the dataframes & relationships, once"""
+		if self.entityset is None :
+			# signature of the input column schema (before woodwork casts the dataframes)
+			self.schema    = self.schema_signature()
+			dataframes     = {
+				df_name : (df, pk, None, {col : "Categorical" for col in self.categorical_columns if col in df.columns})
+				for df_name, (df, pk) in self.dataframes.items()
+			}
+			self.entityset = ft.EntitySet("features", dataframes, self.relationships)
+
+		return self.entityset
+
+
+	def schema_signature(self) -> str :
+		"""Hash of the input column schema (columns, dtypes, keys, relationships) & featuretools version"""
+		schema = {
+			"featuretools"  : ft.__version__,
+			"relationships" : self.relationships,
+			"dataframes"    : {
+				df_name : [pk, [[col, str(df[col].dtype)] for col in df.columns]]
+				for df_name, (df, pk) in sorted(self.dataframes.items())
+			},
+		}
+		return hashlib.sha256(json.dumps(schema, sort_keys = True).encode("utf-8")).hexdigest()
+
+
+	def load_features_defs(self, target_name : str) -> Optional[List] :
+		"""
+			Saved feature definitions of the target, if they were built for the current input schema
+			(the file is read once per process, see `preload_features_defs`)
+		"""
+		fn_path = self.features_defs_paths[target_name]
+
+		if fn_path not in FeatureEngineer.saved_features_defs :
+			self.preload_features_defs(target_names = [target_name])
+
+		schema, features_defs = FeatureEngineer.saved_features_defs.get(fn_path, (None, None))
+		if schema is None or schema != self.schema :
+			return None
+
+		return features_defs
+
+
+	def save_features_defs(self, target_name : str, features_defs : List) -> None :
+
+		try :
+
+			fn_path = self.features_defs_paths[target_name]
+			with open(fn_path, "w") as fn :
+				json.dump({"schema" : self.schema, "features" : ft.save_features(features_defs)}, fn)
+
+			FeatureEngineer.saved_features_defs[fn_path] = (self.schema, features_defs)
+			#logger
+			self.mk1.logging.logger.info("(FeatureEngineer.save_features_defs) Feature definitions of '{}' were sucessfully saved ✅".format(target_name))
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(FeatureEngineer.save_features_defs) Saving feature definitions of '{}' failed : {}".format(target_name, e))
+			raise e
+
+
+	def preload_features_defs(self, target_names : Optional[List[str]] = None) -> None :
+		"""Reads the saved feature definitions from disk (e.g. at startup), schemas are checked on use"""
+		for target_name in target_names or list(self.features_defs_paths) :
+			fn_path = self.features_defs_paths[target_name]
+
+			try :
+				with open(fn_path, "r") as fn :
+					saved = json.load(fn)
+				FeatureEngineer.saved_features_defs[fn_path] = (saved["schema"], ft.load_features(saved["features"]))
+				#logger
+				self.mk1.logging.logger.info("(FeatureEngineer.preload_features_defs) Feature definitions of '{}' were sucessfully loaded ✅".format(target_name))
+
+			except FileNotFoundError :
+				FeatureEngineer.saved_features_defs[fn_path] = (None, None)
+
+			except Exception as e:
+				FeatureEngineer.saved_features_defs[fn_path] = (None, None)
+				self.mk1.logging.logger.error("(FeatureEngineer.preload_features_defs) Loading feature definitions of '{}' failed : {}".format(target_name, e))
+
+
+	def run_parent_dfs(self, max_feature_depth : Optional[int] = None) :
+		"""
+			DFS for the parent dataframe (customers) : planned once & calculated once per EntitySet
+
+			:param: `max_feature_depth` - calculate only the parent features up to this depth
+			                              (served from the already calculated matrix if it covers them)
+		"""
+		entityset = self.build_entityset()
+
+		if self.parent_defs is None :
+			parent_name, _, _, _ = self.relationships[0]
+			self.parent_defs     = self.load_features_defs(parent_name)
+
+			if self.parent_defs is None :
+				self.parent_defs = ft.dfs(
+					entityset             = entityset,
+					target_dataframe_name = parent_name,
+					features_only         = True,
+				)
+				self.save_features_defs(parent_name, self.parent_defs)
+
+		features_defs = [
+			feature for feature in self.parent_defs
+			if max_feature_depth is None or feature.get_depth() <= max_feature_depth
+		]
+		names = [feature.get_name() for feature in features_defs]
+
+		if self.parent_features is None or not set(names) <= set(self.parent_features.columns) :
+			self.parent_features = ft.calculate_feature_matrix(features = features_defs, entityset = entityset)
+
+		return (self.parent_features[names], features_defs)
+
+
 	def run_dfs(self, target_name : str = "customers") :
 		"""
 			A minimal input to DFS is a dictionary of DataFrames, a list of relationships, and 
 			the name of the target DataFrame whose features we want to calculate. The ouput of 
 			DFS is a feature matrix and the corresponding list of feature definitions.
+
+			The EntitySet is built once and the parent (customers) aggregates are computed once :
+			the child (loans) matrix is its own & transform features, joined (index-aligned on the
+			foreign key) with the parent features up to depth 1, instead of a second full DFS.
+			Feature definitions are saved after the first DFS planning and reused while the input
+			column schema does not change : later runs only calculate the feature matrix.
 		"""
 
 		try :
 
+			entityset = self.build_entityset()
+			parent_name, _, child_name, child_fk = self.relationships[0]
+
+			if target_name == parent_name :
+				feature_matrix, features_defs = self.run_parent_dfs()
+
+			else :
+				parent_matrix, parent_defs = self.run_parent_dfs(max_feature_depth = 1)
+				features_defs = self.load_features_defs(target_name)
+
+				if features_defs is None :
+					# Own & transform features of the child, then parent features (depth <= 1) as direct features
+					features_defs = ft.dfs(
+					    entityset             = entityset,
+					    target_dataframe_name = target_name,
+					    ignore_dataframes     = [parent_name],
+					    features_only         = True,
+					)
+					features_defs += [DirectFeature(feature, child_name, relationship = entityset.relationships[0]) for feature in parent_defs]
+					self.save_features_defs(target_name, features_defs)
+
+				# 1. Own & transform features of the child only
+				own_defs       = [feature for feature in features_defs if not isinstance(feature, DirectFeature)]
+				direct_defs    = [feature for feature in features_defs if isinstance(feature, DirectFeature)]
+				feature_matrix = ft.calculate_feature_matrix(features = own_defs, entityset = entityset)
+
+				# 2. Parent features joined (index-aligned) on the foreign key
+				direct_df    = parent_matrix[[feature.base_features[0].get_name() for feature in direct_defs]]
+				direct_df    = direct_df.reindex(entityset[child_name][child_fk].values)
+				direct_df.index   = feature_matrix.index
+				direct_df.columns = [feature.get_name() for feature in direct_defs]
+
+				feature_matrix = pd.concat([feature_matrix, direct_df], axis = 1)
 
-			feature_matrix, features_defs = ft.dfs(
-			    dataframes            = self.dataframes,
-			    relationships         = self.relationships,
-			    target_dataframe_name = target_name,
-			)
+			self.feature_matrix, self.features_defs = feature_matrix, features_defs
 
 			#logger
 			self.mk1.logging.logger.info("(FeatureEngineer.run_dfs) DFS was sucessfully executed for all dataframes and relationships ✅")
@@ -143,6 +334,14 @@ class FeatureEngineer(object) :
 			raise e
 
 
+	def build_feature_matrix(self, target_name : str = "customers") :
+		"""Builds the feature matrix of the target dataframe with the configured engine"""
+		if self.engine == "native" :
+			return self.run_native(target_name = target_name)
+
+		return self.run_dfs(target_name = target_name)
+
+
 	def describe_feature(self, feature_idx : int) : 
 
 		feature = self.features_defs[feature_idx]
@@ -150,6 +349,151 @@ class FeatureEngineer(object) :
 		ft.graph_feature(feature)
 
 
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#     Native Engine     #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def run_native(self, target_name : str = "customers") :
+		"""
+			Column-for-column equivalent of `run_dfs` (default primitives, depth 2) for the single
+			parent -> child relationship, computed with one grouped pass over the child dataframe
+			instead of building an EntitySet. The output is a feature matrix and the list of
+			feature names.
+		"""
+		try :
+
+			parent_name, parent_pk, child_name, child_fk = self.relationships[0]
+			parent_df = self.native_typed_dataframe(*self.dataframes[parent_name])
+			child_df  = self.native_typed_dataframe(*self.dataframes[child_name])
+			child_df[child_fk] = pd.to_numeric(child_df[child_fk])
+
+			# 1. Aggregations of the child rows per parent (depth 1 & depth 2)
+			parent_features_df, depth_2_names = self.native_aggregate(parent_df, child_df, child_name, child_fk)
+
+			# 2. Target : parent -> its own & aggregated features, child -> own, transform & parent features
+			if target_name == parent_name :
+				feature_matrix = parent_features_df
+
+			else :
+				feature_matrix = self.native_child_features(child_df, child_fk)
+				direct_df      = parent_features_df.drop(columns = depth_2_names)
+				direct_df      = direct_df.reindex(child_df[child_fk].values)
+				direct_df.index   = feature_matrix.index
+				direct_df.columns = ["{}.{}".format(parent_name, col) for col in direct_df.columns]
+				feature_matrix    = pd.concat([feature_matrix, direct_df], axis = 1)
+
+			#logger
+			self.mk1.logging.logger.info("(FeatureEngineer.run_native) Native aggregation engine was sucessfully executed for '{}' ✅".format(target_name))
+			return (feature_matrix, list(feature_matrix.columns))
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(FeatureEngineer.run_native) Native aggregation engine execution failed  : {}".format(e))
+			raise e
+
+
+	def native_typed_dataframe(self, df : pd.DataFrame, pk : str) -> pd.DataFrame :
+		"""Indexes the dataframe by its (numeric) primary key & casts numeric-like columns, like woodwork does"""
+		df = df.copy()
+		df[pk] = pd.to_numeric(df[pk])
+		df     = df.set_index(pk, drop = True)
+
+		for col in df.columns :
+			if df[col].dtype == object and col not in self.categorical_columns :
+				df[col] = pd.to_numeric(df[col])
+			elif col in self.categorical_columns :
+				df[col] = df[col].astype("category")
+
+		return df
+
+
+	def native_aggregate(self,
+						 parent_df  : pd.DataFrame,
+						 child_df   : pd.DataFrame,
+						 child_name : str,
+						 child_fk   : str) :
+		"""Default DFS aggregation primitives, over the child columns & the child datetime transforms"""
+		index      = parent_df.index
+		grouped    = child_df.groupby(child_fk, sort = False)
+		numeric    = [col for col in child_df.columns if col != child_fk and pd.api.types.is_numeric_dtype(child_df[col])]
+		categorial = [col for col in child_df.columns if isinstance(child_df[col].dtype, pd.CategoricalDtype)]
+		datetimes  = [col for col in child_df.columns if pd.api.types.is_datetime64_any_dtype(child_df[col])]
+
+		depth_1 = {}
+		depth_2 = {}
+
+		# COUNT
+		depth_1["COUNT({})".format(child_name)] = grouped.size().reindex(index, fill_value = 0).astype("Int64")
+
+		# MAX, MEAN, MIN, SKEW, STD, SUM over numeric columns
+		aggs = grouped[numeric].agg([primitive.lower() for primitive in self.native_agg_primitives])
+		for col in numeric :
+			for primitive in self.native_agg_primitives :
+				values = aggs[(col, primitive.lower())].reindex(index).astype("float64")
+				if primitive == "SUM" :
+					values = values.fillna(0.0)
+				depth_1["{}({}.{})".format(primitive, child_name, col)] = values
+
+		# MODE, NUM_UNIQUE over categorical columns (depth 1) & datetime transforms (depth 2)
+		for col in categorial :
+			depth_1.update(self.native_mode_num_unique(child_df[col], child_df[child_fk], index, "{}.{}".format(child_name, col)))
+
+		for col in datetimes :
+			for trans_name in self.native_trans_primitives :
+				values = self.native_transform(child_df[col], trans_name)
+				depth_2.update(self.native_mode_num_unique(values, child_df[child_fk], index, "{}.{}({})".format(child_name, trans_name, col)))
+
+		features_df = pd.concat(
+			[parent_df] + [depth_1[name].rename(name) for name in sorted(depth_1)] + [depth_2[name].rename(name) for name in sorted(depth_2)],
+			axis = 1
+		)
+		features_df.index.name = parent_df.index.name
+
+		return (features_df, sorted(depth_2))
+
+
+	def native_mode_num_unique(self,
+							   values     : pd.Series,
+							   keys       : pd.Series,
+							   index      : pd.Index,
+							   input_name : str) -> Dict[str, pd.Series] :
+		"""MODE (smallest of the most frequent values, like `Series.mode`) & NUM_UNIQUE per key"""
+		counts = pd.DataFrame({"key" : keys.values, "value" : values.values}).value_counts(sort = False).reset_index(name = "n")
+		counts = counts[counts["n"] > 0]
+
+		mode = counts.sort_values(["key", "n", "value"], ascending = [True, False, True]).drop_duplicates("key")
+		mode = mode.set_index("key")["value"].reindex(index)
+		mode = mode.astype(values.dtype)
+
+		num_unique = counts.groupby("key").size().reindex(index).astype("Int64")
+
+		return {
+			"MODE({})".format(input_name)       : mode,
+			"NUM_UNIQUE({})".format(input_name) : num_unique,
+		}
+
+
+	def native_transform(self, dates : pd.Series, trans_name : str) -> pd.Series :
+		"""DAY, MONTH, WEEKDAY, YEAR as ordinal categoricals"""
+		accessor, categories = self.native_trans_primitives[trans_name]
+		values = getattr(dates.dt, accessor).astype("int64")
+
+		return values.astype(pd.CategoricalDtype(pd.Index(categories, dtype = "int64"), ordered = True))
+
+
+	def native_child_features(self, child_df : pd.DataFrame, child_fk : str) -> pd.DataFrame :
+		"""Own (non-datetime) columns & datetime transforms of the child dataframe"""
+		datetimes   = [col for col in child_df.columns if pd.api.types.is_datetime64_any_dtype(child_df[col])]
+		features_df = child_df.drop(columns = datetimes)
+
+		transforms = {}
+		for col in datetimes :
+			for trans_name in self.native_trans_primitives :
+				transforms["{}({})".format(trans_name, col)] = self.native_transform(child_df[col], trans_name)
+
+		return pd.concat([features_df] + [transforms[name].rename(name) for name in sorted(transforms)], axis = 1)
+
+
+
 	#*-*-*-*-*-*-*-*-*-*-*-*-*-*#
 	#     Manual Extraction     #
 	#*-*-*-*-*-*-*-*-*-*-*-*-*-*#
@@ -176,11 +520,18 @@ class FeatureEngineer(object) :
 			raise e
 
 
-	def extract_features_customers(self, customers_df : pd.DataFrame) : 
-
+	def extract_features_customers(self,
+								   customers_df : pd.DataFrame,
+								   income_range : Optional[Tuple[float, float]] = None) : 
+		"""
+			:param: `income_range` - (min, max) of `annual_income` over all the customers, when
+			                         `customers_df` is only a subset of them
+		"""
 		# 1. `annual income` binning
-		min_value = float(customers_df["annual_income"].min())
-		max_value = float(customers_df["annual_income"].max())
+		if income_range is None :
+			income_range = (float(customers_df["annual_income"].min()), float(customers_df["annual_income"].max()))
+
+		min_value, max_value = income_range
 		bins      = np.linspace(min_value, max_value, 6)
 		labels    = ['very low', 'low', 'middle', 'high', 'very high']
 		customers_df['annual_income_bins'] = pd.cut(customers_df['annual_income'], bins = bins, labels = labels, include_lowest = True)
@@ -0,0 +1,222 @@
+import time
+import queue
+import threading
+import multiprocessing
+import datetime as dt
+from uuid               import uuid4
+from collections        import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing             import Any, Callable, Dict, Optional
+
+
+# Project modules
+from src.markI            import MkI
+from src.config           import Config
+from src.models           import Ontology, JobStatus, JobStage
+from src.executors        import Executors
+from src.feature_pipeline import build_features
+
+
+
+class FeatureJob(object) :
+	"""A single asynchronous feature build, with per-stage progress"""
+	def __init__(self, ontology : Ontology, version : Any = None):
+
+		self.job_id      = str(uuid4())
+		self.ontology    = Ontology(ontology)
+		self.version     = version
+		self.status      = JobStatus.queued
+		self.stage       = None
+		self.created_at  = dt.datetime.now()
+		self.finished_at = None
+		self.error       = None
+		self.result      = None
+
+		self.stages = OrderedDict(
+			(stage, {"status" : "pending", "seconds" : None}) for stage in JobStage
+		)
+		self.stage_started = None
+
+
+	def set_stage(self, stage : JobStage) -> None :
+		"""Closes the running stage (if any) and opens the next one"""
+		self.close_stage()
+		self.stage         = JobStage(stage)
+		self.stage_started = time.perf_counter()
+		self.stages[self.stage]["status"] = "running"
+
+
+	def close_stage(self) -> None :
+
+		if self.stage is not None and self.stages[self.stage]["status"] == "running" :
+			self.stages[self.stage]["status"]  = "done"
+			self.stages[self.stage]["seconds"] = time.perf_counter() - self.stage_started
+
+
+	def is_finished(self) -> bool :
+		return self.status in (JobStatus.done, JobStatus.failed)
+
+
+	def to_dict(self) -> Dict[str, Any] :
+
+		num_done = sum(1 for stage in self.stages.values() if stage["status"] == "done")
+
+		return {
+			"job_id"      : self.job_id,
+			"ontology"    : self.ontology.value,
+			"status"      : self.status.value,
+			"stage"       : self.stage.value if self.stage is not None else None,
+			"progress"    : num_done / len(self.stages),
+			"stages"      : {stage.value : info for stage, info in self.stages.items()},
+			"created_at"  : self.created_at.isoformat(),
+			"finished_at" : self.finished_at.isoformat() if self.finished_at is not None else None,
+			"error"       : self.error,
+		}
+
+
+
+class FeatureJobs(object) :
+	"""
+		Asynchronous feature builds with a bounded queue : the pipeline of each job runs in the shared
+		process pool (`Executors`), the local job threads only wait for it & follow its stages. Finished
+		jobs are kept (with their result) under a retention limit.
+	"""
+	# seconds between two checks of a running job
+	poll_interval = 0.1
+
+
+	def __init__(self, mk1 : MkI, config : Config, executors : Executors):
+		# system design
+		self.mk1       = mk1
+		self.config    = config
+		self.executors = executors
+
+		# jobs
+		self.job_workers    = int(config.get("jobs","job_workers"))
+		self.job_queue_size = int(config.get("jobs","job_queue_size"))
+		self.job_retention  = int(config.get("jobs","job_retention"))
+
+		self.jobs        = OrderedDict()
+		self.num_pending = 0
+		self.lock        = threading.Lock()
+		self._pool       = None
+		self._manager    = None
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#          Jobs         #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def submit(self,
+			   ontology : Ontology,
+			   version       : Any = None,
+			   on_done       : Optional[Callable[[FeatureJob], None]] = None,
+			   features_path : Optional[str] = None
+			   ) -> Optional[FeatureJob] :
+		"""
+			Queues a feature build for the target ontology
+
+			:param: `on_done` - optional callback, invoked with the job (and its result) once its build succeeded, before it is marked done
+			:param: `features_path` - optional features file the pipeline stores the matrix to (see `build_features`)
+			:returns: the queued job, or None if the queue is full
+		"""
+		with self.lock :
+
+			if self.num_pending >= self.job_queue_size :
+				self.mk1.logging.logger.error("(FeatureJobs.submit) Job queue is full ({} pending jobs)".format(self.num_pending))
+				return None
+
+			if self._pool is None :
+				self._pool = ThreadPoolExecutor(max_workers = self.job_workers, thread_name_prefix = "job")
+
+			# the stages of the jobs are sent back from the process pool through queues of a manager process
+			if self._manager is None :
+				self._manager = multiprocessing.get_context(self.executors.process_start_method).Manager()
+			stages = self._manager.Queue()
+
+			job                    = FeatureJob(ontology, version)
+			self.jobs[job.job_id]  = job
+			self.num_pending      += 1
+			self.enforce_retention()
+
+		self._pool.submit(self.run, job, stages, on_done, features_path)
+		self.mk1.logging.logger.info("(FeatureJobs.submit) Job {} for '{}' was queued ✅".format(job.job_id, job.ontology.value))
+		return job
+
+
+	def get(self, job_id : str) -> Optional[FeatureJob] :
+
+		with self.lock :
+			return self.jobs.get(job_id)
+
+
+	def run(self, job : FeatureJob, stages : Any, on_done : Optional[Callable[[FeatureJob], None]] = None, features_path : Optional[str] = None) -> None :
+
+		job.status = JobStatus.running
+
+		try :
+			future = self.executors.process_pool.submit(build_features, job.ontology.value, stages, features_path)
+
+			# stages are reported while the pipeline runs, then the ones sent right before it finished
+			while not future.done() :
+				try :
+					job.set_stage(stages.get(timeout = self.poll_interval))
+				except queue.Empty :
+					pass
+			while not stages.empty() :
+				job.set_stage(stages.get_nowait())
+
+			result = future.result()
+			job.close_stage()
+
+		except Exception as e:
+			self.finish(job, JobStatus.failed, error = str(e))
+			self.mk1.logging.logger.error("(FeatureJobs.run) Job {} for '{}' failed : {}".format(job.job_id, job.ontology.value, e))
+			return
+
+		# a failing callback (e.g. caching the result) does not fail a successful build
+		if on_done is not None :
+			job.result = result
+			try :
+				on_done(job)
+			except Exception as e:
+				self.mk1.logging.logger.error("(FeatureJobs.run) Callback of job {} for '{}' failed : {}".format(job.job_id, job.ontology.value, e))
+
+		self.finish(job, JobStatus.done, result = result)
+
+		#logger
+		self.mk1.logging.logger.info("(FeatureJobs.run) Job {} for '{}' finished sucessfully ✅".format(job.job_id, job.ontology.value))
+
+
+	def finish(self, job : FeatureJob, status : JobStatus, result : Any = None, error : Optional[str] = None) -> None :
+		"""Publishes the outcome of a job at once : pollers never see a finished job without its end time or result"""
+		with self.lock :
+			job.result, job.error = result, error
+			job.finished_at       = dt.datetime.now()
+			job.status            = status
+			self.num_pending     -= 1
+			self.enforce_retention()
+
+
+	def enforce_retention(self) -> None :
+		"""Drops the oldest finished jobs (and their results) beyond the retention limit (lock must be held)"""
+		finished = [job_id for job_id, job in self.jobs.items() if job.is_finished()]
+
+		for job_id in finished[: max(0, len(finished) - self.job_retention)] :
+			del self.jobs[job_id]
+
+
+	def shutdown(self, wait : bool = True) -> None :
+
+		# the job threads take the lock when they finish : the pools are shut down outside of it
+		with self.lock :
+			pool, manager = self._pool, self._manager
+			self._pool, self._manager = None, None
+
+		if pool is not None :
+			pool.shutdown(wait = wait, cancel_futures = True)
+
+		if manager is not None :
+			manager.shutdown()
+
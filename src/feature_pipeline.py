@@ -0,0 +1,220 @@
+import pandas as pd
+from typing import Any, Callable, List, Optional, Tuple
+
+
+# Project modules
+from src.markI               import MkI
+from src.config              import Config
+from src.models              import Ontology, JobStage
+from src.data_loading        import DataLoader
+from src.feature_engineering import FeatureEngineer
+
+
+
+class FeaturePipeline(object) :
+	"""
+		Per-ontology feature pipeline : loading, preprocessing, manual extraction, DFS & storage.
+		Only the DFS, storage and serialization of the requested ontology are executed.
+	"""
+	def __init__(self, mk1 : MkI, config : Config):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		self.data_loader      = DataLoader(mk1, config)
+		self.feature_engineer = FeatureEngineer(mk1, config)
+
+		# ontology -> features file
+		self.features_paths = {
+			Ontology.customers : self.feature_engineer.features_paths["features_customers"],
+			Ontology.loans     : self.feature_engineer.features_paths["features_loans"],
+		}
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#         Stages        #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def load_data(self) -> Tuple[pd.DataFrame, pd.DataFrame] :
+		"""Data Loading (local db, or json file if the local db is empty)"""
+		return self.data_loader.load_data()
+
+
+	def preprocess_data(self,
+						customers_df : pd.DataFrame,
+						loans_df     : pd.DataFrame
+						) -> Tuple[pd.DataFrame, pd.DataFrame] :
+		"""Data Preprocessing & Postprocessing (datatypes)"""
+		customers_df, loans_df = self.data_loader.preprocess_data(customers_df, loans_df)
+		loans_df               = self.data_loader.postprocess_loans_dataframe(loans_df)
+
+		return (customers_df, loans_df)
+
+
+	def load_entities_data(self,
+						   ontology : Ontology,
+						   ids      : List[int]
+						   ) -> Tuple[pd.DataFrame, pd.DataFrame, Tuple[float, float]] :
+		"""
+			Data Loading & Preprocessing restricted to the requested entities : their customers and all
+			the loans of these customers (so that the aggregates are complete), with the global
+			`annual_income` range. The local db is queried for these rows only.
+		"""
+		if not self.data_loader.check_if_local_db_empty("customers") :
+			key = "loan_ids" if Ontology(ontology) == Ontology.loans else "customer_ids"
+			customers_df, loans_df = self.data_loader.load_entities_from_local_db(**{key : ids})
+			income_range           = self.data_loader.load_income_range_from_local_db()
+
+			if customers_df.empty or loans_df.empty :
+				return (None, None, income_range)
+
+			customers_df, loans_df = self.preprocess_data(customers_df, loans_df)
+
+		else :
+			# loan ids are the positions of the loans in the json file, so it is read as a whole
+			customers_df, loans_df = self.preprocess_data(*self.load_data())
+			income_range           = (float(customers_df["annual_income"].min()), float(customers_df["annual_income"].max()))
+
+		if Ontology(ontology) == Ontology.loans :
+			customer_ids = pd.to_numeric(loans_df.loc[pd.to_numeric(loans_df["loan_id"]).isin(ids), "customer_id"]).unique()
+		else :
+			customer_ids = ids
+
+		customers_df = customers_df[pd.to_numeric(customers_df["customer_id"]).isin(customer_ids)].copy()
+		loans_df     = loans_df[pd.to_numeric(loans_df["customer_id"]).isin(customer_ids)].copy()
+
+		return (customers_df, loans_df, income_range)
+
+
+	def extract_features(self,
+						 customers_df : pd.DataFrame,
+						 loans_df     : pd.DataFrame,
+						 income_range : Optional[Tuple[float, float]] = None
+						 ) -> Tuple[pd.DataFrame, pd.DataFrame] :
+		"""Manual extraction of features for both loans and customers"""
+		loans_df     = self.feature_engineer.extract_features_loans(loans_df)
+		customers_df = self.feature_engineer.extract_features_customers(customers_df, income_range = income_range)
+
+		return (customers_df, loans_df)
+
+
+	def run_dfs(self,
+				ontology     : Ontology,
+				customers_df : pd.DataFrame,
+				loans_df     : pd.DataFrame
+				) -> pd.DataFrame :
+		"""Use "featuretools" (or the native engine) to extract extra features, only for the target ontology"""
+		self.feature_engineer.add_dataframe("customers", customers_df, "customer_id")
+		self.feature_engineer.add_dataframe("loans", loans_df, "loan_id")
+		self.feature_engineer.add_relationship("customers", "customer_id", "loans", "customer_id")
+
+		features_df, _ = self.feature_engineer.build_feature_matrix(target_name = Ontology(ontology).value)
+		return features_df
+
+
+	def store_features(self, ontology : Ontology, features_df : pd.DataFrame) -> None :
+		"""Store features of the target ontology as a ".csv" file"""
+		self.feature_engineer.store_features(
+				features_df = features_df,
+				fn_path     = self.features_paths[Ontology(ontology)]
+		)
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#        General        #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def run(self,
+			ontology : Ontology,
+			on_stage : Optional[Callable[[JobStage], None]] = None
+			) -> pd.DataFrame :
+		"""
+			Runs all the stages for the target ontology
+
+			:param: `on_stage` - optional callback, invoked with each stage right before it starts
+		"""
+		on_stage = on_stage or (lambda stage : None)
+
+		try :
+			on_stage(JobStage.load)
+			customers_df, loans_df = self.load_data()
+
+			on_stage(JobStage.preprocess)
+			customers_df, loans_df = self.preprocess_data(customers_df, loans_df)
+
+			on_stage(JobStage.extract)
+			customers_df, loans_df = self.extract_features(customers_df, loans_df)
+
+			on_stage(JobStage.dfs)
+			features_df = self.run_dfs(ontology, customers_df, loans_df)
+
+			on_stage(JobStage.store)
+			self.store_features(ontology, features_df)
+
+			#logger
+			self.mk1.logging.logger.info("(FeaturePipeline.run) Features of '{}' were built sucessfully ✅".format(Ontology(ontology).value))
+			return features_df
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(FeaturePipeline.run) Building features of '{}' failed : {}".format(Ontology(ontology).value, e))
+			raise e
+
+
+
+	def run_entities(self, ontology : Ontology, ids : List[int]) -> pd.DataFrame :
+		"""
+			Features of the requested entities only (in the requested order, unknown ids are skipped) :
+			the DFS runs on their customers & loans rows instead of the whole portfolio, nothing is stored
+		"""
+		try :
+			customers_df, loans_df, income_range = self.load_entities_data(ontology, ids)
+
+			if customers_df is None or customers_df.empty :
+				return pd.DataFrame()
+
+			customers_df, loans_df = self.extract_features(customers_df, loans_df, income_range = income_range)
+			features_df            = self.run_dfs(ontology, customers_df, loans_df)
+
+			found = set(features_df.index)
+			return features_df.loc[[entity_id for entity_id in dict.fromkeys(ids) if entity_id in found]]
+
+		except Exception as e:
+			self.mk1.logging.logger.error("(FeaturePipeline.run_entities) Building features of '{}' {} failed : {}".format(Ontology(ontology).value, ids, e))
+			raise e
+
+
+
+def build_features(ontology : str, stages : Optional[Any] = None, features_path : Optional[str] = None) -> pd.DataFrame :
+	"""
+		Entry point of the process pool workers : each worker process keeps its own MkI singleton
+
+		:param: `stages` - optional queue (shared with the API process) receiving each stage right before it starts
+		:param: `features_path` - optional features file, instead of the one of "config.ini"
+	"""
+	mk1    = MkI.get_instance(_logging = True, _dataset = True)
+	config = Config().parser
+
+	pipeline = FeaturePipeline(mk1, config)
+	if features_path is not None :
+		pipeline.features_paths[Ontology(ontology)] = features_path
+
+	on_stage = (lambda stage : stages.put(JobStage(stage).value)) if stages is not None else None
+	return pipeline.run(Ontology(ontology), on_stage = on_stage)
+
+
+def build_entity_features(ontology : str, ids : List[int]) -> pd.DataFrame :
+	"""Entry point of the process pool workers, for the per-entity features"""
+	mk1    = MkI.get_instance(_logging = True, _dataset = True)
+	config = Config().parser
+
+	return FeaturePipeline(mk1, config).run_entities(Ontology(ontology), ids)
+
+
+def preload_features_defs() -> None :
+	"""Initializer of the process pool workers (& app startup) : reads the saved feature definitions once"""
+	mk1    = MkI.get_instance(_logging = True, _dataset = True)
+	config = Config().parser
+
+	FeatureEngineer(mk1, config).preload_features_defs()
@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+import datetime as dt
+from typing import Any, Dict, Optional, Tuple
+
+
+# Project modules
+from src.markI  import MkI
+from src.config import Config
+from src.models import Ontology
+
+
+
+class HealthMonitor(object) :
+	"""
+		Liveness & readiness facts of the API. Everything here is cached or read from file metadata,
+		so the probes never trigger a feature computation.
+	"""
+	def __init__(self, mk1 : MkI, config : Config):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		# health
+		self.started_at        = dt.datetime.now()
+		self.db_check_interval = float(config.get("health","db_check_interval"))
+		self.features_max_age  = float(config.get("health","features_max_age"))
+		self.features_paths    = {
+			Ontology.customers : str(config.get("features","features_customers_path")),
+			Ontology.loans     : str(config.get("features","features_loans_path")),
+		}
+
+		self.db_ok         = None
+		self.db_checked_at = None
+		self.last_builds   = {}
+		self.lock          = threading.Lock()
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#         Facts         #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def record_build(self, ontology : Ontology, seconds : float) -> None :
+		"""Records the timestamp & duration of the last successful feature build of an ontology"""
+		with self.lock :
+			self.last_builds[Ontology(ontology)] = {
+				"finished_at" : dt.datetime.now().isoformat(),
+				"seconds"     : seconds,
+			}
+
+
+	def check_db(self) -> bool :
+		"""DB connectivity (`SELECT 1`), re-checked at most once every `db_check_interval` seconds"""
+		now = time.monotonic()
+
+		if self.db_checked_at is None or now - self.db_checked_at >= self.db_check_interval :
+			self.db_ok         = self.mk1.dataset.db_query(query_str = "SELECT 1", read_only = True) is not None
+			self.db_checked_at = now
+
+		return self.db_ok
+
+
+	def features_files_age(self) -> Dict[str, Optional[float]] :
+		"""Age (in seconds) of every features file, None if it does not exist"""
+		ages = {}
+		for ontology, fn_path in self.features_paths.items() :
+			try :
+				ages[ontology.value] = time.time() - os.path.getmtime(fn_path)
+			except OSError :
+				ages[ontology.value] = None
+
+		return ages
+
+
+
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+	#         Probes        #
+	#*-*-*-*-*-*-*-*-*-*-*-*#
+
+	def liveness(self) -> Dict[str, Any] :
+		return {
+			"status"     : "UP",
+			"started_at" : self.started_at.isoformat(),
+		}
+
+
+	def readiness(self) -> Tuple[bool, Dict[str, Any]] :
+		"""
+			Ready when the DB is reachable & every features file exists (and is not older than `features_max_age`, if set).
+			The facts name the failing checks (`db`, `features_files_age`)
+		"""
+		db_ok = self.check_db()
+		ages  = self.features_files_age()
+
+		features_ok = all(
+			age is not None and (self.features_max_age <= 0 or age <= self.features_max_age)
+			for age in ages.values()
+		)
+
+		with self.lock :
+			last_builds = {ontology.value : build for ontology, build in self.last_builds.items()}
+
+		failing = [name for name, ok in [("db", bool(db_ok)), ("features_files_age", features_ok)] if not ok]
+		return (not failing, {
+			"status"             : "UP" if not failing else "DOWN",
+			"db"                 : db_ok,
+			"features_files_age" : ages,
+			"last_builds"        : last_builds,
+			"failing"            : failing,
+		})
+
@@ -1,26 +1,41 @@
 import os
 import json
+import time
+import itertools
 import numpy    as np
 import pandas   as pd
 import datetime as dt
 from uuid            import UUID, uuid4
 from dateutil        import parser
-from typing          import Optional, List, Dict, Any
+from typing          import Optional, List, Dict, Any, Iterator
+from contextlib      import asynccontextmanager
 from IPython.display import display
 
 ## API modules
-from fastapi            import FastAPI, HTTPException, status
-from fastapi.testclient import TestClient
+from fastapi            import FastAPI, HTTPException, Header, Query, Request, status
+from fastapi.responses  import JSONResponse, Response
+from sqlalchemy.exc      import SQLAlchemyError
 import docker
 
 ## Project modules
 
-from src.models              import Customer, LoanStatus, Term, Customer, Loan, CustomerUpdateRequest
+from src.models              import Customer, LoanStatus, Term, Customer, Loan, CustomerUpdateRequest, Ontology, JobStatus
 from src.markI               import MkI
 from src.config              import Config
 from src.data_loading        import DataLoader
 from src.data_reporting      import DataReporter
 from src.feature_engineering import FeatureEngineer
+from src.feature_cache       import FeatureCache
+from src.feature_pipeline    import FeaturePipeline, build_features, build_entity_features, preload_features_defs
+from src.executors           import Executors
+from src.feature_jobs        import FeatureJobs, FeatureJob
+from src.single_flight       import SingleFlight
+from src.health              import HealthMonitor
+from src.query_plans         import QueryPlanner
+from src.statements          import Statements
+from src.compression         import Compressor
+from src.aggregates          import AggregateStore
+from src.responses           import rows_response, dataframe_response, dataframe_to_json, json_response, negotiate, entity_tag, etag_matches, not_modified_response
 
 ## Testing db
 from db.db import db
@@ -31,10 +46,36 @@ from db.db import db
 # print(container.id)
 
 
-app    = FastAPI()
-client = TestClient(app)
-mk1    = MkI.get_instance(_logging = True, _dataset = True)
-config = Config().parser
+mk1           = MkI.get_instance(_logging = True, _dataset = True)
+config        = Config().parser
+feature_cache = FeatureCache(mk1, config)
+executors     = Executors(mk1, config, initializer = preload_features_defs)
+feature_jobs  = FeatureJobs(mk1, config, executors)
+single_flight = SingleFlight(mk1, config)
+health        = HealthMonitor(mk1, config)
+query_planner = QueryPlanner(mk1, config)
+statements    = Statements(mk1, config)
+compressor    = Compressor(mk1, config)
+aggregates    = AggregateStore(mk1, config, executors)
+pipeline      = FeaturePipeline(mk1, config)
+
+# formats of the feature matrices & of the listed rows ("Accept" header, JSON by default)
+FEATURES_FORMATS    = ["json", "csv", "arrow", "parquet"]
+ROWS_FORMATS        = ["json", "ndjson", "csv", "arrow", "parquet"]
+features_batch_rows = int(config.get("features","features_batch_rows"))
+
+
+@asynccontextmanager
+async def lifespan(app : FastAPI):
+	# Saved feature definitions are read once at startup (and by every process pool worker)
+	preload_features_defs()
+	yield
+	# Shut down the job workers, process & thread pools cleanly
+	feature_jobs.shutdown()
+	executors.shutdown()
+
+
+app           = FastAPI(lifespan = lifespan)
 
 
 # db : List[Customer] = []
@@ -60,86 +101,307 @@ async def root():
 #*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
 
 
+@app.get("/healthz")
+async def fetch_liveness():
+	"""Liveness : the process is up (no I/O at all)"""
+	return health.liveness()
+
+
+@app.get("/readyz")
+async def fetch_readiness():
+	"""Readiness : cached DB connectivity, last successful feature builds & age of the features files"""
+	ready, facts = await executors.run_io(health.readiness)
+	return JSONResponse(
+			content     = facts,
+			status_code = status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+	)
+
+
 @app.get("/api/v1/api_status")
 async def fetch_api_status():
 
-	# Check endpoints : "Customers Features", "Loans Features"
-	response_customers = client.get("/api/v1/features/customers")
-	response_loans     = client.get("/api/v1/features/loans")
-
-	try : 
-		assert response_customers.status_code == 200
-		assert response_loans.status_code == 200
-		return json.dumps({"status" : "UP"})
-	except Exception as e:
-		return json.dumps({"status" : "DOWN"})
+	# Readiness facts only : never runs the feature endpoints
+	ready, _ = await executors.run_io(health.readiness)
+	return {"status" : "UP" if ready else "DOWN"}
 
 
 
 @app.get("/api/v1/features/{ontology}")
-async def fetch_features(ontology : str):
-	"""Choose the ontology for which features will be fetched {customers, loans}"""
+async def fetch_features(request         : Request,
+						 ontology        : Ontology,
+						 ids             : Optional[str] = None,
+						 accept          : Optional[str] = Header(None),
+						 accept_encoding : Optional[str] = Header(None),
+						 if_none_match   : Optional[str] = Header(None)):
+	"""
+		Choose the ontology for which features will be fetched {customers, loans}
+		(`?ids=1090,3565` : only the features of these customers / loans)
+		as JSON, or CSV / Arrow IPC stream / Parquet with the "Accept" header,
+		compressed (gzip, zstd) with the "Accept-Encoding" header
+	"""
+	fmt      = negotiate(accept, FEATURES_FORMATS)
+	encoding = compressor.negotiate(accept_encoding)
+
+	# Conditional GET : an unchanged data version needs neither the cache nor a build
+	version = feature_cache.data_version()
+	headers = representation_headers(request, fmt, encoding)
+	if etag_matches(if_none_match, headers["ETag"]) :
+		return not_modified_response(headers)
+
+	if ids is not None :
+		return await features_response(await fetch_entities_features(ontology, parse_ids(ids)), fmt, encoding, headers, index = True)
+
+	# Feature Cache : serve the stored matrix if the data have not changed since it was built
+	features_df = feature_cache.get(ontology.value, version)
+	if features_df is None :
+		# Single Flight : concurrent requests for the same ontology & data version share one build
+		features_df = await single_flight.do(
+				(ontology.value, version),
+				lambda : build_features_matrix(ontology, version)
+		)
 
-	# Data Loading & Preprocessing
-	data_loader  = DataLoader(mk1, config)
-	customers_df, loans_df = data_loader.load_data()
-	customers_df, loans_df = data_loader.preprocess_data(customers_df, loans_df)
-	loans_df               = data_loader.postprocess_loans_dataframe(loans_df)
+	if fmt != "json" :
+		return await features_response(features_df, fmt, encoding, headers)
 
+	# JSON is encoded (& compressed) once per matrix & encoding, and kept alongside the matrix
+	body = feature_cache.get_body(ontology.value, version, ("json", encoding))
+	if body is None :
+		body = feature_cache.get_body(ontology.value, version, ("json", None))
+		if body is None :
+			body = await executors.run_io(dataframe_to_json, features_df)
+			feature_cache.put_body(ontology.value, version, ("json", None), body)
 
-	# ------------------- #
+		encoding = compressor.applicable(encoding, len(body))
+		if encoding is not None :
+			body = await executors.run_io(compressor.compress, body, encoding)
+			feature_cache.put_body(ontology.value, version, ("json", encoding), body)
 
-	# Feature Engineering
-	## 1. Extract features for both loans and customers
-	feature_engineer = FeatureEngineer(mk1, config)
-	loans_df         = feature_engineer.extract_features_loans(loans_df)
-	customers_df     = feature_engineer.extract_features_customers(customers_df)
+	return json_response(body, headers = {**compressor.headers(encoding), **headers})
 
 
-	
-	## 2. Create feature tools (dataframes, relationships)
-	feature_engineer.add_dataframe("customers", customers_df, "customer_id")
-	feature_engineer.add_dataframe("loans", loans_df, "loan_id")
-	feature_engineer.add_relationship("customers", "customer_id", "loans", "customer_id")
-	
+async def build_features_matrix(ontology : Ontology, version : tuple) -> pd.DataFrame :
 
-	## 3. Use "featuretools" to extract extra feature
-	loans_features_df, _     = feature_engineer.run_dfs(target_name = "loans")
-	customers_features_df, _ = feature_engineer.run_dfs(target_name = "customers")
-	
-	## 4. Store features as ".csv" file
-	feature_engineer.store_features(
-			features_df = loans_features_df,
-			fn_path     = feature_engineer.features_paths["features_loans"] 
-	)
+	# Customers : materialized aggregates, maintained on every write to the local db (None if unavailable). A full
+	# rebuild runs in the process pool, the thread only waits for it & serves the running state
+	start       = time.perf_counter()
+	features_df = await executors.run_io(aggregates.feature_matrix) if ontology == Ontology.customers else None
+	if features_df is not None :
+		# stored like the Feature Pipeline stores its matrix (all the builds store to `pipeline.features_paths`)
+		await executors.run_io(pipeline.store_features, ontology, features_df)
 
-	feature_engineer.store_features(
-			features_df = customers_features_df,
-			fn_path     = feature_engineer.features_paths["features_customers"]
-	)
+	# Feature Pipeline : load, preprocess, extract, DFS & store only the requested ontology (process pool)
+	if features_df is None :
+		features_df = await executors.run_cpu(build_features, ontology.value, features_path = pipeline.features_paths[ontology])
+	health.record_build(ontology, time.perf_counter() - start)
+
+	# Cache the matrix (under the data version read before loading)
+	feature_cache.put(ontology.value, version, features_df, size = int(features_df.memory_usage(deep = True).sum()))
+
+	return features_df
+
+
+async def features_response(features_df : pd.DataFrame, fmt : str, encoding : Optional[str], headers : Dict[str, str], index : bool = False) -> Response :
+
+	if fmt == "json" :
+		body     = await executors.run_io(dataframe_to_json, features_df, index = index)
+		encoding = compressor.applicable(encoding, len(body))
+		if encoding is not None :
+			body = await executors.run_io(compressor.compress, body, encoding)
+		return json_response(body, headers = {**compressor.headers(encoding), **headers})
+
+	return dataframe_response(features_df, fmt, features_batch_rows, **stream_encoding(encoding, headers))
+
+
+def stream_encoding(encoding : Optional[str], headers : Dict[str, str]) -> Dict[str, Any] :
+	"""Streamed bodies are compressed on the fly (their size is not known in advance)"""
+	return {
+		"encoder" : (lambda chunks : compressor.compress_stream(chunks, encoding)) if encoding is not None else None,
+		"headers" : {**compressor.headers(encoding), **headers},
+	}
+
+
+def representation_headers(request : Request, fmt : str, encoding : Optional[str]) -> Dict[str, str] :
+	"""
+		ETag & Vary headers of a negotiated response. The tag only depends on the shared data version (the same in
+		every worker), the path & query parameters, the format and the encoding : it is computed without reading any data
+	"""
+	etag = entity_tag(feature_cache.shared_data_version(), request.url.path, sorted(request.query_params.multi_items()), fmt, encoding)
+	return {"ETag" : etag, "Vary" : "Accept, Accept-Encoding"}
+
+
+@app.get("/api/v1/features/{ontology}/{entity_id}")
+async def fetch_entity_features(request         : Request,
+								ontology        : Ontology,
+								entity_id       : int,
+								accept          : Optional[str] = Header(None),
+								accept_encoding : Optional[str] = Header(None),
+								if_none_match   : Optional[str] = Header(None)):
+	"""Features of a single customer / loan, computed from its own rows only"""
+	fmt      = negotiate(accept, FEATURES_FORMATS)
+	encoding = compressor.negotiate(accept_encoding)
+
+	headers = representation_headers(request, fmt, encoding)
+	if etag_matches(if_none_match, headers["ETag"]) :
+		return not_modified_response(headers)
+
+	features_df = await fetch_entities_features(ontology, [entity_id])
+
+	if features_df.empty :
+		raise HTTPException(
+			status_code = 404,
+			detail      = f"{ontology.value.capitalize()[:-1]} with id : {entity_id} does not exist"
+		)
+
+	return await features_response(features_df, fmt, encoding, headers, index = True)
+
+
+def parse_ids(ids : str) -> List[int] :
+
+	try :
+		return [int(entity_id) for entity_id in ids.split(",") if entity_id.strip()]
+
+	except ValueError :
+		raise HTTPException(
+			status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+			detail      = f"ids must be a comma-separated list of integers, got : {ids}"
+		)
+
+
+async def list_statement(table_name : str, fields : Optional[str], after : Optional[int], limit : Optional[int], **filters) :
+	"""Named statement of a list endpoint (it reads the table columns : thread pool)"""
+	try :
+		fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+		return await executors.run_io(statements.listing, table_name, fields = fields, after = after, limit = limit, **filters)
+
+	except ValueError as e :
+		raise HTTPException(
+			status_code = status.HTTP_422_UNPROCESSABLE_ENTITY,
+			detail      = str(e)
+		)
+
+
+async def list_rows(name : str, params : Dict[str, Any]) -> Iterator[List[Dict[str, Any]]] :
+	"""
+		Batches of rows of a list statement, the first one fetched (thread pool) before the response starts : a
+		failing query is answered with an error status, instead of a 200 cut in the middle of the stream
+	"""
+	batches = mk1.dataset.db_iterate(name = name, params = params)
+
+	try :
+		first = await executors.run_io(next, batches, None)
+
+	except SQLAlchemyError as e :
+		mk1.logging.logger.error("(main.list_rows) Listing failed : {}".format(e))
+		raise HTTPException(
+			status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+			detail      = "Listing failed : {}".format(e.__class__.__name__)
+		)
+
+	return itertools.chain([first] if first is not None else [], batches)
+
+
+async def fetch_entities_features(ontology : Ontology, ids : List[int]) -> pd.DataFrame :
 
-	## 5. Convert to json format
-	customers_features_json = customers_features_df.to_json(orient = "records", indent = 2)
-	customers_features_dict = json.loads(customers_features_json)
+	if not ids :
+		return pd.DataFrame()
 
-	loans_features_json = loans_features_df.to_json(orient = "records", indent = 2)
-	loans_features_dict = json.loads(loans_features_json)
+	# Customers : rows of the materialized aggregates (thread pool, O(1) per customer), None if unavailable
+	if ontology == Ontology.customers :
+		features_df = await executors.run_io(aggregates.entity_features, ids)
+		if features_df is not None :
+			return features_df
 
+	# Feature Pipeline restricted to the requested entities (process pool), the id is kept as the index
+	return await executors.run_cpu(build_entity_features, ontology.value, ids)
 
-	jsons = {
-		"customers" : customers_features_json,
-		"loans"     : loans_features_json
+
+@app.get("/api/v1/cache")
+async def fetch_cache_stats():
+	"""Hit/miss/eviction counters of the in-process feature cache & request coalescing counters"""
+	return {
+		**feature_cache.stats(),
+		"single_flight" : single_flight.stats()
+	}
+
+
+@app.get("/api/v1/aggregates")
+async def fetch_aggregates_stats(check : bool = False):
+	"""Counters of the customers aggregate store & (check = true) its comparison with a full rebuild"""
+	if not check :
+		return aggregates.stats()
+
+	return {
+		**aggregates.stats(),
+		# the reference matrix is built in the process pool, the thread waits for it & compares
+		"check" : await executors.run_io(aggregates.check)
 	}
 
-	## 6. Return 
-	return jsons[ontology]
+
+#*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
+#          Endpoint : Feature Jobs            #
+#*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
+
+
+def cache_job_result(job : FeatureJob):
+	"""A finished job's matrix is also served by the (synchronous) feature endpoint"""
+	health.record_build(job.ontology, sum(stage["seconds"] or 0.0 for stage in job.stages.values()))
+	feature_cache.put(job.ontology.value, job.version, job.result, size = int(job.result.memory_usage(deep = True).sum()))
+
+
+@app.post("/api/v1/jobs/features/{ontology}", status_code = status.HTTP_202_ACCEPTED)
+async def submit_features_job(ontology : Ontology):
+	"""Starts a feature build in the background and returns its job id right away"""
+	job = feature_jobs.submit(ontology, version = feature_cache.data_version(), on_done = cache_job_result, features_path = pipeline.features_paths[ontology])
+
+	if job is None :
+		raise HTTPException(
+			status_code = status.HTTP_429_TOO_MANY_REQUESTS,
+			detail      = "Feature job queue is full, retry later"
+		)
+
+	return job.to_dict()
+
+
+@app.get("/api/v1/jobs/{job_id}")
+async def fetch_job_status(job_id : str):
+	"""Status & per-stage progress (load, preprocess, extract, dfs, store) of a feature job"""
+	job = feature_jobs.get(job_id)
+
+	if job is None :
+		raise HTTPException(
+			status_code = 404,
+			detail      = f"Job with id : {job_id} does not exist"
+		)
+
+	return job.to_dict()
+
+
+@app.get("/api/v1/jobs/{job_id}/result")
+async def fetch_job_result(job_id : str):
+	"""The feature matrix built by a finished job"""
+	job = feature_jobs.get(job_id)
+
+	if job is None :
+		raise HTTPException(
+			status_code = 404,
+			detail      = f"Job with id : {job_id} does not exist"
+		)
+
+	if job.status != JobStatus.done :
+		raise HTTPException(
+			status_code = status.HTTP_409_CONFLICT,
+			detail      = f"Job with id : {job_id} is {job.status.value}" + (f" : {job.error}" if job.error else "")
+		)
+
+	return json_response(await executors.run_io(dataframe_to_json, job.result))
+
 
 @app.post("/api/v1/features/{ontology}")
-async def upload_features(ontology : str):
+async def upload_features(ontology : Ontology):
 
 	data_reporter = DataReporter(mk1, config)
-	features_path = str(config.get("features",f"features_{ontology}_path"))
-	features_tab  = str(config.get("google_sheets", f"api_reporter_tab_{ontology}_features"))
+	features_path = str(config.get("features",f"features_{ontology.value}_path"))
+	features_tab  = str(config.get("google_sheets", f"api_reporter_tab_{ontology.value}_features"))
 	features_df   = pd.read_csv(features_path, index_col = 0)
 	features_df   = data_reporter.cast_to_spreadsheet_friendly_format(features_df)
 
@@ -159,6 +421,24 @@ async def upload_features(ontology : str):
 
 @app.post("/api/v1/database/{db_name}")
 async def clear_local_db(db_name : str, pk_name : str):
+	await executors.run_io(reset_local_db, db_name = db_name, pk_name = pk_name)
+
+
+
+@app.get("/api/v1/database")
+async def create_local_dbs():
+	await executors.run_io(reset_local_dbs)
+
+
+
+@app.get("/api/v1/database/query_plans")
+async def fetch_query_plans():
+	# "flagged" : full table scan on a query that only needs a few rows (i.e. a missing index)
+	return await executors.run_io(query_planner.report)
+
+
+
+def reset_local_db(db_name : str, pk_name : str):
 	data_loader  = DataLoader(mk1, config)
 
 	# 1. Delete if existing
@@ -169,8 +449,7 @@ async def clear_local_db(db_name : str, pk_name : str):
 
 
 
-@app.get("/api/v1/database")
-async def create_local_dbs():
+def reset_local_dbs():
 	data_loader  = DataLoader(mk1, config)
 
 	# 1. Delete if existing
@@ -196,8 +475,8 @@ async def create_local_dbs():
 
 
 	# 5. Check rows of local dbs
-	display(mk1.dataset.db_query(query_str = "SELECT * FROM loans"))
-	display(mk1.dataset.db_query(query_str = "SELECT * FROM customers"))
+	display(statements.execute("fetch_loans"))
+	display(statements.execute("fetch_customers"))
 
 
 #*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
@@ -205,30 +484,60 @@ async def create_local_dbs():
 #*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
 
 @app.get("/api/v1/customers")
-async def fetch_customers():
-	return mk1.dataset.db_query(query_str = "SELECT * FROM customers").to_json(orient = "records", indent = 2)
+async def fetch_customers(request         : Request,
+						  fields          : Optional[str]   = None,
+						  limit           : Optional[int]   = Query(None, ge = 1),
+						  after           : Optional[int]   = None,
+						  customer_id     : Optional[str]   = None,
+						  min_income      : Optional[float] = None,
+						  max_income      : Optional[float] = None,
+						  accept          : Optional[str]   = Header(None),
+						  accept_encoding : Optional[str]   = Header(None),
+						  if_none_match   : Optional[str]   = Header(None)):
+	"""
+		Customers ordered by `customer_id` when paginated (`?limit=100&after=<last customer_id>`), with a projection
+		(`?fields=annual_income`) & filters (`?customer_id=1090,3565&min_income=30000&max_income=60000`), all in SQL
+	"""
+	fmt          = negotiate(accept, ROWS_FORMATS)
+	encoding     = compressor.negotiate(accept_encoding)
+
+	# Conditional GET : checked before the statement is built (it reads the table columns)
+	headers = representation_headers(request, fmt, encoding)
+	if etag_matches(if_none_match, headers["ETag"]) :
+		return not_modified_response(headers)
+
+	name, params = await list_statement("customers", fields, after, limit,
+			customer_id = parse_ids(customer_id) if customer_id is not None else None,
+			min_income  = min_income,
+			max_income  = max_income
+	)
+	# JSON array (or NDJSON / CSV / Arrow IPC stream / Parquet with the "Accept" header), streamed in batches of "db_fetch_size" rows
+	return rows_response(await list_rows(name, params), fmt, **stream_encoding(encoding, headers))
 	
 
 
 @app.get("/api/v1/customers/{customer_id}")
 async def fetch_customer(customer_id : int):
-	return mk1.dataset.db_query(query_str = f"SELECT * FROM customers WHERE customer_id == {customer_id}").to_json(orient = "records", indent = 2)
+	customer_df = await executors.run_io(statements.execute, "fetch_customer", customer_id = customer_id)
+	return json_response(dataframe_to_json(customer_df))
 
 
 
 @app.post("/api/v1/customers")
 async def register_customer(customer_dict : Dict[str, Any]):
-	mk1.dataset.db_append_row(table_name = "customers", input_dict = customer_dict)
+	await executors.run_io(mk1.dataset.db_append_row, table_name = "customers", input_dict = customer_dict)
 	customer_id = customer_dict["customer_id"]
-	return mk1.dataset.db_query(query_str = f"SELECT * FROM customers WHERE customer_id == {customer_id}").to_json(orient = "records", indent = 2)
+	customer_df = await executors.run_io(statements.execute, "fetch_customer", customer_id = customer_id)
+	return json_response(dataframe_to_json(customer_df))
 	
 
 @app.delete("/api/v1/customers/{customer_id}")
 async def delete_customer(customer_id : int):
 
 	try :
-		mk1.dataset.db_delete(table_name = "customers", filters_dict = {"customer_id": customer_id})
-		return mk1.dataset.db_query(query_str = f"SELECT * FROM customers WHERE customer_id == {customer_id}").to_json(orient = "records", indent = 2)
+		await executors.run_io(mk1.dataset.db_delete, table_name = "customers", filters_dict = {"customer_id": customer_id})
+		customer_df = await executors.run_io(statements.execute, "fetch_customer", customer_id = customer_id)
+		return json_response(dataframe_to_json(customer_df))
 	
 
 	except HTTPException : 
@@ -238,6 +547,32 @@ async def delete_customer(customer_id : int):
 		)
 
 
+@app.delete("/api/v1/customers")
+async def delete_customers(ids : str, vacuum : bool = False):
+	"""Bulk delete (`?ids=1090,3565`) in a single transaction, cascaded to the loans of these customers"""
+	return await delete_entities("customers", "customer_id", parse_ids(ids), cascade = [("loans", "customer_id")], vacuum = vacuum)
+
+
+async def delete_entities(db_name : str, pk_name : str, ids : List[int], cascade : Optional[List] = None, vacuum : bool = False):
+
+	deleted = await executors.run_io(
+			mk1.dataset.db_delete_in,
+			table_name = db_name,
+			col_name   = pk_name,
+			values     = ids,
+			cascade    = cascade,
+			vacuum     = vacuum
+	)
+
+	if deleted is None :
+		raise HTTPException(
+			status_code = 500,
+			detail      = f"Deleting {db_name} with ids : {ids} failed, nothing was deleted"
+		)
+
+	return {"deleted" : deleted}
+
+
 
 # @app.put("/api/v1/customers/{customer_id}")
 # async def update_customer(customer_update : CustomerUpdateRequest, customer_id : int):
@@ -263,20 +598,53 @@ async def delete_customer(customer_id : int):
 #*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
 
 @app.get("/api/v1/loans")
-async def fetch_loans():
-	return mk1.dataset.db_query(query_str = "SELECT * FROM loans").to_json(orient = "records", indent = 2)
+async def fetch_loans(request         : Request,
+					  fields          : Optional[str]        = None,
+					  limit           : Optional[int]        = Query(None, ge = 1),
+					  after           : Optional[int]        = None,
+					  customer_id     : Optional[str]        = None,
+					  loan_date_from  : Optional[dt.date]    = None,
+					  loan_date_to    : Optional[dt.date]    = None,
+					  term            : Optional[Term]       = None,
+					  loan_status     : Optional[LoanStatus] = None,
+					  accept          : Optional[str]        = Header(None),
+					  accept_encoding : Optional[str]        = Header(None),
+					  if_none_match   : Optional[str]        = Header(None)):
+	"""
+		Loans ordered by `loan_id` when paginated (`?limit=100&after=<last loan_id>`), with a projection (`?fields=amount,fee`)
+		& filters (`?customer_id=1090&loan_date_from=2021-01-01&loan_date_to=2021-12-31&term=long&loan_status=0`), all in SQL
+	"""
+	fmt          = negotiate(accept, ROWS_FORMATS)
+	encoding     = compressor.negotiate(accept_encoding)
+
+	# Conditional GET : checked before the statement is built (it reads the table columns)
+	headers = representation_headers(request, fmt, encoding)
+	if etag_matches(if_none_match, headers["ETag"]) :
+		return not_modified_response(headers)
+
+	name, params = await list_statement("loans", fields, after, limit,
+			customer_id    = parse_ids(customer_id) if customer_id is not None else None,
+			loan_date_from = loan_date_from.isoformat() if loan_date_from else None,
+			loan_date_to   = loan_date_to.isoformat() if loan_date_to else None,
+			term           = term.value if term else None,
+			loan_status    = loan_status.value if loan_status else None
+	)
+	# JSON array (or NDJSON / CSV / Arrow IPC stream / Parquet with the "Accept" header), streamed in batches of "db_fetch_size" rows
+	return rows_response(await list_rows(name, params), fmt, **stream_encoding(encoding, headers))
 
 
 @app.get("/api/v1/loans/{loan_id}")
 async def fetch_loan(loan_id : int):
-	return mk1.dataset.db_query(query_str = f"SELECT * FROM loans WHERE loan_id == {loan_id}").to_json(orient = "records", indent = 2)
+	loan_df = await executors.run_io(statements.execute, "fetch_loan", loan_id = loan_id)
+	return json_response(dataframe_to_json(loan_df))
 
 	
 @app.post("/api/v1/loans")
 async def register_loan(loan_dict : Dict[str, Any]):
-	mk1.dataset.db_append_row(table_name = "loans", input_dict = loan_dict)
+	await executors.run_io(mk1.dataset.db_append_row, table_name = "loans", input_dict = loan_dict)
 	loan_id = loan_dict["loan_id"]
-	return mk1.dataset.db_query(query_str = f"SELECT * FROM loans WHERE loan_id == {loan_id}").to_json(orient = "records", indent = 2)
+	loan_df = await executors.run_io(statements.execute, "fetch_loan", loan_id = loan_id)
+	return json_response(dataframe_to_json(loan_df))
 	
 
 
@@ -285,8 +653,9 @@ async def register_loan(loan_dict : Dict[str, Any]):
 async def delete_loan(loan_id : int):
 
 	try :
-		mk1.dataset.db_delete(table_name = "loans", filters_dict = {"loan_id": loan_id})
-		return mk1.dataset.db_query(query_str = f"SELECT * FROM loans WHERE loan_id == {loan_id}").to_json(orient = "records")
+		await executors.run_io(mk1.dataset.db_delete, table_name = "loans", filters_dict = {"loan_id": loan_id})
+		loan_df = await executors.run_io(statements.execute, "fetch_loan", loan_id = loan_id)
+		return json_response(dataframe_to_json(loan_df))
 	
 
 	except HTTPException : 
@@ -296,6 +665,12 @@ async def delete_loan(loan_id : int):
 		)
 
 
+@app.delete("/api/v1/loans")
+async def delete_loans(ids : str, vacuum : bool = False):
+	"""Bulk delete (`?ids=1,2,3`) in a single transaction"""
+	return await delete_entities("loans", "loan_id", parse_ids(ids), vacuum = vacuum)
+
+
 
 
 
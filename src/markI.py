@@ -1,11 +1,19 @@
 import os
+import re
 import json
+import hashlib
 import dataset
+from sqlalchemy import text, bindparam
+from sqlalchemy.pool import NullPool
 import numpy as np
 import pandas as pd
 from datetime import datetime
 
+import time
 import logging
+import weakref
+import itertools
+import threading
 import logging.handlers as handlers
 from typing import Callable, Dict, Generic, Optional, Set, Tuple, TypeVar, Deque, List
 
@@ -97,13 +105,38 @@ class Logging(object):
 
 ######################################################################################################
 
+class ThreadSentinel(object):
+    """Object kept in a thread-local storage : it is collected (running its finalizers) when its thread exits"""
+
+######################################################################################################
+
 class DataSet(object):
     """Dataset provides a simple abstraction layer that removes most direct SQL statements without the
        necessity for a full ORM model - essentially, databases can be used like a JSON file
     """
-    def __init__(self, config_obj):
+    def __init__(self, config_obj, db_file = None):
         self.config = config_obj
+        # Database file : searched (or created from "config.ini" params) on first connection, unless given
+        self.db_file = db_file
         self.db = self.db_connect()
+        # Read-only connections for the query endpoints (in WAL mode, reads never wait for writes)
+        self.db_read_only = self.db_connect(read_only = True)
+        # Read-only engine of the streamed queries ("db_iterate"), whose connections may be consumed from several threads
+        self.db_stream = self.db_connect(read_only = True, cross_thread = True)
+        # Data version, bumped on every successful write (used to invalidate cached features)
+        self.version = 0
+        self.version_lock = threading.Lock()
+        # Secondary indexes declared in "config.ini" ({table: [columns, ...]}), created along with their tables
+        self.indexes = self.get_indexes()
+        self.ensured_indexes = set()
+        # Named, parameterized statements ({name: (query, expanding params, statement)}), see "db_prepare"
+        self.statements = {}
+        # Write hooks, called after every committed write (see "db_add_write_hook")
+        self.write_hooks = []
+        # Per-thread sentinels, whose finalizers close the connections of exiting threads (see "db_release_on_exit")
+        self.thread_sentinels = threading.local()
+        for table_name in self.indexes:
+            self.db_ensure_indexes(table_name)
 
     def auto_search(self):
         """Searches for ".db" files within folders in this file's root directory
@@ -135,39 +168,197 @@ class DataSet(object):
         #     self.config.write(config_file)
         return None
 
-    def db_connect(self):
+    def db_connect(self, read_only = False, cross_thread = False):
         """Connects to an existing database or creates a new database from "config.ini" params
+           Every thread gets its own connection (opened on first use), set up with the "[db]" pragmas
 
-           :param: None
+           :param bool read_only: read-only connections ("mode=ro"), which can only query the database
+           :param bool cross_thread: connections usable from another thread than the one that opened them (one thread at a time)
            :returns: dataset database object
         """
-        # Searching an existing database
-        db_info = self.auto_search()
-        # If database already exists...
-        if db_info["name"] is not None:
-            # Connect to existing database
-            db_obj = dataset.connect(os.path.join("sqlite:///", db_info["path"], db_info["name"]))
-
-            # Updating the "config.ini" file
-            self.auto_update(db_info)
+        if self.db_file is not None:
+            # Database file given to the constructor, or found by the first connection
+            db_file = self.db_file
+        else:
+            # Searching an existing database
+            db_info = self.auto_search()
+            # If database already exists...
+            if db_info["name"] is not None:
+                # Connect to existing database
+                db_file = os.path.join(db_info["path"], db_info["name"])
+
+                # Updating the "config.ini" file
+                self.auto_update(db_info)
+            else:
+                # Create new database
+                db_file = os.path.join(self.config.get("db","db_path"), self.config.get("db","db_file"))
+
+        # Database file (its stat is part of the data version, see "data_version")
+        self.db_file = db_file
+
+        if read_only:
+            db_url = "sqlite:///file:{}?mode=ro&uri=true".format(db_file)
         else:
-            # Create new database
-            db_obj = dataset.connect(os.path.join("sqlite:///",
-                                                  self.config.get("db","db_path"),
-                                                     self.config.get("db","db_file")))
-            
+            db_url = "sqlite:///{}".format(db_file)
+
+        db_obj = dataset.connect(db_url,
+                                 engine_kwargs = {"poolclass": NullPool, "connect_args": {"check_same_thread": not cross_thread}},
+                                 sqlite_wal_mode = False,
+                                 on_connect_statements = self.get_pragmas(read_only))
         return db_obj
 
+    def get_pragmas(self, read_only = False):
+        """SQLite pragmas of the "[db]" section, run on every new connection
+
+           :param bool read_only: skips "journal_mode" (a database setting, only changed by read-write connections)
+           :returns: list of "PRAGMA" statements
+        """
+        pragmas = []
+        if not read_only:
+            pragmas.append("PRAGMA journal_mode={}".format(self.config.get("db", "db_journal_mode")))
+        pragmas += [
+            "PRAGMA synchronous={}".format(self.config.get("db", "db_synchronous")),
+            "PRAGMA cache_size={}".format(self.config.get("db", "db_cache_size")),
+            "PRAGMA mmap_size={}".format(self.config.get("db", "db_mmap_size")),
+            "PRAGMA temp_store={}".format(self.config.get("db", "db_temp_store")),
+        ]
+        if read_only:
+            pragmas.append("PRAGMA query_only=ON")
+        return pragmas
+
     def db_disconnect(self):
-        """Disconnects from the database object stored in "self.db"
+        """Disconnects (the current thread) from the database objects stored in "self.db" & "self.db_read_only"
 
            :param: None
            :returns: None
         """
         # Disconnecting from the database
         self.db.executable.close()
+        self.db_read_only.executable.close()
+        return None
+
+    def db_release_thread(self, thread_id = None):
+        """Closes the connections of a thread (the current one by default) and forgets them : "dataset" keys its
+           connections by thread ident, and idents are reused once a thread exits
+
+           :param int thread_id: ident of the thread (its connections can only be closed from this thread)
+           :returns: None
+        """
+        thread_id = threading.get_ident() if thread_id is None else thread_id
+        for db_obj in [self.db, self.db_read_only, self.db_stream]:
+            with db_obj.lock:
+                connection = db_obj.connections.pop(thread_id, None)
+            if connection is not None:
+                connection.close()
+        return None
+
+    def db_release_on_exit(self):
+        """Closes the connections of the current thread when it exits, as the "initializer" of the thread pools : a
+           pool thread lives as long as its pool, so connections stay bounded by the workers of the pools. Threads
+           started elsewhere (e.g. by the web server) should call "db_release_thread" before exiting
+
+           :param: None
+           :returns: None
+        """
+        sentinel = ThreadSentinel()
+        self.thread_sentinels.sentinel = sentinel
+        weakref.finalize(sentinel, self.db_release_thread, threading.get_ident())
         return None
 
+    def bump_version(self):
+        """Increments the data version, marking every artifact derived from the database as stale
+
+           :param: None
+           :returns: new data version (integer)
+        """
+        with self.version_lock:
+            self.version += 1
+            return self.version
+
+    def data_version(self):
+        """Data version shared by every process using the database file : the write counter of this process, with
+           the "file_version" (commits of other processes, e.g. other API workers or the process pool, change it)
+
+           :param: None
+           :returns: tuple (write counter, (mtime_ns, size) of the database file, of its WAL or None)
+        """
+        return (self.version, *self.file_version())
+
+    def file_version(self):
+        """Part of the data version read from the file system only, hence the same in every process (and across
+           restarts) : the mtime & size of the database file and of its WAL. An empty or missing WAL is left out,
+           as connections create & delete it
+
+           :param: None
+           :returns: tuple ((mtime_ns, size) of the database file, of its WAL or None)
+        """
+        stats = []
+        for path in [self.db_file, self.db_file + "-wal"]:
+            try:
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size) if stat.st_size else None)
+            except OSError:
+                stats.append(None)
+        return tuple(stats)
+
+    def db_add_write_hook(self, hook):
+        """Registers a callable run after every committed write, as "hook(table_name, operation, rows)", with operation
+           "insert" (rows: the inserted rows, primary key included), "delete" (rows: the deleted rows) or "reset"
+           (rows: None, the table changed as a whole : created, dropped, truncated, bulk inserted or updated)
+
+           :param callable hook: function of (table_name, operation, rows)
+           :returns: None
+        """
+        self.write_hooks.append(hook)
+        return None
+
+    def db_remove_write_hook(self, hook):
+        """Unregisters a callable registered with "db_add_write_hook"
+
+           :param callable hook: function of (table_name, operation, rows)
+           :returns: None
+        """
+        if hook in self.write_hooks:
+            self.write_hooks.remove(hook)
+        return None
+
+    def db_notify(self, table_name, operation, rows = None):
+        """Runs the write hooks (the write is already committed : a failing hook cannot undo it)
+
+           :param str table_name: name of the table written
+           :param str operation: "insert", "delete" or "reset"
+           :param list rows: inserted / deleted rows (dictionaries)
+           :returns: None
+        """
+        for hook in list(self.write_hooks):
+            try:
+                hook(table_name, operation, rows)
+            except Exception as e:
+                logging.getLogger(self.config.get("logger","log_name")).error(
+                    "(DataSet.db_notify) Write hook {} failed on the {} of {} rows : {}".format(getattr(hook, "__qualname__", hook), operation, table_name, e))
+        return None
+
+    def db_select_rows(self, table_name, filters_dict = None, col_name = None, values = None):
+        """Rows about to be deleted (only read when write hooks are registered), in the current transaction
+
+           :param str table_name: name of the table
+           :param dict filters_dict: equality filters (joined with ANDs)
+           :param str col_name: column matched against "values"
+           :param list values: values of "col_name"
+           :returns: list of dictionaries (None without write hooks)
+        """
+        if not self.write_hooks:
+            return None
+        if table_name not in self.db.tables:
+            return []
+        table = self.db[table_name].table
+        statement = table.select()
+        for name, value in (filters_dict or {}).items():
+            statement = statement.where(table.c[name] == value)
+        if col_name is not None:
+            statement = statement.where(table.c[col_name].in_(values))
+        return [dict(row) for row in self.db.executable.execute(statement).mappings()]
+
     def db_create_table(self, table_name = None, pk_name = None, pk_str = None):
         """Creates a table with name and primary key (with type) in the "self.db" database object
 
@@ -180,6 +371,9 @@ class DataSet(object):
             # Creating the table and commiting changes
             self.db.create_table(table_name, primary_id = pk_name, primary_type = self.get_pk_type(pk_str))
             self.db.commit()
+            self.bump_version()
+            self.db_ensure_indexes(table_name)
+            self.db_notify(table_name, "reset")
         except:
             # Rolling changes back
             self.db.rollback()
@@ -192,9 +386,14 @@ class DataSet(object):
            :returns: None
         """
         try:
-            # Deleting the table and commiting changes
-            self.db[table_name].drop()
+            # Deleting the table and commiting changes (a missing table is not looked up : the lookup would cache it
+            # with the default "id" primary key, which "db_create_table" would then reuse instead of its own)
+            if table_name in self.db.tables:
+                self.db[table_name].drop()
             self.db.commit()
+            self.bump_version()
+            self.ensured_indexes = {index for index in self.ensured_indexes if index[0] != table_name}
+            self.db_notify(table_name, "reset")
         except:
             # Rolling changes back
             self.db.rollback()
@@ -209,8 +408,17 @@ class DataSet(object):
         """
         try:
             # Inserting a row (through a dictionary) and commiting changes
-            self.db[table_name].insert(input_dict)
+            table = self.db[table_name]
+            row_id = table.insert(input_dict)
             self.db.commit()
+            self.bump_version()
+            self.db_ensure_indexes(table_name)
+            # The hooks get the row with its (generated) primary key
+            row = dict(input_dict)
+            pk = [column.name for column in table.table.primary_key.columns]
+            if len(pk) == 1 and pk[0] not in row:
+                row[pk[0]] = row_id
+            self.db_notify(table_name, "insert", [row])
         except:
             # Rolling changes back
             self.db.rollback()
@@ -229,11 +437,45 @@ class DataSet(object):
             # Inserting a row (through df) and commiting changes
             self.db[table_name].insert_many(df)
             self.db.commit()
+            self.bump_version()
+            self.db_ensure_indexes(table_name)
+            self.db_notify(table_name, "reset")
         except:
             # Rolling changes back
             self.db.rollback()
         return None
 
+    def db_bulk_insert(self, table_name = None, rows = None, chunk_size = None):
+        """Inserts many rows (any iterable of dictionaries) in a single transaction, in chunks of "chunk_size" rows
+           (executemany), so there is one commit for the whole batch. The whole batch is rolled back on failure
+
+           :param str table_name: name of the table receiving the rows
+           :param iterable rows: dictionaries holding data to be appended (keys as columns, values as values)
+           :param int chunk_size: rows per executemany (default: "db_bulk_chunk_size" in "config.ini")
+           :returns: dictionary with the number of rows, seconds and rows per second (None on failure)
+        """
+        chunk_size = int(chunk_size or self.config.get("db", "db_bulk_chunk_size"))
+        rows = iter(rows)
+        num_rows = 0
+        start = time.perf_counter()
+        try:
+            # Inserting every chunk and commiting changes once
+            self.db.begin()
+            table = self.db[table_name]
+            for chunk in iter(lambda: list(itertools.islice(rows, chunk_size)), []):
+                table.insert_many(chunk, chunk_size = chunk_size)
+                num_rows += len(chunk)
+            self.db.commit()
+            self.bump_version()
+            self.db_ensure_indexes(table_name)
+            self.db_notify(table_name, "reset")
+        except:
+            # Rolling the whole batch back
+            self.db.rollback()
+            return None
+        seconds = time.perf_counter() - start
+        return {"rows": num_rows, "seconds": seconds, "rows_per_sec": num_rows / seconds if seconds > 0 else float("inf")}
+
     def db_update(self, table_name=None, values_dict=None, col_filter=None):
         """Updates all rows filtered by the "col_filter" list with key/values specified by "values_dict"
 
@@ -246,6 +488,8 @@ class DataSet(object):
             # Updating rows (based on "col_filter" and "values_dict") and commiting changes
             self.db[table_name].update(row = values_dict, keys = col_filter)
             self.db.commit()
+            self.bump_version()
+            self.db_notify(table_name, "reset")
         except:
             # Rolling changes back
             self.db.rollback()
@@ -264,6 +508,9 @@ class DataSet(object):
             # Updating rows (based on "col_filter" and "values_dict") and commiting changes
             self.db[table_name].upsert(row=values_dict, keys=col_filter)
             self.db.commit()
+            self.bump_version()
+            self.db_ensure_indexes(table_name)
+            self.db_notify(table_name, "reset")
         except:
             # Rolling changes back
             self.db.rollback()
@@ -277,30 +524,302 @@ class DataSet(object):
            :returns: None
         """
         try:
-            # Deleting rows (based on "filters_dict") and commiting changes
+            # Deleting rows (based on "filters_dict") and commiting changes, the deleted rows are read first for the hooks
+            self.db.begin()
+            rows = self.db_select_rows(table_name, filters_dict = filters_dict)
             self.db[table_name].delete(**filters_dict)
             self.db.commit()
+            self.bump_version()
+            if rows:
+                self.db_notify(table_name, "delete", rows)
+        except:
+            # Rolling changes back
+            self.db.rollback()
+        return None
+
+    def db_truncate(self, table_name = None, vacuum = False):
+        """Deletes all the rows of a table with a single "DELETE" statement (instead of one per primary key)
+
+           :param str table_name: name of the table being emptied
+           :param bool vacuum: checkpoints the WAL and runs "VACUUM" afterwards (returns the freed pages to the OS)
+           :returns: number of deleted rows (None on failure)
+        """
+        try:
+            # Deleting every row and commiting changes
+            self.db.begin()
+            table = self.db[table_name].table
+            num_rows = self.db.executable.execute(table.delete()).rowcount
+            self.db.commit()
+            self.bump_version()
+            self.db_notify(table_name, "reset")
+        except:
+            # Rolling changes back
+            self.db.rollback()
+            return None
+        if vacuum:
+            self.db_vacuum()
+        return num_rows
+
+    def db_delete_in(self, table_name = None, col_name = None, values = None, cascade = None, vacuum = False):
+        """Deletes the rows whose "col_name" is any of "values" with one "DELETE ... IN" statement per chunk of
+           "db_bulk_chunk_size" values, in a single transaction (rolled back as a whole on failure)
+
+           :param str table_name: name of the table losing the data
+           :param str col_name: column matched against "values" (e.g. the primary key)
+           :param list values: values of "col_name" to be deleted
+           :param list cascade: (table_name, col_name) pairs whose rows matching "values" are deleted in the same transaction
+                                (e.g. [("loans", "customer_id")] to delete the loans of deleted customers)
+           :param bool vacuum: checkpoints the WAL and runs "VACUUM" afterwards
+           :returns: dictionary with the number of deleted rows per table (None on failure)
+        """
+        values = list(values)
+        chunk_size = int(self.config.get("db", "db_bulk_chunk_size"))
+        deleted = {}
+        deleted_rows = {}
+        try:
+            # Deleting rows (of the table & the cascaded tables) and commiting changes once
+            self.db.begin()
+            for table_name_, col_name_ in [(table_name, col_name)] + list(cascade or []):
+                deleted[table_name_] = 0
+                if table_name_ not in self.db.tables:
+                    continue
+                table = self.db[table_name_].table
+                for i in range(0, len(values), chunk_size):
+                    # The deleted rows are read first for the hooks (if any)
+                    rows = self.db_select_rows(table_name_, col_name = col_name_, values = values[i: i + chunk_size])
+                    deleted_rows.setdefault(table_name_, []).extend(rows or [])
+                    statement = table.delete().where(table.c[col_name_].in_(values[i: i + chunk_size]))
+                    deleted[table_name_] += self.db.executable.execute(statement).rowcount
+            self.db.commit()
+            self.bump_version()
+            for table_name_, rows in deleted_rows.items():
+                if rows:
+                    self.db_notify(table_name_, "delete", rows)
+        except:
+            # Rolling changes back
+            self.db.rollback()
+            return None
+        if vacuum:
+            self.db_vacuum()
+        return deleted
+
+    def db_vacuum(self):
+        """Checkpoints the WAL (if any) into the database file and rebuilds it with "VACUUM"
+
+           :param: None
+           :returns: None
+        """
+        try:
+            self.db.query("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.db.query("VACUUM")
+            self.db.commit()
         except:
             # Rolling changes back
             self.db.rollback()
         return None
 
-    def db_query(self, query_str=None):
+    def get_indexes(self):
+        """Secondary indexes of the "[db]" section ("db_indexes"), e.g. "customers(annual_income), loans(customer_id)"
+
+           :param: None
+           :returns: dictionary with table names as keys and lists of column tuples as values
+        """
+        indexes = {}
+        for table_name, columns in re.findall(r"(\w+)\s*\(([^)]*)\)", self.config.get("db", "db_indexes", fallback = "")):
+            indexes.setdefault(table_name, []).append(tuple(column.strip() for column in columns.split(",")))
+        return indexes
+
+    def get_index_columns(self, columns):
+        """Columns referenced by the entries of an index : column names, or SQL expressions such as
+           "substr(loan_date, 7, 4)" (identifiers that are neither functions nor inside quotes)
+
+           :param tuple columns: names of the indexed columns (or expressions)
+           :returns: set with the names of the referenced columns
+        """
+        expressions = [re.sub(r"'[^']*'", "", column) for column in columns]
+        return {name for expression in expressions for name in re.findall(r"\b([A-Za-z_]\w*)\b(?!\s*\()", expression)}
+
+    def db_create_index(self, table_name = None, columns = None):
+        """Creates a secondary index ("ix_<table>_<columns>") on the columns (or SQL expressions) of a table, unless it
+           already exists. Indexes on expressions are only used by queries repeating the exact same expression
+
+           :param str table_name: name of the indexed table
+           :param tuple columns: names of the indexed columns (or expressions)
+           :returns: name of the index (None on failure)
+        """
+        names = []
+        for column in columns:
+            if re.fullmatch(r"\w+", column):
+                names.append(column)
+            else:
+                names.append("expr_{}".format(hashlib.sha1(column.encode("utf-8")).hexdigest()[:8]))
+        index_name = "ix_{}_{}".format(table_name, "_".join(names))
+        try:
+            # Creating the index and commiting changes
+            self.db.query('CREATE INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(
+                index_name, table_name, ", ".join('"{}"'.format(column) if re.fullmatch(r"\w+", column) else column for column in columns)))
+            self.db.commit()
+        except:
+            # Rolling changes back
+            self.db.rollback()
+            return None
+        return index_name
+
+    def db_declare_index(self, table_name = None, columns = None):
+        """Declares a secondary index on top of the "db_indexes" of "config.ini", created right away if its table (and
+           columns) exist, or along with them otherwise
+
+           :param str table_name: name of the indexed table
+           :param tuple columns: names of the indexed columns (or expressions)
+           :returns: list with the names of the indexes created (or found) by this call
+        """
+        columns = tuple(columns)
+        if columns not in self.indexes.setdefault(table_name, []):
+            self.indexes[table_name].append(columns)
+        return self.db_ensure_indexes(table_name)
+
+    def db_ensure_indexes(self, table_name = None):
+        """Creates the declared indexes ("self.indexes") of a table whose columns exist. Tables get their columns on the
+           first insert, so this runs after every table creation & insert, and only queries the database once per index
+
+           :param str table_name: name of the indexed table
+           :returns: list with the names of the indexes created (or found) by this call
+        """
+        pending = [columns for columns in self.indexes.get(table_name, []) if (table_name, columns) not in self.ensured_indexes]
+        if not pending or not self.db.has_table(table_name):
+            return []
+        existing_columns = set(self.db[table_name].columns)
+        index_names = []
+        for columns in pending:
+            if self.get_index_columns(columns) <= existing_columns:
+                index_name = self.db_create_index(table_name = table_name, columns = columns)
+                if index_name is not None:
+                    self.ensured_indexes.add((table_name, columns))
+                    index_names.append(index_name)
+        return index_names
+
+    def db_prepare(self, name = None, query_str = None, expanding = None):
+        """Registers a named, parameterized statement (":name" placeholders), built once and reused by "db_execute".
+           Values are bound instead of formatted into the query, so its text never changes : SQLAlchemy compiles it
+           once and every connection reuses its parsed statement (sqlite3 statement cache)
+
+           :param str name: name of the statement
+           :param str query_str: query with named placeholders, e.g. "SELECT * FROM loans WHERE loan_id = :loan_id"
+           :param list expanding: placeholders bound to lists of values, e.g. "WHERE customer_id IN :customer_ids"
+           :returns: None
+        """
+        expanding = tuple(expanding or ())
+        self.statements[name] = (query_str, expanding, self.build_statement(query_str, expanding))
+        return None
+
+    def build_statement(self, query_str, expanding = ()):
+        """SQLAlchemy text statement of a query, with its "expanding" placeholders
+
+           :param str query_str: query with named placeholders
+           :param tuple expanding: placeholders bound to lists of values
+           :returns: sqlalchemy TextClause
+        """
+        statement = text(query_str)
+        if expanding:
+            statement = statement.bindparams(*[bindparam(param, expanding = True) for param in expanding])
+        return statement
+
+    def db_execute(self, name = None, params = None, read_only = False):
+        """Executes a named statement (registered with "db_prepare") with bound values
+
+           :param str name: name of the statement
+           :param dict params: values of the placeholders
+           :param bool read_only: runs the statement on the read-only connections ("self.db_read_only")
+           :returns: dataframe with query results (None on failure)
+        """
+        _, _, statement = self.statements[name]
+        db = self.db_read_only if read_only else self.db
+        try:
+            # Executing the statement and commiting changes
+            result = db.query(statement, **(params or {}))
+            db.commit()
+            # Pushing "result" to a Dataframe
+            df = pd.DataFrame(data=list(result))
+            return df
+        except:
+            # Rolling changes back
+            db.rollback()
+        return None
+
+    def db_iterate(self, name = None, params = None, batch_size = None):
+        """Streams the rows of a named statement (registered with "db_prepare") in batches of "batch_size" rows
+           (fetchmany), so that only one batch is held in memory at a time. Each stream has its own read-only
+           connection (closed once the rows are exhausted or the generator is closed), and reads one snapshot of
+           the database. Batches may be consumed from different threads, one at a time
+
+           :param str name: name of the statement
+           :param dict params: values of the placeholders
+           :param int batch_size: rows per batch (default: "db_fetch_size" in "config.ini")
+           :returns: generator of lists of dictionaries (one per row)
+        """
+        batch_size = int(batch_size or self.config.get("db", "db_fetch_size"))
+        _, _, statement = self.statements[name]
+        connection = self.db_stream.engine.connect()
+        try:
+            result = connection.execute(statement, params or {}).mappings()
+            for batch in iter(lambda: result.fetchmany(batch_size), []):
+                yield [dict(row) for row in batch]
+        finally:
+            connection.close()
+
+    def db_fetch_df(self, name = None, params = None):
+        """Dataframe of all the rows of a named statement (registered with "db_prepare"), read from the raw cursor
+           rows ("pd.read_sql_query") on a read-only connection : several times faster than building it from
+           mappings, for full-table reads
+
+           :param str name: name of the statement
+           :param dict params: values of the placeholders
+           :returns: dataframe with query results (columns included, even without rows)
+        """
+        _, _, statement = self.statements[name]
+        with self.db_stream.engine.connect() as connection:
+            return pd.read_sql_query(statement, connection, params = params or {})
+
+    def db_explain(self, query_str = None, name = None, params = None):
+        """Query plan ("EXPLAIN QUERY PLAN") of a query or of a named statement, on the read-only connections
+
+           :param str query_str: complete query string
+           :param str name: name of a statement (registered with "db_prepare"), instead of "query_str"
+           :param dict params: values of the placeholders of the named statement
+           :returns: list with the details of the plan steps, e.g. "SEARCH loans USING INDEX ..." (None on failure)
+        """
+        if name is not None:
+            query_str, expanding, _ = self.statements[name]
+        else:
+            expanding = ()
+        try:
+            result = self.db_read_only.query(self.build_statement("EXPLAIN QUERY PLAN {}".format(query_str), expanding), **(params or {}))
+            plan = [row["detail"] for row in result]
+            self.db_read_only.commit()
+        except:
+            # Rolling changes back
+            self.db_read_only.rollback()
+            return None
+        return plan
+
+    def db_query(self, query_str=None, read_only=False):
         """Queries against the "self.db" database object
 
            :param str query_str: complete query string
+           :param bool read_only: runs the query on the read-only connections ("self.db_read_only")
            :returns: dataframe with query results
         """
+        db = self.db_read_only if read_only else self.db
         try:
             # Querying the db and commiting changes
-            result = self.db.query(query_str)
-            self.db.commit()
+            result = db.query(query_str)
+            db.commit()
             # Pushing "result" to a Dataframe
             df = pd.DataFrame(data=list(result))
             return df
         except:
             # Rolling changes back
-            self.db.rollback()
+            db.rollback()
         return None
 
     def get_pk_type(self, pk_str):
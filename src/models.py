@@ -14,6 +14,23 @@ class Term(str, Enum) :
 	long = "long"
 	short = "short"
 
+class Ontology(str, Enum) : 
+	customers = "customers"
+	loans     = "loans"
+
+class JobStatus(str, Enum) : 
+	queued  = "queued"
+	running = "running"
+	done    = "done"
+	failed  = "failed"
+
+class JobStage(str, Enum) : 
+	load       = "load"
+	preprocess = "preprocess"
+	extract    = "extract"
+	dfs        = "dfs"
+	store      = "store"
+
 
 
 class Loan(BaseModel) : 
@@ -0,0 +1,75 @@
+import re
+from typing import Any, Dict, List
+
+
+# Project modules
+from src.markI      import MkI
+from src.config     import Config
+from src.statements import Statements
+
+
+
+class QueryPlanner(object) :
+	"""
+		`EXPLAIN QUERY PLAN` of the named statements issued by the API (see `Statements`), flagging
+		the ones that scan a whole table.
+	"""
+	# statements reading the whole table anyway (a full scan is expected)
+	scans_expected = {"fetch_customers", "fetch_loans", "income_range"}
+
+	# plans do not depend on the values, only on the shape of the query
+	sample_params = {
+		"customer_id"  : 0,
+		"loan_id"      : 0,
+		"customer_ids" : [0, 1],
+		"loan_ids"     : [0, 1],
+	}
+
+	# "SCAN loans" (or "SCAN TABLE loans" before SQLite 3.36), but not "SCAN loans USING [COVERING] INDEX ..."
+	full_scan_pattern = re.compile(r"^SCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)")
+
+
+	def __init__(self, mk1 : MkI, config : Config):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		self.statements = Statements(mk1, config)
+
+
+
+	def full_scans(self, plan : List[str]) -> List[str] :
+		"""Tables scanned row by row in a query plan"""
+		return [match.group(1) for match in map(self.full_scan_pattern.match, plan) if match]
+
+
+	def explain(self, name : str) -> Dict[str, Any] :
+		query_str, _         = self.statements.statements[name]
+		params               = {param : value for param, value in self.sample_params.items() if ":" + param in query_str}
+		plan                 = self.mk1.dataset.db_explain(name = name, params = params)
+
+		if plan is None :
+			return {"name" : name, "query" : query_str, "plan" : None, "full_scans" : [], "flagged" : False}
+
+		full_scans = self.full_scans(plan)
+		return {
+			"name"       : name,
+			"query"      : query_str,
+			"plan"       : plan,
+			"full_scans" : full_scans,
+			"flagged"    : bool(full_scans) and name not in self.scans_expected,
+		}
+
+
+	def report(self) -> List[Dict[str, Any]] :
+		"""Plan of every query ("plan" is None when a table does not exist yet), with its full scans"""
+		report = [self.explain(name) for name in self.statements.statements]
+
+		for entry in report :
+			if entry["flagged"] :
+				self.mk1.logging.logger.warning("(QueryPlanner.report) '{}' scans {} : {}".format(entry["name"], entry["full_scans"], entry["query"]))
+
+		#logger
+		self.mk1.logging.logger.info("(QueryPlanner.report) Query plans were explained sucessfully ({} flagged) ✅".format(sum(entry["flagged"] for entry in report)))
+		return report
+
@@ -0,0 +1,331 @@
+import io
+import csv
+import hashlib
+import orjson
+import numpy    as np
+import pandas   as pd
+import datetime as dt
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# Arrow IPC & Parquet responses (optional dependency)
+try :
+	import pyarrow         as pa
+	import pyarrow.parquet as pq
+except ImportError :
+	pa = None
+	pq = None
+
+
+# API modules
+from fastapi           import HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+
+
+
+#*-*-*-*-*-*-*-*-*-*-*-*#
+#          JSON         #
+#*-*-*-*-*-*-*-*-*-*-*-*#
+
+# numpy arrays & scalars natively, non-string keys (e.g. integer ids) as strings
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def encode_default(obj : Any) -> Any :
+	"""Values orjson does not serialize natively : NaT/NA as null, timestamps as ISO 8601, other numpy scalars as python ones"""
+	if obj is pd.NaT or obj is pd.NA :
+		return None
+	if isinstance(obj, (pd.Timestamp, dt.date, dt.time, pd.Timedelta)) :
+		return obj.isoformat()
+	if isinstance(obj, np.generic) :
+		return obj.item()
+	raise TypeError("Type is not JSON serializable : {}".format(type(obj).__name__))
+
+
+def dumps(obj : Any) -> bytes :
+	"""Compact UTF-8 JSON (NaN & infinities as null)"""
+	return orjson.dumps(obj, default = encode_default, option = ORJSON_OPTIONS)
+
+
+def column_values(series : pd.Series) -> List[Any] :
+	"""Values of a column as python objects, with (naive) datetimes as ISO 8601 strings and NaT as None, in one vectorized pass"""
+	if pd.api.types.is_datetime64_dtype(series.dtype) :
+		values = np.datetime_as_string(series.values, unit = "s").astype(object)
+		values[series.isna().values] = None
+		return values.tolist()
+
+	return series.tolist()
+
+
+def dataframe_to_json(df : pd.DataFrame, index : bool = False) -> bytes :
+	"""Records of a dataframe (like `df.to_json(orient = "records")`) as compact UTF-8 JSON bytes"""
+	if index :
+		df = df.reset_index()
+
+	names   = [str(column) for column in df.columns]
+	columns = [column_values(df.iloc[:, i]) for i in range(df.shape[1])]
+
+	return dumps([dict(zip(names, row)) for row in zip(*columns)])
+
+
+def json_response(content : bytes, status_code : int = 200, headers : Optional[Dict[str, str]] = None) -> Response :
+	"""Already serialized (and possibly compressed, see `headers`) JSON, returned as is (FastAPI would encode a `str` once more)"""
+	return Response(content = content, status_code = status_code, media_type = "application/json", headers = headers)
+
+
+
+#*-*-*-*-*-*-*-*-*-*-*-*#
+#      Negotiation      #
+#*-*-*-*-*-*-*-*-*-*-*-*#
+
+# format -> media type of the response
+MEDIA_TYPES = {
+	"json"    : "application/json",
+	"ndjson"  : "application/x-ndjson",
+	"csv"     : "text/csv",
+	"arrow"   : "application/vnd.apache.arrow.stream",
+	"parquet" : "application/vnd.apache.parquet",
+}
+
+# media type of the `Accept` header -> format
+ACCEPTED_MEDIA_TYPES = {
+	"application/json"                    : "json",
+	"application/x-ndjson"                : "ndjson",
+	"application/ndjson"                  : "ndjson",
+	"application/jsonl"                   : "ndjson",
+	"text/csv"                            : "csv",
+	"application/vnd.apache.arrow.stream" : "arrow",
+	"application/vnd.apache.parquet"      : "parquet",
+	"application/x-parquet"               : "parquet",
+}
+
+# formats written with pyarrow
+ARROW_FORMATS = {"arrow", "parquet"}
+
+
+def accepted_media_types(accept : str) -> List[str] :
+	"""Media types of an `Accept` header, by decreasing quality (`q=0` excluded)"""
+	media_types = []
+	for position, item in enumerate(accept.split(",")) :
+		media_type, *params = [part.strip() for part in item.split(";")]
+		quality = 1.0
+		for param in params :
+			name, _, value = param.partition("=")
+			if name.strip() == "q" :
+				try :
+					quality = float(value)
+				except ValueError :
+					quality = 0.0
+
+		if media_type and quality > 0 :
+			media_types.append((-quality, position, media_type.lower()))
+
+	return [media_type for _, _, media_type in sorted(media_types)]
+
+
+def negotiate(accept : Optional[str], formats : List[str]) -> str :
+	"""
+		Format of a response : the first of `formats` without an `Accept` header, the accepted media type
+		of highest quality among `formats` otherwise (wildcards included). 406 when none of them can be
+		produced (Arrow IPC & Parquet need pyarrow).
+	"""
+	available = [fmt for fmt in formats if fmt not in ARROW_FORMATS or pa is not None]
+	if not accept :
+		return available[0]
+
+	for media_type in accepted_media_types(accept) :
+		if media_type.endswith("/*") :
+			matches = [fmt for fmt in available if media_type == "*/*" or MEDIA_TYPES[fmt].startswith(media_type[:-1])]
+			if matches :
+				return matches[0]
+		elif ACCEPTED_MEDIA_TYPES.get(media_type) in available :
+			return ACCEPTED_MEDIA_TYPES[media_type]
+
+	raise HTTPException(
+		status_code = status.HTTP_406_NOT_ACCEPTABLE,
+		detail      = "Acceptable media types : {}{}".format(
+			", ".join(MEDIA_TYPES[fmt] for fmt in available),
+			"" if pa is not None else " (Arrow IPC & Parquet need pyarrow)"
+		)
+	)
+
+
+
+#*-*-*-*-*-*-*-*-*-*-*-*#
+#       Streaming       #
+#*-*-*-*-*-*-*-*-*-*-*-*#
+
+def stream_json_array(batches : Iterable[List[Dict[str, Any]]]) -> Iterator[bytes] :
+	"""One JSON array (`[{...},\\n{...}]`), written batch by batch"""
+	separator = b""
+	yield b"["
+	for batch in batches :
+		if batch :
+			yield separator + b",\n".join(map(dumps, batch))
+			separator = b",\n"
+	yield b"]"
+
+
+def stream_ndjson(batches : Iterable[List[Dict[str, Any]]]) -> Iterator[bytes] :
+	"""One JSON object per line"""
+	for batch in batches :
+		if batch :
+			yield b"".join(dumps(row) + b"\n" for row in batch)
+
+
+def stream_rows_csv(batches : Iterable[List[Dict[str, Any]]]) -> Iterator[bytes] :
+	"""CSV with a header (the columns of the first row), written batch by batch"""
+	buffer = io.StringIO()
+	writer = None
+	for batch in batches :
+		if batch :
+			if writer is None :
+				writer = csv.DictWriter(buffer, fieldnames = list(batch[0]), lineterminator = "\n")
+				writer.writeheader()
+			writer.writerows(batch)
+			yield buffer.getvalue().encode("utf-8")
+			buffer.seek(0)
+			buffer.truncate()
+
+
+def stream_dataframe_csv(df : pd.DataFrame, batch_rows : int) -> Iterator[bytes] :
+	"""CSV of a dataframe (with its index), written `batch_rows` rows at a time"""
+	for start in range(0, max(len(df), 1), batch_rows) :
+		yield df.iloc[start : start + batch_rows].to_csv(header = start == 0).encode("utf-8")
+
+
+def rows_record_batches(batches : Iterable[List[Dict[str, Any]]]) -> Iterator["pa.RecordBatch"] :
+	"""Arrow record batches of batches of rows, all with the schema inferred from the first one"""
+	schema = None
+	for batch in batches :
+		if batch :
+			record_batch = pa.RecordBatch.from_pylist(batch, schema = schema)
+			schema       = record_batch.schema
+			yield record_batch
+
+
+class ChunkSink(object) :
+	"""Write-only file object collecting what the Arrow IPC & Parquet writers write, drained after every record batch"""
+	def __init__(self):
+		self.chunks   = []
+		self.position = 0
+		self.closed   = False
+
+
+	def write(self, data) -> int :
+		self.chunks.append(bytes(data))
+		self.position += len(data)
+		return len(data)
+
+
+	def tell(self) -> int :
+		return self.position
+
+
+	def flush(self) -> None :
+		pass
+
+
+	def close(self) -> None :
+		self.closed = True
+
+
+	def drain(self) -> bytes :
+		data, self.chunks = b"".join(self.chunks), []
+		return data
+
+
+def stream_record_batches(record_batches : Iterable["pa.RecordBatch"], fmt : str, schema : Optional["pa.Schema"] = None) -> Iterator[bytes] :
+	"""
+		Arrow IPC stream or Parquet file (one row group per record batch), yielded record batch by record
+		batch. The schema is the given one, or the one of the first record batch.
+	"""
+	sink   = ChunkSink()
+	writer = None
+	open_writer = lambda schema : pa.ipc.new_stream(sink, schema) if fmt == "arrow" else pq.ParquetWriter(sink, schema)
+
+	if schema is not None :
+		writer = open_writer(schema)
+
+	for record_batch in record_batches :
+		if writer is None :
+			writer = open_writer(record_batch.schema)
+		writer.write_batch(record_batch)
+		yield sink.drain()
+
+	if writer is None :
+		writer = open_writer(pa.schema([]))
+	writer.close()
+	yield sink.drain()
+
+
+def stream_dataframe_arrow(df : pd.DataFrame, fmt : str, batch_rows : int) -> Iterator[bytes] :
+	"""
+		Arrow IPC stream or Parquet file of a dataframe (with its index). Numeric columns without missing values
+		are not copied by `Table.from_pandas`, and the record batches are slices of the table.
+	"""
+	table = pa.Table.from_pandas(df, preserve_index = True)
+	yield from stream_record_batches(table.to_batches(max_chunksize = batch_rows), fmt, schema = table.schema)
+
+
+
+#*-*-*-*-*-*-*-*-*-*-*-*#
+#    Conditional GET    #
+#*-*-*-*-*-*-*-*-*-*-*-*#
+
+def entity_tag(*parts : Any) -> str :
+	"""
+		Strong ETag of a representation, from everything its bytes depend on (data version, request parameters, format,
+		encoding). The parts must be the same in every process serving the data, for the tags to match across workers & restarts
+	"""
+	return '"{}"'.format(hashlib.sha1(repr(parts).encode("utf-8")).hexdigest())
+
+
+def etag_matches(if_none_match : Optional[str], etag : str) -> bool :
+	"""Whether an `If-None-Match` header lists `etag` (weak comparison, as for GET requests) or is `*`"""
+	if not if_none_match :
+		return False
+
+	tags = [tag.strip() for tag in if_none_match.split(",")]
+	return "*" in tags or any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in tags)
+
+
+def not_modified_response(headers : Dict[str, str]) -> Response :
+	"""304, with the ETag & Vary headers the 200 response would have had"""
+	return Response(status_code = 304, headers = headers)
+
+
+
+#*-*-*-*-*-*-*-*-*-*-*-*#
+#       Responses       #
+#*-*-*-*-*-*-*-*-*-*-*-*#
+
+# chunks of a streamed body -> chunks sent (e.g. `Compressor.compress_stream`)
+Encoder = Callable[[Iterator[bytes]], Iterator[bytes]]
+
+
+def rows_response(batches : Iterable[List[Dict[str, Any]]], fmt : str = "json", encoder : Optional[Encoder] = None, headers : Optional[Dict[str, str]] = None) -> StreamingResponse :
+	"""
+		Streams batches of rows (e.g. `DataSet.db_iterate`) in a negotiated format : JSON array, NDJSON, CSV,
+		Arrow IPC stream or Parquet, through `encoder` if any. Memory is bounded by one batch, whatever the number of rows
+	"""
+	if fmt == "ndjson" :
+		content = stream_ndjson(batches)
+	elif fmt == "csv" :
+		content = stream_rows_csv(batches)
+	elif fmt in ARROW_FORMATS :
+		content = stream_record_batches(rows_record_batches(batches), fmt)
+	else :
+		content = stream_json_array(batches)
+
+	return StreamingResponse(encoder(content) if encoder else content, media_type = MEDIA_TYPES[fmt], headers = headers)
+
+
+def dataframe_response(df : pd.DataFrame, fmt : str, batch_rows : int, encoder : Optional[Encoder] = None, headers : Optional[Dict[str, str]] = None) -> StreamingResponse :
+	"""Streams a dataframe (with its index) as CSV, Arrow IPC stream or Parquet, `batch_rows` rows at a time, through `encoder` if any"""
+	if fmt == "csv" :
+		content = stream_dataframe_csv(df, batch_rows)
+	else :
+		content = stream_dataframe_arrow(df, fmt, batch_rows)
+
+	return StreamingResponse(encoder(content) if encoder else content, media_type = MEDIA_TYPES[fmt], headers = headers)
+
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+# Project modules
+from src.markI  import MkI
+from src.config import Config
+
+
+
+class SingleFlight(object) :
+	"""
+		Request coalescing : concurrent calls sharing the same key (e.g. ontology & data version)
+		share one in-flight computation and all receive its result (or its exception).
+	"""
+	def __init__(self, mk1 : MkI, config : Config):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		# in-flight computations
+		self.flights = {}
+
+		# counters
+		self.computations = 0
+		self.deduplicated = 0
+
+
+
+	async def do(self, key : Hashable, fn : Callable[[], Awaitable[Any]]) -> Any :
+		"""
+			Awaits the in-flight computation for `key`, or starts `fn()` if there is none
+
+			:param: `fn` - coroutine function, only called by the first caller (the leader)
+		"""
+		task = self.flights.get(key)
+
+		if task is None :
+			task              = asyncio.ensure_future(fn())
+			self.flights[key] = task
+			self.computations += 1
+			task.add_done_callback(lambda _ : self.flights.pop(key, None))
+
+		else :
+			self.deduplicated += 1
+			self.mk1.logging.logger.info("(SingleFlight.do) Request for {} joined an in-flight computation ✅".format(key))
+
+		# A cancelled caller (e.g. client disconnect) must not cancel the shared computation
+		return await asyncio.shield(task)
+
+
+	def stats(self) -> Dict[str, int] :
+		return {
+			"in_flight"    : len(self.flights),
+			"computations" : self.computations,
+			"deduplicated" : self.deduplicated,
+		}
+
@@ -0,0 +1,109 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Project modules
+from src.markI  import MkI
+from src.config import Config
+
+
+
+class Statements(object) :
+	"""
+		Named, parameterized statements issued by the API (the endpoints of `src/main.py` and the
+		per-entity loads they trigger). They are prepared once per process on the `DataSet` and
+		executed with bound values : no SQL is ever built from request values.
+	"""
+	# name -> (query, expanding placeholders i.e. bound to lists of values)
+	statements = {
+		"fetch_customers"        : ("SELECT * FROM customers", ()),
+		"fetch_customer"         : ("SELECT * FROM customers WHERE customer_id = :customer_id", ()),
+		"fetch_loans"            : ("SELECT * FROM loans", ()),
+		"fetch_loan"             : ("SELECT * FROM loans WHERE loan_id = :loan_id", ()),
+		"entity_customers"       : ("SELECT * FROM customers WHERE customer_id IN :customer_ids", ("customer_ids",)),
+		"entity_loans"           : ("SELECT * FROM loans WHERE customer_id IN :customer_ids", ("customer_ids",)),
+		"loans_customers"        : ("SELECT * FROM customers WHERE customer_id IN (SELECT customer_id FROM loans WHERE loan_id IN :loan_ids)", ("loan_ids",)),
+		"loans_customers_loans"  : ("SELECT * FROM loans WHERE customer_id IN (SELECT customer_id FROM loans WHERE loan_id IN :loan_ids)", ("loan_ids",)),
+		"income_range"           : ("SELECT MIN(CAST(annual_income AS REAL)), MAX(CAST(annual_income AS REAL)) FROM customers", ()),
+	}
+
+	# loan dates are stored as "%m/%d/%Y" : this expression sorts them ("%Y-%m-%d"), and is indexed as is
+	loan_day = "substr(loan_date, 7, 4) || '-' || substr(loan_date, 1, 2) || '-' || substr(loan_date, 4, 2)"
+
+	# list endpoints : table -> (keyset column, {filter : (condition, expanding)})
+	listings = {
+		"customers" : ("customer_id", {
+			"customer_id"    : ("customer_id IN :customer_id", True),
+			"min_income"     : ("annual_income >= :min_income", False),
+			"max_income"     : ("annual_income <= :max_income", False),
+		}),
+		"loans"     : ("loan_id", {
+			"customer_id"    : ("customer_id IN :customer_id", True),
+			"loan_date_from" : ("(" + loan_day + ") >= :loan_date_from", False),
+			"loan_date_to"   : ("(" + loan_day + ") <= :loan_date_to", False),
+			"term"           : ("term = :term", False),
+			"loan_status"    : ("loan_status = :loan_status", False),
+		}),
+	}
+
+
+	def __init__(self, mk1 : MkI, config : Config):
+		# system design
+		self.mk1    = mk1
+		self.config = config
+
+		for name, (query_str, expanding) in self.statements.items() :
+			if name not in self.mk1.dataset.statements :
+				self.mk1.dataset.db_prepare(name = name, query_str = query_str, expanding = expanding)
+
+		self.mk1.dataset.db_declare_index(table_name = "loans", columns = (self.loan_day,))
+
+
+
+	def execute(self, name : str, read_only : bool = True, **params : Any) :
+		"""Dataframe of the rows returned by the statement `name` (None on failure)"""
+		return self.mk1.dataset.db_execute(name = name, params = params, read_only = read_only)
+
+
+
+	def listing(self,
+				table_name : str,
+				fields     : Optional[List[str]] = None,
+				after      : Optional[int]       = None,
+				limit      : Optional[int]       = None,
+				**filters  : Any
+				) -> Tuple[str, Dict[str, Any]] :
+		"""
+			Named statement (prepared on first use) & values of a list endpoint : the projection on `fields`
+			(the keyset column is always included), the filters that are not None and the keyset pagination
+			(`key > :after ORDER BY key LIMIT :limit`), all in SQL. Raises a ValueError on unknown fields.
+		"""
+		key, conditions = self.listings[table_name]
+
+		columns = self.mk1.dataset.get_cols(table_name) if table_name in self.mk1.dataset.get_tables() else []
+		unknown = [field for field in (fields or []) if field not in columns]
+		if unknown :
+			raise ValueError("unknown fields for '{}' : {}".format(table_name, unknown))
+
+		params = {name : value for name, value in filters.items() if value is not None}
+		where  = [condition for name, (condition, _) in conditions.items() if name in params]
+
+		if after is not None :
+			params["after"] = after
+			where.append('"{}" > :after'.format(key))
+
+		projection = [column for column in columns if column in (fields or []) or column == key] if fields else []
+		query_str  = "SELECT {} FROM {}".format(", ".join('"{}"'.format(column) for column in projection) or "*", table_name)
+		if where :
+			query_str += " WHERE " + " AND ".join(where)
+		if after is not None or limit is not None :
+			query_str += ' ORDER BY "{}"'.format(key)
+		if limit is not None :
+			params["limit"] = limit
+			query_str      += " LIMIT :limit"
+
+		name = "list:" + query_str
+		if name not in self.mk1.dataset.statements :
+			expanding = [param for param, (_, is_expanding) in conditions.items() if is_expanding and param in params]
+			self.mk1.dataset.db_prepare(name = name, query_str = query_str, expanding = expanding)
+
+		return (name, params)
@@ -0,0 +1,118 @@
+import pytest
+import numpy  as np
+import pandas as pd
+from types import SimpleNamespace
+
+from src.markI            import MkI, DataSet
+from src.config           import Config
+from src.models           import Ontology
+from src.aggregates       import AggregateStore, RunningMoments, compare_feature_matrices
+from src.feature_pipeline import FeaturePipeline
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+@pytest.fixture
+def local_mk1(tmp_path) :
+	"""System design on a temporary database, with the customers & loans tables of `reset_local_dbs`"""
+	dataset = DataSet(config, db_file = str(tmp_path / "aggregates.db"))
+	dataset.db_create_table(table_name = "customers", pk_name = "customer_id", pk_str = "str")
+	dataset.db_create_table(table_name = "loans", pk_name = "loan_id", pk_str = "str")
+
+	return SimpleNamespace(config = config, dataset = dataset, logging = mk1.logging)
+
+
+def test_running_moments() :
+	rng     = np.random.default_rng(0)
+	values  = list(rng.normal(1e6, 50, 40))
+	moments = RunningMoments(shift = values[0])
+	for value in values :
+		moments.add(value)
+
+	# removing values (the max among them) leaves the moments of the remaining ones
+	for value in [max(values), values[3], values[7]] :
+		values.remove(value)
+		moments.remove(value)
+	moments.repair(values)
+
+	expected = pd.Series(values)
+	assert moments.n == len(values)
+	assert np.isclose(moments.sum(), expected.sum()) and np.isclose(moments.mean(), expected.mean())
+	assert np.isclose(moments.std(), expected.std()) and np.isclose(moments.skew(), expected.skew(), rtol = 1e-6)
+	assert (moments.min, moments.max) == (expected.min(), expected.max())
+
+	constant = RunningMoments(shift = 3.0)
+	for _ in range(4) :
+		constant.add(3.0)
+	assert constant.skew() == 0.0 and constant.std() == 0.0
+
+
+def test_aggregate_store_consistency(local_mk1) :
+	dataset = local_mk1.dataset
+	store   = AggregateStore(local_mk1, config)
+
+	customers = [{"customer_id" : str(customer_id), "annual_income" : 20000.0 + 7000 * i} for i, customer_id in enumerate(range(1001, 1009))]
+	loans     = [
+		{
+			"loan_id"     : str(5000 + i),
+			"customer_id" : str(1001 + i % 6),
+			"loan_date"   : "{:02d}/{:02d}/2021".format(1 + (i * 5) % 12, 13 + (i * 7) % 15),
+			"amount"      : 500.0 + (i * 137) % 900,
+			"term"        : "short" if i % 3 else "long",
+			"fee"         : 10.0 + (i * 31) % 70,
+			"loan_status" : str(i % 2),
+		}
+		for i in range(30)
+	]
+	dataset.db_bulk_insert(table_name = "customers", rows = customers)
+	dataset.db_bulk_insert(table_name = "loans", rows = loans)
+
+	assert store.check()["consistent"]
+
+	# single row writes are applied to the running state (the deleted loan is the largest of its customer)
+	dataset.db_append_row(table_name = "loans", input_dict = {**loans[0], "loan_id" : "6000", "customer_id" : "1007", "amount" : 2500.0})
+	dataset.db_delete(table_name = "loans", filters_dict = {"loan_id" : max(loans[1::6], key = lambda loan : loan["amount"])["loan_id"]})
+	assert dataset.db_delete_in(table_name = "customers", col_name = "customer_id", values = ["1003"], cascade = [("loans", "customer_id")]) == {"customers" : 1, "loans" : 5}
+	dataset.db_append_row(table_name = "customers", input_dict = {"customer_id" : "1009", "annual_income" : 99000.0})
+
+	report = store.check()
+	assert report["consistent"] and report["rows"] == 8, report
+	assert store.stats()["rebuilds"] == 1 and store.stats()["repairs"] >= 1
+
+	# per-customer rows, as the Feature Pipeline builds them from the rows of these customers only
+	ids      = [1007, 999999, 1001, 1009]
+	actual   = store.entity_features(ids)
+	expected = FeaturePipeline(local_mk1, config).run_entities(Ontology.customers, ids)
+	assert list(actual.index) == list(expected.index) == [1007, 1001, 1009]
+	assert compare_feature_matrices(actual, expected)["consistent"]
+	assert store.entity_features([999999]).empty
+
+
+def test_aggregate_store_failed_write(local_mk1) :
+	dataset = local_mk1.dataset
+	store   = AggregateStore(local_mk1, config)
+	dataset.db_bulk_insert(table_name = "customers", rows = [{"customer_id" : "1001", "annual_income" : 20000.0}])
+	assert store.rebuild() and not store.stale
+
+	# a row the store cannot apply is still written, and leaves the store stale instead of half updated
+	dataset.db_append_row(table_name = "customers", input_dict = {"customer_id" : "not a number", "annual_income" : 1.0})
+	assert store.stale and len(dataset.db_fetch_df(name = "fetch_customers")) == 2
+
+
+def test_aggregate_store_other_process_write(local_mk1) :
+	dataset = local_mk1.dataset
+	store   = AggregateStore(local_mk1, config)
+	dataset.db_bulk_insert(table_name = "customers", rows = [{"customer_id" : str(customer_id), "annual_income" : 1000.0 * customer_id} for customer_id in range(1, 4)])
+	dataset.db_bulk_insert(table_name = "loans", rows = [{"loan_id" : str(i), "customer_id" : str(1 + i % 3), "loan_date" : "11/0{}/2021".format(1 + i), "amount" : 100.0 * (i + 1), "term" : "short", "fee" : 10.0, "loan_status" : "0"} for i in range(6)])
+	assert len(store.feature_matrix()) == 3 and store.stats()["rebuilds"] == 1
+
+	# own writes are applied without rebuilding
+	dataset.db_append_row(table_name = "customers", input_dict = {"customer_id" : "4", "annual_income" : 4000.0})
+	assert len(store.feature_matrix()) == 4 and store.stats()["rebuilds"] == 1
+
+	# another connection to the same file (as another process) has no write hooks : its writes are seen from the file
+	other = DataSet(config, db_file = dataset.db_file)
+	other.db_append_row(table_name = "customers", input_dict = {"customer_id" : "5", "annual_income" : 5000.0})
+	assert len(store.feature_matrix()) == 5 and store.stats()["rebuilds"] == 2
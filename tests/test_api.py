@@ -1,15 +1,22 @@
+import io
+import os
+import csv
 import json
+import time
+import pandas          as pd
+import pyarrow         as pa
+import pyarrow.parquet as pq
 from dateutil           import parser
 from typing             import Optional, List, Dict, Any
 from fastapi.testclient import TestClient
 from IPython.display    import display
 
 
-from src.main         import app
+from src.main         import app, health, pipeline, statements
 from src.markI        import MkI
 from src.config       import Config
 from src.data_loading import DataLoader
-from src.models       import Customer, LoanStatus, Term, Customer, Loan, CustomerUpdateRequest
+from src.models       import Customer, LoanStatus, Term, Customer, Loan, CustomerUpdateRequest, Ontology
 
 
 client      = TestClient(app)
@@ -23,10 +30,131 @@ def test_create_local_dbs() :
 	
 
 
+def test_query_plans() :
+	response = client.get("/api/v1/database/query_plans")
+	assert response.status_code == 200
+
+	report = {entry["name"] : entry for entry in response.json()}
+	assert report["entity_loans"]["plan"] is not None
+	assert [entry["name"] for entry in report.values() if entry["flagged"]] == []
+	assert report["fetch_loans"]["full_scans"] == ["loans"]
+
+
+
+def test_fetch_rows_streamed() :
+	for endpoint, table_name in [("/api/v1/customers", "customers"), ("/api/v1/loans", "loans")] :
+		num_rows = mk1.dataset.get_rows(table_name = table_name)
+
+		response = client.get(endpoint)
+		assert response.headers["content-type"] == "application/json"
+		rows     = response.json()
+		assert len(rows) == num_rows
+
+		response = client.get(endpoint, headers = {"Accept" : "application/x-ndjson"})
+		assert response.headers["content-type"] == "application/x-ndjson"
+		assert [json.loads(line) for line in response.text.splitlines()] == rows
+
+
+def test_fetch_rows_formats() :
+	rows = client.get("/api/v1/customers").json()
+
+	response = client.get("/api/v1/customers", headers = {"Accept" : "text/csv"})
+	assert response.headers["content-type"].startswith("text/csv")
+	assert [{name : float(value) for name, value in row.items()} for row in csv.DictReader(io.StringIO(response.text))] == [{name : float(value) for name, value in row.items()} for row in rows]
+
+	response = client.get("/api/v1/customers", headers = {"Accept" : "application/vnd.apache.arrow.stream"})
+	assert response.status_code == 200
+	assert pa.ipc.open_stream(response.content).read_all().to_pylist() == rows
+
+	response = client.get("/api/v1/customers", headers = {"Accept" : "application/vnd.apache.parquet"})
+	assert response.status_code == 200
+	assert pq.read_table(io.BytesIO(response.content)).to_pylist() == rows
+
+	assert client.get("/api/v1/customers", headers = {"Accept" : "image/png"}).status_code == 406
+
+
+def test_fetch_rows_compressed() :
+	rows = client.get("/api/v1/loans", headers = {"Accept-Encoding" : "identity"})
+	assert "content-encoding" not in rows.headers and "Accept-Encoding" in rows.headers["vary"]
+
+	response = client.get("/api/v1/loans", headers = {"Accept-Encoding" : "gzip"})
+	assert response.headers["content-encoding"] == "gzip"
+	assert response.json() == rows.json()
+
+	response = client.get("/api/v1/loans", headers = {"Accept-Encoding" : "gzip, zstd"})
+	assert response.headers["content-encoding"] == "zstd"
+	assert response.json() == rows.json()
+
+
+def test_fetch_rows_not_modified() :
+	response = client.get("/api/v1/loans", params = {"limit" : 2})
+	etag     = response.headers["etag"]
+	assert response.status_code == 200 and response.headers["vary"] == "Accept, Accept-Encoding"
+
+	response = client.get("/api/v1/loans", params = {"limit" : 2}, headers = {"If-None-Match" : etag})
+	assert response.status_code == 304 and response.content == b"" and response.headers["etag"] == etag
+
+	# other parameters, format or encoding : another representation
+	assert client.get("/api/v1/loans", params = {"limit" : 3}, headers = {"If-None-Match" : etag}).status_code == 200
+	assert client.get("/api/v1/loans", params = {"limit" : 2}, headers = {"If-None-Match" : etag, "Accept" : "text/csv"}).status_code == 200
+	assert client.get("/api/v1/loans", params = {"limit" : 2}, headers = {"If-None-Match" : etag, "Accept-Encoding" : "identity"}).status_code == 200
+
+	# the in-process write counter differs between workers & restarts : not part of the tag
+	mk1.dataset.bump_version()
+	assert client.get("/api/v1/loans", params = {"limit" : 2}, headers = {"If-None-Match" : etag}).status_code == 304
+
+	# any write to the database file : a new data version
+	mk1.dataset.db_append_row(table_name = "customers", input_dict = {"customer_id" : "990201", "annual_income" : 1.0})
+	try :
+		assert client.get("/api/v1/loans", params = {"limit" : 2}, headers = {"If-None-Match" : etag}).status_code == 200
+	finally :
+		mk1.dataset.db_delete(table_name = "customers", filters_dict = {"customer_id" : "990201"})
+
+
+
+def test_fetch_rows_paginated() :
+	loans = client.get("/api/v1/loans").json()
+
+	# keyset pagination : every loan exactly once, in "loan_id" order
+	pages, after = [], None
+	while True :
+		page = client.get("/api/v1/loans", params = {"limit" : 2, **({"after" : after} if after is not None else {})}).json()
+		if not page :
+			break
+		pages += page
+		after  = page[-1]["loan_id"]
+	assert [loan["loan_id"] for loan in pages] == sorted(loan["loan_id"] for loan in loans)
+
+	# projection & filters
+	rows = client.get("/api/v1/loans", params = {"fields" : "amount,fee", "customer_id" : "1090", "term" : "long"}).json()
+	assert rows and all(set(row) == {"loan_id", "amount", "fee"} for row in rows)
+	assert len(rows) == len([loan for loan in loans if loan["customer_id"] == "1090" and loan["term"] == "long"])
+
+	rows = client.get("/api/v1/loans", params = {"loan_date_from" : "2021-11-01", "loan_date_to" : "2021-11-30"}).json()
+	assert [row["loan_id"] for row in rows] == [loan["loan_id"] for loan in loans if loan["loan_date"].startswith("11/") and loan["loan_date"].endswith("/2021")]
+	name = next(name for name in mk1.dataset.statements if name.startswith("list:") and ":loan_date_from" in name)
+	assert mk1.dataset.db_explain(name = name, params = {"loan_date_from" : "2021-11-01", "loan_date_to" : "2021-11-30"})[0].startswith("SEARCH loans USING INDEX")
+
+	customers = client.get("/api/v1/customers", params = {"min_income" : 40000, "max_income" : 50000}).json()
+	assert customers and all(40000 <= customer["annual_income"] <= 50000 for customer in customers)
+
+	assert client.get("/api/v1/loans", params = {"fields" : "amount,nope"}).status_code == 422
+	assert client.get("/api/v1/loans", params = {"limit" : 0}).status_code == 422
+
+
+def test_fetch_rows_failing_query(monkeypatch) :
+	# the first batch is read before the response starts : a failing query gets an error status, not a cut 200
+	mk1.dataset.db_prepare(name = "list:broken", query_str = "SELECT * FROM no_such_table")
+	monkeypatch.setattr(statements, "listing", lambda table_name, **kwargs : ("list:broken", {}))
+
+	response = client.get("/api/v1/loans")
+	assert response.status_code == 500 and response.json()["detail"] == "Listing failed : OperationalError"
+
+
+
 def test_fetch_customer():
 	response = client.get("/api/v1/customers/1090")
-	response_dict = json.loads(response.json())
-	#response_dict = response.json()
+	response_dict = response.json()
 
 	try :
 		assert response.status_code == 200
@@ -47,8 +175,7 @@ def test_register_customer():
 	}
 
 	response = client.post("/api/v1/customers", json.dumps(data))
-	response_dict = json.loads(response.json())
-	#response_dict = response.json()
+	response_dict = response.json()
 
 
 	try : 
@@ -66,8 +193,7 @@ def test_register_customer():
 def test_delete_customer() : 
 
 	response = client.delete("/api/v1/customers/1090")
-	#response_dict = response.json()
-	response_dict = json.loads(response.json())
+	response_dict = response.json()
 
 	try :
 		assert response.status_code == 200
@@ -81,14 +207,38 @@ def test_delete_customer() :
 
 
 
+def test_delete_customers_cascade() :
+	customers = [{"customer_id" : str(customer_id), "annual_income" : 50000} for customer_id in [990001, 990002, 990003]]
+	loans     = [{"loan_id" : str(990000 + i), "customer_id" : customers[i % 3]["customer_id"], "amount" : 100} for i in range(6)]
+	mk1.dataset.db_bulk_insert(table_name = "customers", rows = customers)
+	mk1.dataset.db_bulk_insert(table_name = "loans", rows = loans)
+
+	response = client.delete("/api/v1/customers?ids=990001,990002")
+
+	try :
+		assert response.status_code == 200
+		assert response.json()["deleted"] == {"customers" : 2, "loans" : 4}
+		assert client.delete("/api/v1/loans?ids=990002,990004").json()["deleted"] == {"loans" : 1}
+		assert client.delete("/api/v1/customers?ids=1,x").status_code == 422
+		# logger
+		mk1.logging.logger.info("(test_api.test_delete_customers_cascade) Endpoint /api/v1/customers?ids= runs sucessfully ✅")
+
+	except Exception as e:
+		mk1.logging.logger.error("(test_api.test_delete_customers_cascade) Hitting endpoint /api/v1/customers?ids= failed (status code {}) : {}".format(response.status_code, e))
+		raise e
+
+	finally :
+		mk1.dataset.db_delete_in(table_name = "customers", col_name = "customer_id", values = [990003], cascade = [("loans", "customer_id")])
+
+
+
 #*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
 #          Endpoint : Loans         #
 #*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*#
 
 def test_fetch_loan():
 	response      = client.get("/api/v1/loans/1")
-	#response_dict = response.json()
-	response_dict = json.loads(response.json())
+	response_dict = response.json()
 
 	try :
 		assert response.status_code == 200
@@ -120,8 +270,7 @@ def test_register_loan():
 	}
 
 	response = client.post("/api/v1/loans", json.dumps(data))
-	#response_dict = response.json()
-	response_dict = json.loads(response.json())
+	response_dict = response.json()
 
 
 	try : 
@@ -145,8 +294,7 @@ def test_register_loan():
 def test_delete_loan() : 
 
 	response = client.delete("/api/v1/loans/1")
-	#response_dict = response.json()
-	response_dict = json.loads(response.json())
+	response_dict = response.json()
 
 
 	try :
@@ -167,7 +315,7 @@ def test_delete_loan() :
 
 def test_fetch_features_customers():
 	response = client.get("/api/v1/features/customers")
-	print(json.dumps(json.loads(response.json()), indent = 4, sort_keys = True))
+	print(json.dumps(response.json(), indent = 4, sort_keys = True))
 
 	try :
 		assert response.status_code == 200
@@ -179,7 +327,7 @@ def test_fetch_features_customers():
 
 def test_fetch_features_loans():
 	response = client.get("/api/v1/features/loans")
-	print(json.dumps(json.loads(response.json()), indent = 4, sort_keys = True))
+	print(json.dumps(response.json(), indent = 4, sort_keys = True))
 
 	try :
 		assert response.status_code == 200
@@ -189,6 +337,87 @@ def test_fetch_features_loans():
 		mk1.logging.logger.error("(test_api.test_delete_loan) Hitting endpoint /api/v1/features/customers failed (status code {}) : {}".format(response.status_code, e))
 		raise e
 
+def test_fetch_features_unknown_ontology():
+	response = client.get("/api/v1/features/payments")
+
+	try :
+		assert response.status_code == 422
+		mk1.logging.logger.info("(test_api.test_fetch_features_unknown_ontology) Endpoint /api/v1/features/payments was rejected sucessfully ✅")
+
+	except Exception as e:
+		mk1.logging.logger.error("(test_api.test_fetch_features_unknown_ontology) Hitting endpoint /api/v1/features/payments was not rejected (status code {}) : {}".format(response.status_code, e))
+		raise e
+
+def test_fetch_entity_features_errors():
+	response = client.get("/api/v1/features/customers/999999999")
+
+	try :
+		assert response.status_code == 404
+		assert client.get("/api/v1/features/customers/abc").status_code == 422
+		assert client.get("/api/v1/features/loans?ids=1,x").status_code == 422
+		assert client.get("/api/v1/features/loans?ids=").json() == []
+		mk1.logging.logger.info("(test_api.test_fetch_entity_features_errors) Endpoint /api/v1/features/customers/{id} rejects unknown & malformed ids sucessfully ✅")
+
+	except Exception as e:
+		mk1.logging.logger.error("(test_api.test_fetch_entity_features_errors) Hitting endpoint /api/v1/features/customers/999999999 failed (status code {}) : {}".format(response.status_code, e))
+		raise e
+
+
+def test_features_job(monkeypatch, tmp_path):
+	customers = [{"customer_id" : str(customer_id), "annual_income" : 20000.0 * (i + 1)} for i, customer_id in enumerate([990101, 990102, 990103])]
+	loans     = [
+		{"loan_id" : str(990100 + i), "customer_id" : customers[i % 3]["customer_id"], "loan_date" : "11/{:02d}/2021".format(1 + i), "amount" : 100.0 * (i + 1), "term" : "short", "fee" : 10.0 + i, "loan_status" : str(i % 2)}
+		for i in range(6)
+	]
+	mk1.dataset.db_bulk_insert(table_name = "customers", rows = customers)
+	mk1.dataset.db_bulk_insert(table_name = "loans", rows = loans)
+
+	# every build (job, pipeline or aggregate store) stores the matrix to a temporary file, not to the repo's one
+	features_path = str(tmp_path / "features_customers.csv")
+	monkeypatch.setitem(pipeline.features_paths, Ontology.customers, features_path)
+
+	response = client.post("/api/v1/jobs/features/customers")
+	job_id   = response.json()["job_id"]
+
+	try :
+		assert response.status_code == 202
+
+		for _ in range(600) :
+			job_dict = client.get(f"/api/v1/jobs/{job_id}").json()
+			if job_dict["status"] in ("done", "failed") :
+				break
+			time.sleep(0.1)
+
+		assert job_dict["status"] == "done", job_dict["error"]
+		assert list(job_dict["stages"].keys()) == ["load", "preprocess", "extract", "dfs", "store"]
+		assert all(stage["status"] == "done" for stage in job_dict["stages"].values())
+		assert client.get("/api/v1/jobs/unknown").status_code == 404
+
+		# the job's matrix is the one of the feature endpoint
+		result   = pd.DataFrame(client.get(f"/api/v1/jobs/{job_id}/result").json())
+		features = pd.DataFrame(client.get("/api/v1/features/customers").json())
+		assert len(result) == len(customers) + 1
+		pd.testing.assert_frame_equal(result, features, check_exact = False)
+
+		# after a write, the matrix built by the aggregate store is stored like the pipeline's one
+		assert len(pd.read_csv(features_path)) == len(result)
+		os.remove(features_path)
+		mk1.dataset.db_append_row(table_name = "customers", input_dict = {"customer_id" : "990104", "annual_income" : 80000.0})
+		features = pd.DataFrame(client.get("/api/v1/features/customers").json())
+		assert len(features) == len(result) + 1 and len(pd.read_csv(features_path)) == len(features)
+
+		# the store matches a full rebuild (built in the process pool)
+		report = client.get("/api/v1/aggregates", params = {"check" : "true"}).json()
+		assert report["check"]["consistent"] and report["check"]["rows"] == len(features), report
+		mk1.logging.logger.info("(test_api.test_features_job) Endpoint /api/v1/jobs/features/customers runs sucessfully ✅")
+
+	except Exception as e:
+		mk1.logging.logger.error("(test_api.test_features_job) Hitting endpoint /api/v1/jobs/features/customers failed (status code {}) : {}".format(response.status_code, e))
+		raise e
+
+	finally :
+		mk1.dataset.db_delete_in(table_name = "customers", col_name = "customer_id", values = [990101, 990102, 990103, 990104], cascade = [("loans", "customer_id")])
+
 def test_upload_features_customers():
 	response = client.post("/api/v1/features/customers", "customers")
 
@@ -213,9 +442,45 @@ def test_upload_features_loans():
 		raise e
 
 
+def test_health_probes(monkeypatch) :
+	response_live = client.get("/healthz")
+	assert response_live.status_code == 200
+	assert response_live.json()["status"] == "UP"
+
+	# db reachable & features files present
+	monkeypatch.setattr(health, "check_db", lambda : True)
+	response_ready = client.get("/readyz")
+	assert response_ready.status_code == 200, response_ready.json()
+	assert set(response_ready.json().keys()) == {"status", "db", "features_files_age", "last_builds", "failing"}
+	assert response_ready.json()["failing"] == []
+
+	# features files too old
+	monkeypatch.setattr(health, "features_max_age", 1e-6)
+	assert client.get("/readyz").status_code == 503
+	assert client.get("/readyz").json()["failing"] == ["features_files_age"]
+	monkeypatch.setattr(health, "features_max_age", 0.0)
+
+	# features files removed
+	monkeypatch.setattr(health, "features_paths", {ontology : fn_path + ".missing" for ontology, fn_path in health.features_paths.items()})
+	response_ready = client.get("/readyz")
+	assert response_ready.status_code == 503
+	assert response_ready.json()["failing"] == ["features_files_age"]
+	assert response_ready.json()["features_files_age"] == {"customers" : None, "loans" : None}
+
+	# db unreachable (with the features files back)
+	monkeypatch.undo()
+	monkeypatch.setattr(health, "check_db", lambda : False)
+	response_ready = client.get("/readyz")
+	assert response_ready.status_code == 503
+	assert response_ready.json()["failing"] == ["db"]
+	assert client.get("/api/v1/api_status").json()["status"] == "DOWN"
+
+	mk1.logging.logger.info("(test_api.test_health_probes) Endpoints /healthz and /readyz run sucessfully ✅")
+
+
 def test_api_status() : 
 	response = client.get("/api/v1/api_status")
-	response_dict = json.loads(response.json())
+	response_dict = response.json()
 	print(response, response_dict, response_dict["status"])
 
 	try :
@@ -0,0 +1,50 @@
+import gzip
+import zstandard
+
+from src.markI       import MkI
+from src.config      import Config
+from src.compression import Compressor
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+def test_negotiate_encoding() :
+	compressor           = Compressor(mk1, config)
+	compressor.available = ["zstd", "gzip"]
+
+	assert compressor.negotiate(None) is None
+	assert compressor.negotiate("gzip, deflate") == "gzip"
+	assert compressor.negotiate("gzip, zstd") == "zstd"
+	assert compressor.negotiate("gzip;q=1, zstd;q=0.5") == "gzip"
+	assert compressor.negotiate("zstd;q=0, *") == "gzip"
+	assert compressor.negotiate("br, identity") is None
+
+	compressor.available = ["gzip"]
+	assert compressor.negotiate("zstd") is None
+
+
+def test_compress() :
+	compressor          = Compressor(mk1, config)
+	compressor.min_size = 100
+	body                = b'{"customer_id":1090,"amount":2426.5},' * 100
+
+	assert compressor.applicable("gzip", len(body)) == "gzip" and compressor.applicable("gzip", 10) is None
+	assert compressor.headers(None) == {"Vary" : "Accept-Encoding"}
+
+	# whole bodies are deterministic, streamed bodies decode to the same bytes
+	assert compressor.compress(body, "gzip") == compressor.compress(body, "gzip")
+	assert gzip.decompress(compressor.compress(body, "gzip")) == body
+	assert gzip.decompress(b"".join(compressor.compress_stream(iter([body[:500], b"", body[500:]]), "gzip"))) == body
+	assert b"".join(compressor.compress_stream(iter([body]), None)) == body
+
+
+def test_compress_zstd() :
+	compressor = Compressor(mk1, config)
+	body       = b'{"customer_id":1090,"amount":2426.5},' * 100
+
+	assert compressor.available == ["zstd", "gzip"] and compressor.negotiate("gzip, zstd") == "zstd"
+
+	assert zstandard.ZstdDecompressor().decompress(compressor.compress(body, "zstd")) == body
+	assert zstandard.ZstdDecompressor().decompressobj().decompress(b"".join(compressor.compress_stream(iter([body[:500], body[500:]]), "zstd"))) == body
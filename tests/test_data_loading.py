@@ -0,0 +1,148 @@
+import os
+import gzip
+import shutil
+import numpy  as np
+import pandas as pd
+
+from src.markI        import MkI
+from src.config       import Config
+from src.data_loading import DataLoader
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+def load_frames_eagerly(data_loader : DataLoader) :
+	customers_df, loans_df = data_loader.split_dataframes(data_loader.load_data_from_json())
+	customers_df           = data_loader.preprocess_customers_dataframe(customers_df)
+	loans_df               = data_loader.postprocess_loans_dataframe(data_loader.preprocess_loans_dataframe(loans_df))
+
+	return (customers_df, loans_df)
+
+
+def test_streaming_loader_matches_eager_loader(tmp_path) :
+	data_loader                  = DataLoader(mk1, config)
+	expected_customers, expected_loans = load_frames_eagerly(data_loader)
+
+	# tiny blocks & chunks : entries are split across reads and typed in several chunks
+	data_loader.data_read_size  = 7
+	data_loader.data_chunk_size = 3
+
+	gzip_path = str(tmp_path / "data.json.gz")
+	with open(data_loader.data_json_path, "rb") as fn, gzip.open(gzip_path, "wb") as gz :
+		shutil.copyfileobj(fn, gz)
+
+	for fn_path in [data_loader.data_json_path, gzip_path] :
+		customers_df, loans_df = data_loader.load_data_from_json_stream(fn_path)
+
+		assert customers_df["customer_id"].dtype == "int64"
+		assert loans_df["loan_id"].dtype == "int64"
+		assert list(loans_df.columns) == list(expected_loans.columns)
+
+		for df, expected_df in [(customers_df, expected_customers), (loans_df, expected_loans)] :
+			for col in expected_df.columns :
+				expected = expected_df[col] if expected_df[col].dtype != object or col == "term" else pd.to_numeric(expected_df[col])
+				pd.testing.assert_series_equal(df[col], expected, check_dtype = False)
+
+
+def test_snapshot_skips_json_parsing(tmp_path, monkeypatch) :
+	data_loader                   = DataLoader(mk1, config)
+	data_loader.data_snapshot_dir = str(tmp_path / "snapshot")
+	fn_path                       = str(tmp_path / "data.json")
+	shutil.copyfile(data_loader.data_json_path, fn_path)
+
+	# Cold start : streamed from the json file & snapshotted
+	customers_df, loans_df = data_loader.load_data_from_snapshot(fn_path)
+	assert data_loader.read_snapshot_manifest() is not None
+
+	# Valid snapshot (same content, even with a new mtime) : no json parsing at all
+	streamed = []
+	stream   = data_loader.load_data_from_json_stream
+	monkeypatch.setattr(data_loader, "load_data_from_json_stream", lambda *args : streamed.append(args) or stream(*args))
+
+	for touch in [False, True] :
+		if touch :
+			os.utime(fn_path, ns = (os.stat(fn_path).st_atime_ns, os.stat(fn_path).st_mtime_ns + 10 ** 9))
+
+		snapshot_customers_df, snapshot_loans_df = data_loader.load_data_from_snapshot(fn_path)
+		assert isinstance(snapshot_loans_df["amount"].values, np.memmap)
+		pd.testing.assert_frame_equal(snapshot_customers_df.copy(), customers_df)
+		pd.testing.assert_frame_equal(snapshot_loans_df.copy(), loans_df)
+	assert streamed == []
+
+	# Changed content : the snapshot is rebuilt
+	with open(fn_path, "a") as fn :
+		fn.write("\n")
+	data_loader.load_data_from_snapshot(fn_path)
+	assert len(streamed) == 1
+
+
+def test_csv_loader_matches_json_loader(tmp_path) :
+	data_loader                   = DataLoader(mk1, config)
+	data_loader.data_chunk_size   = 20
+	data_loader.data_snapshot_dir = str(tmp_path / "snapshot")
+
+	customers_df, loans_df = data_loader.load_data_from_csv()
+	assert customers_df["customer_id"].is_unique
+	assert isinstance(loans_df["term"].dtype, pd.CategoricalDtype)
+	assert loans_df["loan_id"].tolist() == list(range(len(loans_df)))
+
+	# same customers & loans as the json file (in another order)
+	json_customers_df, json_loans_df = data_loader.load_data_from_json_stream()
+	pd.testing.assert_frame_equal(
+		customers_df.sort_values("customer_id", ignore_index = True),
+		json_customers_df.sort_values("customer_id", ignore_index = True)
+	)
+	columns = ["customer_id", "loan_date", "amount", "fee", "loan_status"]
+	pd.testing.assert_frame_equal(
+		loans_df[columns].sort_values(columns, ignore_index = True),
+		json_loans_df[columns].sort_values(columns, ignore_index = True)
+	)
+
+	# categorical columns survive the snapshot
+	data_loader.load_data_from_snapshot(data_loader.data_csv_path, data_loader.load_data_from_csv)
+	_, snapshot_loans_df = data_loader.load_data_from_snapshot(data_loader.data_csv_path, data_loader.load_data_from_csv)
+	pd.testing.assert_frame_equal(snapshot_loans_df.copy(), loans_df)
+
+
+def test_bulk_insert_is_one_transaction() :
+	data_loader = DataLoader(mk1, config)
+	mk1.dataset.db_delete_table(table_name = "bulk_test")
+	mk1.dataset.db_create_table(table_name = "bulk_test", pk_name = "row_id", pk_str = "int")
+
+	try :
+		rows  = [{"row_id" : row_id, "amount" : row_id * 10} for row_id in range(1, 1001)]
+		stats = data_loader.push_data_to_local_db(db_name = "bulk_test", data = rows)
+		assert stats["rows"] == 1000 and stats["rows_per_sec"] > 0
+		assert mk1.dataset.db_query(query_str = "SELECT count(*) AS n FROM bulk_test")["n"][0] == 1000
+
+		# a failing row in a later chunk rolls the whole batch back
+		rows = [{"row_id" : row_id, "amount" : row_id} for row_id in range(1001, 1100)] + [{"row_id" : 1100, "amount" : object()}]
+		assert mk1.dataset.db_bulk_insert(table_name = "bulk_test", rows = iter(rows), chunk_size = 10) is None
+		assert mk1.dataset.db_query(query_str = "SELECT count(*) AS n FROM bulk_test")["n"][0] == 1000
+
+		try :
+			data_loader.push_data_to_local_db(db_name = "bulk_test", data = rows)
+			assert False
+		except RuntimeError :
+			pass
+
+	finally :
+		mk1.dataset.db_delete_table(table_name = "bulk_test")
+
+
+def test_clear_local_db_single_statement() :
+	data_loader = DataLoader(mk1, config)
+	mk1.dataset.db_delete_table(table_name = "truncate_test")
+	mk1.dataset.db_create_table(table_name = "truncate_test", pk_name = "row_id", pk_str = "int")
+
+	try :
+		mk1.dataset.db_bulk_insert(table_name = "truncate_test", rows = ({"row_id" : row_id} for row_id in range(1, 501)))
+		assert mk1.dataset.db_delete_in(table_name = "truncate_test", col_name = "row_id", values = range(1, 11)) == {"truncate_test" : 10}
+
+		data_loader.clear_local_db(db_name = "truncate_test", pk = "row_id", vacuum = True)
+		assert mk1.dataset.db_query(query_str = "SELECT count(*) AS n FROM truncate_test")["n"][0] == 0
+
+	finally :
+		mk1.dataset.db_delete_table(table_name = "truncate_test")
@@ -0,0 +1,65 @@
+from src.markI         import MkI
+from src.config        import Config
+from src.feature_cache import FeatureCache
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+def test_feature_cache_hit_miss() :
+	feature_cache = FeatureCache(mk1, config)
+	version       = feature_cache.data_version()
+
+	assert feature_cache.get("customers", version) is None
+	feature_cache.put("customers", version, "[]", size = 2)
+	assert feature_cache.get("customers", version) == "[]"
+
+	stats = feature_cache.stats()
+	assert stats["hits"] == 1
+	assert stats["misses"] == 1
+
+
+def test_feature_cache_invalidated_by_db_write() :
+	feature_cache = FeatureCache(mk1, config)
+	version       = feature_cache.data_version()
+	feature_cache.put("loans", version, "[]", size = 2)
+
+	mk1.dataset.bump_version()
+	assert feature_cache.data_version() != version
+	assert feature_cache.get("loans", feature_cache.data_version()) is None
+
+
+def test_feature_cache_lru_eviction() :
+	feature_cache             = FeatureCache(mk1, config)
+	feature_cache.max_entries = 2
+
+	feature_cache.put("a", (0, None), "1", size = 1)
+	feature_cache.put("b", (0, None), "2", size = 1)
+	feature_cache.get("a", (0, None))
+	feature_cache.put("c", (0, None), "3", size = 1)
+
+	assert feature_cache.get("b", (0, None)) is None
+	assert feature_cache.get("a", (0, None)) == "1"
+	assert feature_cache.stats()["evictions"] == 1
+
+
+def test_feature_cache_bodies() :
+	feature_cache           = FeatureCache(mk1, config)
+	feature_cache.max_bytes = 100
+
+	feature_cache.put("a", (0, None), "matrix a", size = 10)
+	feature_cache.put_body("a", (0, None), "json", b"x" * 40)
+	assert feature_cache.get_body("a", (0, None), "json") == b"x" * 40
+	assert feature_cache.get_body("a", (0, None), "csv") is None
+	assert feature_cache.stats()["bytes"] == 50
+
+	# bodies count in the size cap, and leave with their matrix
+	feature_cache.put("b", (0, None), "matrix b", size = 10)
+	feature_cache.put_body("b", (0, None), "json", b"y" * 60)
+	assert feature_cache.get("a", (0, None)) is None and feature_cache.get_body("a", (0, None), "json") is None
+	assert feature_cache.stats()["bytes"] == 70
+
+	# no body without its matrix
+	feature_cache.put_body("c", (0, None), "json", b"z")
+	assert feature_cache.get_body("c", (0, None), "json") is None
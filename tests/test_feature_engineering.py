@@ -0,0 +1,111 @@
+import pandas       as pd
+import featuretools as ft
+
+from src.markI               import MkI
+from src.config              import Config
+from src.data_loading        import DataLoader
+from src.feature_engineering import FeatureEngineer
+from src.feature_pipeline    import FeaturePipeline
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+def load_frames() :
+	data_loader            = DataLoader(mk1, config)
+	customers_df, loans_df = data_loader.split_dataframes(data_loader.load_data_from_json())
+	customers_df           = data_loader.preprocess_customers_dataframe(customers_df)
+	loans_df               = data_loader.postprocess_loans_dataframe(data_loader.preprocess_loans_dataframe(loans_df))
+
+	feature_engineer = FeatureEngineer(mk1, config)
+	loans_df         = feature_engineer.extract_features_loans(loans_df)
+	customers_df     = feature_engineer.extract_features_customers(customers_df)
+
+	return (customers_df, loans_df)
+
+
+def build_feature_engineer(customers_df : pd.DataFrame, loans_df : pd.DataFrame, engine : str) :
+	feature_engineer        = FeatureEngineer(mk1, config)
+	feature_engineer.engine = engine
+	feature_engineer.add_dataframe("customers", customers_df.copy(), "customer_id")
+	feature_engineer.add_dataframe("loans", loans_df.copy(), "loan_id")
+	feature_engineer.add_relationship("customers", "customer_id", "loans", "customer_id")
+
+	return feature_engineer
+
+
+def test_native_engine_parity() :
+	customers_df, loans_df = load_frames()
+
+	for target_name in ["customers", "loans"] :
+		dfs_df, _    = build_feature_engineer(customers_df, loans_df, "featuretools").build_feature_matrix(target_name)
+		native_df, _ = build_feature_engineer(customers_df, loans_df, "native").build_feature_matrix(target_name)
+
+		pd.testing.assert_frame_equal(native_df, dfs_df)
+
+
+def test_run_dfs_matches_separate_dfs_runs() :
+	customers_df, loans_df = load_frames()
+	feature_engineer       = build_feature_engineer(customers_df, loans_df, "featuretools")
+
+	for target_name in ["loans", "customers"] :
+		features_df, _ = feature_engineer.run_dfs(target_name)
+		expected_df, _ = ft.dfs(
+			dataframes            = {"customers" : (customers_df.copy(), "customer_id"), "loans" : (loans_df.copy(), "loan_id")},
+			relationships         = [("customers", "customer_id", "loans", "customer_id")],
+			target_dataframe_name = target_name,
+		)
+
+		pd.testing.assert_frame_equal(features_df, expected_df)
+
+	# The EntitySet was built once
+	assert feature_engineer.entityset is not None
+
+
+def test_saved_features_defs_are_reused(tmp_path, monkeypatch) :
+	customers_df, loans_df = load_frames()
+	defs_paths             = {target_name : str(tmp_path / "features_defs_{}.json".format(target_name)) for target_name in ["customers", "loans"]}
+
+	def build(customers_df, loans_df) :
+		feature_engineer                     = build_feature_engineer(customers_df, loans_df, "featuretools")
+		feature_engineer.features_defs_paths = defs_paths
+		return feature_engineer
+
+	# First build : DFS planning, definitions are saved
+	expected = {target_name : build(customers_df, loans_df).run_dfs(target_name)[0] for target_name in ["loans", "customers"]}
+	assert all((tmp_path / "features_defs_{}.json".format(target_name)).exists() for target_name in defs_paths)
+
+	# Later builds (& a fresh process) : no DFS planning, only the feature matrix calculation
+	FeatureEngineer.saved_features_defs.clear()
+	build(customers_df, loans_df).preload_features_defs()
+	planned = []
+	dfs     = ft.dfs
+	monkeypatch.setattr(ft, "dfs", lambda *args, **kwargs : planned.append(kwargs) or dfs(*args, **kwargs))
+
+	for target_name in ["loans", "customers"] :
+		features_df, _ = build(customers_df, loans_df).run_dfs(target_name)
+		pd.testing.assert_frame_equal(features_df, expected[target_name])
+	assert planned == []
+
+	# Input schema change : the saved definitions are invalidated & re-planned
+	features_df, _ = build(customers_df, loans_df.drop(columns = ["fee_pct"])).run_dfs("loans")
+	assert len(planned) > 0
+	assert not any("fee_pct" in column for column in features_df.columns)
+
+
+def test_entity_features_match_full_matrix(monkeypatch) :
+	pipeline = FeaturePipeline(mk1, config)
+	monkeypatch.setattr(pipeline.data_loader, "check_if_local_db_empty", lambda db_name : True)
+
+	customers_df, loans_df = pipeline.preprocess_data(*pipeline.load_data())
+	customers_df, loans_df = pipeline.extract_features(customers_df, loans_df)
+	customer_ids           = [int(customer_id) for customer_id in customers_df["customer_id"].iloc[[7, 3, 42]]]
+	loan_ids               = [int(loan_id) for loan_id in loans_df["loan_id"].iloc[[5, 120]]]
+
+	for ontology, ids in [("customers", customer_ids), ("loans", loan_ids)] :
+		expected_df    = pipeline.run_dfs(ontology, customers_df.copy(), loans_df.copy()).loc[ids]
+		features_df    = pipeline.run_entities(ontology, ids + [10 ** 9])
+
+		assert list(features_df.index) == ids
+		assert features_df.to_json(orient = "records") == expected_df.to_json(orient = "records")
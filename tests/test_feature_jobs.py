@@ -0,0 +1,45 @@
+import time
+import threading
+import pandas as pd
+from types              import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import src.feature_jobs
+from src.markI        import MkI
+from src.config       import Config
+from src.models       import JobStatus, JobStage
+from src.feature_jobs import FeatureJobs
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+def test_feature_job_callback_and_shutdown(monkeypatch) :
+	release = threading.Event()
+
+	def build_features(ontology, stages, features_path = None) :
+		stages.put(JobStage.load.value)
+		release.wait(5)
+		return pd.DataFrame({"customer_id" : [1, 2]})
+
+	def on_done(job) :
+		raise RuntimeError("cache is full")
+
+	# the pipeline runs in threads instead of the process pool
+	monkeypatch.setattr(src.feature_jobs, "build_features", build_features)
+	executors    = SimpleNamespace(process_pool = ThreadPoolExecutor(max_workers = 1), process_start_method = config.get("executors","process_start_method"))
+	feature_jobs = FeatureJobs(mk1, config, executors)
+	job          = feature_jobs.submit("customers", on_done = on_done)
+
+	# shutting down while the job runs waits for it, without deadlocking on the lock of the jobs
+	shutdown = threading.Thread(target = feature_jobs.shutdown)
+	shutdown.start()
+	time.sleep(0.2)
+	release.set()
+	shutdown.join(10)
+	executors.process_pool.shutdown()
+
+	assert not shutdown.is_alive()
+	assert job.status == JobStatus.done and job.finished_at is not None and job.error is None
+	assert len(job.result) == 2 and feature_jobs.num_pending == 0
@@ -0,0 +1,150 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.markI       import MkI
+from src.config      import Config
+from src.query_plans import QueryPlanner
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+def test_connection_pragmas() :
+	for read_only in [False, True] :
+		assert mk1.dataset.db_query(query_str = "PRAGMA synchronous", read_only = read_only).iloc[0, 0] == 1   # NORMAL
+		assert mk1.dataset.db_query(query_str = "PRAGMA temp_store", read_only = read_only).iloc[0, 0] == 2    # MEMORY
+		assert mk1.dataset.db_query(query_str = "PRAGMA cache_size", read_only = read_only).iloc[0, 0] == int(config.get("db", "db_cache_size"))
+
+	assert mk1.dataset.db_query(query_str = "PRAGMA journal_mode").iloc[0, 0] == "wal"
+
+
+def test_read_only_connection_rejects_writes() :
+	mk1.dataset.db_delete_table(table_name = "read_only_test")
+	mk1.dataset.db_create_table(table_name = "read_only_test", pk_name = "row_id", pk_str = "int")
+
+	try :
+		mk1.dataset.db_bulk_insert(table_name = "read_only_test", rows = [{"row_id" : 1}])
+		assert mk1.dataset.db_query(query_str = "SELECT count(*) AS n FROM read_only_test", read_only = True)["n"][0] == 1
+		assert mk1.dataset.db_query(query_str = "DELETE FROM read_only_test", read_only = True) is None
+		assert mk1.dataset.db_query(query_str = "SELECT count(*) AS n FROM read_only_test")["n"][0] == 1
+
+	finally :
+		mk1.dataset.db_delete_table(table_name = "read_only_test")
+
+
+def test_connection_per_thread() :
+	connections = {}
+	barrier     = threading.Barrier(4)
+
+	# connections are keyed by thread ident, which is reused once a thread exits : all the threads stay alive together
+	def connect(name) :
+		connections[name] = (mk1.dataset.db.executable, mk1.dataset.db_read_only.executable)
+		barrier.wait()
+
+	threads = [threading.Thread(target = connect, args = (i,)) for i in range(4)]
+	for thread in threads :
+		thread.start()
+	for thread in threads :
+		thread.join()
+
+	assert len({id(rw) for rw, _ in connections.values()}) == 4
+	assert len({id(ro) for _, ro in connections.values()}) == 4
+
+
+def test_pool_thread_connections_closed_on_exit() :
+	pool       = ThreadPoolExecutor(max_workers = 2, initializer = mk1.dataset.db_release_on_exit)
+	thread_ids = set(pool.map(lambda _ : (mk1.dataset.db.executable, mk1.dataset.db_read_only.executable, threading.get_ident())[-1], range(8)))
+	assert thread_ids <= set(mk1.dataset.db.connections) and thread_ids <= set(mk1.dataset.db_read_only.connections)
+
+	pool.shutdown(wait = True)
+	assert not thread_ids & (set(mk1.dataset.db.connections) | set(mk1.dataset.db_read_only.connections))
+
+
+def test_declared_indexes() :
+	query_planner = QueryPlanner(mk1, config)
+	list_indexes  = lambda : set(mk1.dataset.db_query(query_str = "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'index_test'")["name"])
+
+	mk1.dataset.db_delete_table(table_name = "index_test")
+	mk1.dataset.indexes["index_test"] = [("customer_id",), ("customer_id", "loan_date")]
+
+	try :
+		for _ in range(2) :
+			# no columns before the first insert : the indexes are created right after it, and only once
+			mk1.dataset.db_create_table(table_name = "index_test", pk_name = "row_id", pk_str = "int")
+			mk1.dataset.db_bulk_insert(table_name = "index_test", rows = [{"row_id" : 1, "customer_id" : 1, "loan_date" : "01/01/2020", "amount" : 1}])
+			assert list_indexes() == {"ix_index_test_customer_id", "ix_index_test_customer_id_loan_date"}
+			assert mk1.dataset.db_ensure_indexes(table_name = "index_test") == []
+
+			plan = mk1.dataset.db_explain(query_str = "SELECT * FROM index_test WHERE customer_id == 1")
+			assert query_planner.full_scans(plan) == []
+			plan = mk1.dataset.db_explain(query_str = "SELECT * FROM index_test WHERE amount == 1")
+			assert query_planner.full_scans(plan) == ["index_test"]
+
+			mk1.dataset.db_delete_table(table_name = "index_test")
+
+	finally :
+		mk1.dataset.indexes.pop("index_test")
+		mk1.dataset.db_delete_table(table_name = "index_test")
+
+
+def test_named_statements() :
+	mk1.dataset.db_delete_table(table_name = "statements_test")
+	mk1.dataset.db_bulk_insert(table_name = "statements_test", rows = [{"row_id" : row_id, "name" : "row {}".format(row_id)} for row_id in range(1, 11)])
+	mk1.dataset.db_prepare(name = "statements_test_row", query_str = "SELECT * FROM statements_test WHERE row_id = :row_id")
+	mk1.dataset.db_prepare(name = "statements_test_rows", query_str = "SELECT * FROM statements_test WHERE row_id IN :row_ids", expanding = ["row_ids"])
+
+	try :
+		assert mk1.dataset.db_execute(name = "statements_test_row", params = {"row_id" : 3}, read_only = True)["name"].tolist() == ["row 3"]
+		assert mk1.dataset.db_execute(name = "statements_test_rows", params = {"row_ids" : [2, 5, 42]}, read_only = True)["row_id"].tolist() == [2, 5]
+
+		# values are bound, never formatted into the query
+		assert mk1.dataset.db_execute(name = "statements_test_row", params = {"row_id" : "1 OR 1 = 1"}, read_only = True).empty
+		assert mk1.dataset.db_execute(name = "statements_test_row", params = {"row_id" : "1; DROP TABLE statements_test"}).empty
+		assert mk1.dataset.get_rows(table_name = "statements_test") == 10
+
+	finally :
+		mk1.dataset.db_delete_table(table_name = "statements_test")
+
+
+def test_iterate_in_batches() :
+	mk1.dataset.db_delete_table(table_name = "iterate_test")
+	mk1.dataset.db_bulk_insert(table_name = "iterate_test", rows = [{"row_id" : row_id} for row_id in range(1, 26)])
+	mk1.dataset.db_prepare(name = "iterate_test_rows", query_str = "SELECT row_id FROM iterate_test WHERE row_id > :min_row_id ORDER BY row_id")
+
+	try :
+		batches = mk1.dataset.db_iterate(name = "iterate_test_rows", params = {"min_row_id" : 5}, batch_size = 8)
+		sizes   = [len(next(batches))]
+
+		# the next batches are fetched from other threads (like a streamed response)
+		def consume() :
+			sizes.extend(len(batch) for batch in batches)
+
+		thread = threading.Thread(target = consume)
+		thread.start()
+		thread.join()
+
+		assert sizes == [8, 8, 4]
+
+	finally :
+		mk1.dataset.db_delete_table(table_name = "iterate_test")
+
+
+def test_data_version_sees_other_connections() :
+	mk1.dataset.db_delete_table(table_name = "version_test")
+	mk1.dataset.db_bulk_insert(table_name = "version_test", rows = [{"row_id" : 1}])
+
+	try :
+		version = mk1.dataset.data_version()
+		assert mk1.dataset.get_rows(table_name = "version_test") == 1 and mk1.dataset.data_version() == version
+
+		# a write of another process (own connection, the write counter of this process is unchanged)
+		connection = sqlite3.connect(mk1.dataset.db_file)
+		connection.execute("INSERT INTO version_test (row_id) VALUES (2)")
+		connection.commit()
+		assert mk1.dataset.data_version() != version and mk1.dataset.data_version()[0] == version[0]
+		connection.close()
+
+	finally :
+		mk1.dataset.db_delete_table(table_name = "version_test")
@@ -0,0 +1,81 @@
+import io
+import json
+import pytest
+import numpy           as np
+import pandas          as pd
+import pyarrow         as pa
+import pyarrow.parquet as pq
+from fastapi import HTTPException
+
+from src.responses import dataframe_to_json, stream_json_array, stream_ndjson, stream_dataframe_csv, stream_dataframe_arrow, negotiate, entity_tag, etag_matches
+
+
+def test_dataframe_to_json() :
+	df = pd.DataFrame({
+		"customer_id" : np.array([1090, 3565], dtype = np.int64),
+		"amount"      : [2426.5, np.nan],
+		"ratio"       : np.array([0.5, np.inf], dtype = np.float32),
+		"loan_date"   : pd.to_datetime(["2021-11-15 10:30:00", None]),
+		"term"        : pd.Categorical(["long", None]),
+		"count"       : pd.array([3, None], dtype = "Int64"),
+		"paid"        : [np.bool_(True), np.bool_(False)],
+	}).set_index("customer_id")
+
+	content = dataframe_to_json(df)
+	assert isinstance(content, bytes) and b" " not in content.replace(b"2426.5", b"")
+
+	assert json.loads(content) == [
+		{"amount" : 2426.5, "ratio" : 0.5, "loan_date" : "2021-11-15T10:30:00", "term" : "long", "count" : 3, "paid" : True},
+		{"amount" : None, "ratio" : None, "loan_date" : None, "term" : None, "count" : None, "paid" : False},
+	]
+	assert [row["customer_id"] for row in json.loads(dataframe_to_json(df, index = True))] == [1090, 3565]
+	assert dataframe_to_json(df.iloc[:0]) == b"[]"
+
+
+def test_streamed_rows() :
+	batches = [[{"id" : 1, "value" : float("nan")}, {"id" : 2, "value" : 1.5}], [], [{"id" : 3, "value" : None}]]
+
+	assert json.loads(b"".join(stream_json_array(iter(batches)))) == [{"id" : 1, "value" : None}, {"id" : 2, "value" : 1.5}, {"id" : 3, "value" : None}]
+	assert b"".join(stream_json_array(iter([]))) == b"[]"
+	assert [json.loads(line) for line in b"".join(stream_ndjson(iter(batches))).splitlines()] == json.loads(b"".join(stream_json_array(iter(batches))))
+
+
+def test_negotiate() :
+	formats = ["json", "ndjson", "csv"]
+
+	assert negotiate(None, formats) == "json"
+	assert negotiate("*/*", formats) == "json"
+	assert negotiate("text/*", formats) == "csv"
+	assert negotiate("application/x-ndjson;q=0.5, text/csv", formats) == "csv"
+	assert negotiate("text/csv;q=0, application/jsonl", formats) == "ndjson"
+
+	with pytest.raises(HTTPException) as e :
+		negotiate("text/csv", ["json"])
+	assert e.value.status_code == 406
+
+
+def test_etag_matches() :
+	etag = entity_tag((3, 1700000000.0), "/api/v1/loans", [("limit", "2")], "json", "gzip")
+
+	assert etag.startswith('"') and etag == entity_tag((3, 1700000000.0), "/api/v1/loans", [("limit", "2")], "json", "gzip")
+	assert etag != entity_tag((4, 1700000000.0), "/api/v1/loans", [("limit", "2")], "json", "gzip")
+
+	assert etag_matches(etag, etag) and etag_matches('"other", W/' + etag, etag) and etag_matches("*", etag)
+	assert not etag_matches(None, etag) and not etag_matches('"other"', etag)
+
+
+def test_dataframe_csv() :
+	df = pd.DataFrame({"amount" : [2426.5, np.nan, 10.0]}, index = pd.Index([1090, 3565, 42], name = "customer_id"))
+
+	content = b"".join(stream_dataframe_csv(df, batch_rows = 2))
+	assert pd.read_csv(io.BytesIO(content), index_col = "customer_id").equals(df)
+
+
+def test_dataframe_arrow() :
+	df = pd.DataFrame({"amount" : np.arange(5.0), "term" : list("lslsl")}, index = pd.Index(range(5), name = "customer_id"))
+
+	assert negotiate("application/vnd.apache.arrow.stream", ["json", "arrow"]) == "arrow"
+	assert pa.ipc.open_stream(b"".join(stream_dataframe_arrow(df, "arrow", batch_rows = 2))).read_pandas().equals(df)
+
+	parquet = pq.ParquetFile(io.BytesIO(b"".join(stream_dataframe_arrow(df, "parquet", batch_rows = 2))))
+	assert parquet.num_row_groups == 3 and parquet.read().to_pandas().equals(df)
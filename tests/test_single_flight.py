@@ -0,0 +1,44 @@
+import asyncio
+
+from src.markI         import MkI
+from src.config        import Config
+from src.single_flight import SingleFlight
+
+
+mk1    = MkI.get_instance(_logging = True, _dataset = True)
+config = Config().parser
+
+
+def test_single_flight_coalesces_concurrent_calls() :
+	single_flight = SingleFlight(mk1, config)
+	calls         = []
+
+	async def compute() :
+		calls.append(1)
+		await asyncio.sleep(0.05)
+		return "features"
+
+	async def run() :
+		return await asyncio.gather(*[single_flight.do(("customers", 0), compute) for _ in range(10)])
+
+	results = asyncio.run(run())
+
+	assert results == ["features"] * 10
+	assert len(calls) == 1
+	assert single_flight.stats() == {"in_flight" : 0, "computations" : 1, "deduplicated" : 9}
+
+
+def test_single_flight_shares_exceptions() :
+	single_flight = SingleFlight(mk1, config)
+
+	async def compute() :
+		await asyncio.sleep(0.01)
+		raise ValueError("dfs failed")
+
+	async def run() :
+		return await asyncio.gather(*[single_flight.do("loans", compute) for _ in range(3)], return_exceptions = True)
+
+	results = asyncio.run(run())
+
+	assert all(isinstance(result, ValueError) for result in results)
+	assert single_flight.stats()["computations"] == 1